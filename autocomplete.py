@@ -0,0 +1,167 @@
+# ✅ 输入即搜索：本地商品名自动补全
+#
+# 建议完全来自内存索引，不请求网站：本地商品库的快照，加上所有已经抓取过的搜索结果和商品详情。
+# 两级匹配：
+# - 词前缀：关键词中的每个词都是商品名中某个词的前缀（"shin ram" → "Shin Ramyun ..."），
+#   词表有序保存，前缀查找用二分；
+# - 字符三元组：前缀匹配不够时补充拼写相近的商品名（"kimchy" → "Kimchi ..."）。
+# 结果按出现次数（搜索结果中每出现一次加一，打开详情加 DETAIL_WEIGHT）、名称长度排序。
+import bisect
+import heapq
+import re
+import threading
+
+import catalog
+import metrics
+
+SUGGEST_LIMIT = 8           # 每次返回的建议数
+MIN_GRAM_SCORE = 0.5        # 关键词的三元组有一半以上出现在商品名中才作为拼写相近的建议
+DETAIL_WEIGHT = 3           # 打开过详情的商品排得更靠前
+UNKNOWN_NAME = "未知产品"    # 解析器在页面缺少商品名时使用的占位名称
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def words(text):
+    return _WORD_RE.findall(text.lower())
+
+
+def trigrams(text):
+    padded = f"  {' '.join(words(text))} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AutocompleteIndex:
+    def __init__(self, names=()):
+        self._names = []            # 商品名（按第一次出现时的写法）
+        self._weights = []
+        self._ids = {}              # 小写商品名 -> 下标
+        self._words = []            # 有序的不重复词表
+        self._word_postings = {}    # 词 -> {下标}
+        self._gram_postings = {}    # 三元组 -> {下标}
+        self._lock = threading.Lock()
+        for name in names:
+            self.add(name, 0)
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name, weight=1):
+        """加入商品名（已存在时只增加权重）"""
+        name = " ".join((name or "").split())
+        if not name or name == UNKNOWN_NAME:
+            return
+        key = name.lower()
+        with self._lock:
+            idx = self._ids.get(key)
+            if idx is not None:
+                self._weights[idx] += weight
+                return
+            idx = self._ids[key] = len(self._names)
+            self._names.append(name)
+            self._weights.append(weight)
+            for word in set(words(name)):
+                postings = self._word_postings.get(word)
+                if postings is None:
+                    postings = self._word_postings[word] = set()
+                    bisect.insort(self._words, word)
+                postings.add(idx)
+            grams = trigrams(name)
+            for gram in grams:
+                self._gram_postings.setdefault(gram, set()).add(idx)
+
+    def add_many(self, names, weight=1):
+        for name in names:
+            self.add(name, weight)
+
+    def _prefix_ids(self, prefix):
+        ids = set()
+        for i in range(bisect.bisect_left(self._words, prefix), len(self._words)):
+            word = self._words[i]
+            if not word.startswith(prefix):
+                break
+            ids |= self._word_postings[word]
+        return ids
+
+    def _rank_key(self, idx):
+        return -self._weights[idx], len(self._names[idx]), self._names[idx]
+
+    @metrics.timed("autocomplete")
+    def suggest(self, query, limit=SUGGEST_LIMIT):
+        """返回最多 limit 个商品名建议，按相关度降序"""
+        query_words = words(query)
+        if not query_words or limit <= 0:
+            return []
+        with self._lock:
+            # 从最长（通常最有区分度）的词开始求交集
+            matched = None
+            for word in sorted(query_words, key=len, reverse=True):
+                ids = self._prefix_ids(word)
+                matched = ids if matched is None else matched & ids
+                if not matched:
+                    break
+            best = heapq.nsmallest(limit, matched or (), key=self._rank_key)
+            if len(best) < limit:
+                best += self._similar(query, limit - len(best), set(best))
+            return [self._names[idx] for idx in best]
+
+    def _similar(self, query, limit, exclude):
+        """按关键词三元组在商品名中出现的比例补充拼写相近的商品名（调用方已持有锁）"""
+        query_grams = trigrams(query)
+        shared = {}
+        for gram in query_grams:
+            for idx in self._gram_postings.get(gram, ()):
+                shared[idx] = shared.get(idx, 0) + 1
+        scored = []
+        for idx, count in shared.items():
+            if idx in exclude:
+                continue
+            # 商品名通常比关键词长得多，用包含比例而不是 Jaccard，否则短关键词几乎匹配不到
+            score = count / len(query_grams)
+            if score >= MIN_GRAM_SCORE:
+                scored.append((score, idx))
+        best = heapq.nsmallest(limit, scored, key=lambda pair: (-pair[0],) + self._rank_key(pair[1]))
+        return [idx for _, idx in best]
+
+
+_index = None
+_catalog_versions = {}     # site -> 已载入的商品库版本
+_lock = threading.Lock()
+
+
+def _shared_index():
+    global _index
+    with _lock:
+        if _index is None:
+            _index = AutocompleteIndex()
+        return _index
+
+
+def get_index():
+    """返回进程内共享的补全索引，并载入本地商品库的新版本"""
+    index = _shared_index()
+    with _lock:
+        store = catalog.get_store()
+        for site in catalog.SITES:
+            version = store.version(site)
+            if _catalog_versions.get(site) != version:
+                # 下架的商品名保留在索引中，仍然是有效的搜索词
+                for code, name, price, url, image_url in store.products(site):
+                    index.add(name, 0)
+                _catalog_versions[site] = version
+        return index
+
+
+# 在连接池事件循环中调用，不在这里载入商品库
+def remember_results(results):
+    """记录搜索结果中的商品名"""
+    _shared_index().add_many(product.get("name") for product in results)
+
+
+def remember_detail(details):
+    if details:
+        _shared_index().add(details.get("name"), DETAIL_WEIGHT)
+
+
+def suggest(query, limit=SUGGEST_LIMIT):
+    return get_index().suggest(query, limit)
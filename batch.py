@@ -0,0 +1,261 @@
+# ✅ 无界面批量搜索
+#
+# 夜间对成千上万个关键词做品类和价格对比：从文件或标准输入读取关键词，按全局和每个网站的并发上限
+# 搜索（与页面使用同一套 scraper 函数），每完成一个关键词就追加写入 JSONL / CSV。
+# 中断后用同样的命令重新运行即可续跑：输出文件中所有网站都成功的关键词不会重新抓取，
+# 失败的关键词会重试并追加新记录（同一关键词以最后一条记录为准）。
+#
+#     python batch.py keywords.txt -o results.jsonl [--details --top 5] [--concurrency 8 --site-concurrency 4]
+#     cat keywords.txt | python batch.py - -o results.csv
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+import time
+
+from scraper import async_get_detail, async_search, async_search_more
+from sites import SITES
+
+BATCH_CONCURRENCY = 8       # 同时处理的关键词数
+SITE_CONCURRENCY = 4        # 每个网站同时进行的请求（搜索 / 详情）数
+SEARCH_TIMEOUT = 30         # 单个网站单个关键词的超时（秒）
+DETAIL_TOP = 5              # --details 时每个网站抓取详情的结果数
+
+CSV_FIELDS = ["keyword", "site", "status", "error", "rank", "name", "price", "url", "similarity", "image_url", "detail"]
+
+
+def read_keywords(path):
+    """读取关键词：每行一个（.csv 取第一列），'-' 表示标准输入；忽略空行、# 注释和重复项"""
+    if path == "-":
+        text = sys.stdin.read()
+    else:
+        with open(path, encoding="utf-8-sig") as f:
+            text = f.read()
+
+    if path.endswith(".csv"):
+        lines = [row[0] if row else "" for row in csv.reader(io.StringIO(text))]
+        if lines and lines[0].strip().lower() == "keyword":
+            lines = lines[1:]
+    else:
+        lines = text.splitlines()
+
+    keywords = []
+    seen = set()
+    for line in lines:
+        keyword = line.strip()
+        if keyword and not keyword.startswith("#") and keyword not in seen:
+            seen.add(keyword)
+            keywords.append(keyword)
+    return keywords
+
+
+async def search_keyword(keyword, sites=SITES, site_semaphores=None, details_top=0,
+                         timeout=SEARCH_TIMEOUT, all_pages=False):
+    """搜索一个关键词，返回 {"keyword", "sites": {site: {"status", "error", "results"}}, "finished_at"}"""
+    site_semaphores = site_semaphores or {site: asyncio.Semaphore(SITE_CONCURRENCY) for site in sites}
+
+    async def fetch_details(site, results):
+        async def fetch_one(product):
+            async with site_semaphores[site]:
+                try:
+                    product["detail"] = await asyncio.wait_for(async_get_detail(site, product["url"]), timeout)
+                except Exception as e:
+                    print(f"获取 {site} 详情失败（{keyword}）: {e}", file=sys.stderr)
+                    product["detail"] = {}
+
+        await asyncio.gather(*(fetch_one(product) for product in results[:details_top]))
+
+    async def search_site(site):
+        try:
+            async with site_semaphores[site]:
+                results = await asyncio.wait_for(async_search(site, keyword), timeout)
+            if all_pages:
+                results = await asyncio.wait_for(async_search_more(site, keyword, results), timeout)
+            if details_top:
+                await fetch_details(site, results)
+            return {"status": "ok", "error": None, "results": results}
+        except asyncio.TimeoutError:
+            return {"status": "timeout", "error": f"超过 {timeout} 秒未完成", "results": []}
+        except Exception as e:
+            return {"status": "error", "error": str(e), "results": []}
+
+    outcomes = await asyncio.gather(*(search_site(site) for site in sites))
+    return {"keyword": keyword, "sites": dict(zip(sites, outcomes)), "finished_at": time.time()}
+
+
+async def iter_batch(keywords, sites=SITES, concurrency=BATCH_CONCURRENCY, site_concurrency=SITE_CONCURRENCY,
+                     details_top=0, timeout=SEARCH_TIMEOUT, all_pages=False):
+    """并发搜索所有关键词，按完成顺序逐个产出记录（异步生成器，可在其他程序中直接使用）"""
+    semaphore = asyncio.Semaphore(concurrency)
+    site_semaphores = {site: asyncio.Semaphore(site_concurrency) for site in sites}
+
+    async def run(keyword):
+        async with semaphore:
+            return await search_keyword(keyword, sites, site_semaphores, details_top, timeout, all_pages)
+
+    tasks = [asyncio.ensure_future(run(keyword)) for keyword in keywords]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def is_complete(record):
+    return all(outcome["status"] == "ok" for outcome in record["sites"].values())
+
+
+class JsonlWriter:
+    """每个关键词一行 JSON"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def finished_keywords(self, sites):
+        finished = set()
+        for line in _read_lines(self.path):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if set(sites) <= set(record.get("sites", {})) and is_complete(record):
+                finished.add(record["keyword"])
+        return finished
+
+    def open(self):
+        self._file = _open_for_append(self.path)
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class CsvWriter:
+    """每个商品一行；没有结果或失败时每个网站写一行状态"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def finished_keywords(self, sites):
+        # 同一关键词和网站以最后写入的状态为准
+        latest = {}
+        for row in csv.DictReader(_read_lines(self.path)):
+            if row.get("keyword") and row.get("site"):
+                latest[(row["keyword"], row["site"])] = row.get("status")
+        keywords = {keyword for keyword, _ in latest}
+        return {keyword for keyword in keywords if all(latest.get((keyword, site)) == "ok" for site in sites)}
+
+    def open(self):
+        is_new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._file = _open_for_append(self.path)
+        self._writer = csv.DictWriter(self._file, fieldnames=CSV_FIELDS)
+        if is_new:
+            self._writer.writeheader()
+
+    def write(self, record):
+        rows = []
+        for site, outcome in record["sites"].items():
+            base = {"keyword": record["keyword"], "site": site, "status": outcome["status"], "error": outcome["error"]}
+            if not outcome["results"]:
+                rows.append(base)
+            for rank, product in enumerate(outcome["results"], 1):
+                rows.append({
+                    **base,
+                    "rank": rank,
+                    "name": product.get("name"),
+                    "price": product.get("price"),
+                    "url": product.get("url"),
+                    "similarity": product.get("similarity"),
+                    "image_url": product.get("image_url"),
+                    "detail": json.dumps(product["detail"], ensure_ascii=False) if "detail" in product else "",
+                })
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def _read_lines(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8", newline="") as f:
+        return f.read().splitlines(keepends=True)
+
+
+def _open_for_append(path):
+    """追加打开；上次中断时写了一半的最后一行先截掉"""
+    if os.path.exists(path):
+        with open(path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+    return open(path, "a", encoding="utf-8", newline="")
+
+
+def make_writer(path, output_format=None):
+    output_format = output_format or ("csv" if path.endswith(".csv") else "jsonl")
+    return CsvWriter(path) if output_format == "csv" else JsonlWriter(path)
+
+
+async def run_batch(keywords, writer, sites=SITES, resume=True, **options):
+    """跳过输出中已完成的关键词，其余的边完成边写入，返回 (完成数, 失败数, 跳过数)"""
+    skipped = writer.finished_keywords(sites) if resume else set()
+    pending = [keyword for keyword in keywords if keyword not in skipped]
+    done = failed = 0
+    writer.open()
+    try:
+        async for record in iter_batch(pending, sites, **options):
+            writer.write(record)
+            if is_complete(record):
+                done += 1
+            else:
+                failed += 1
+            print(f"[{done + failed}/{len(pending)}] {record['keyword']}: " + ", ".join(
+                f"{site} {outcome['status']} ({len(outcome['results'])})" for site, outcome in record["sites"].items()
+            ), file=sys.stderr)
+    finally:
+        writer.close()
+    return done, failed, len(keywords) - len(pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="无界面批量搜索")
+    parser.add_argument("keywords", help="关键词文件（每行一个，或 .csv 第一列），- 表示标准输入")
+    parser.add_argument("-o", "--output", required=True, help="输出文件（.jsonl 或 .csv），已存在时续跑")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="输出格式，默认按扩展名判断")
+    parser.add_argument("--site", choices=SITES, action="append", help="只搜索指定网站（可重复）")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="同时处理的关键词数")
+    parser.add_argument("--site-concurrency", type=int, default=SITE_CONCURRENCY, help="每个网站的并发请求数")
+    parser.add_argument("--timeout", type=float, default=SEARCH_TIMEOUT, help="单个网站单个关键词的超时（秒）")
+    parser.add_argument("--details", action="store_true", help="同时抓取前 --top 个结果的详情")
+    parser.add_argument("--top", type=int, default=DETAIL_TOP)
+    parser.add_argument("--all-pages", action="store_true", help="分页的网站（如 AsianFoodLovers）抓取全部结果页")
+    parser.add_argument("--no-resume", action="store_true", help="不跳过输出中已完成的关键词")
+    args = parser.parse_args()
+
+    keywords = read_keywords(args.keywords)
+    writer = make_writer(args.output, args.format)
+    done, failed, skipped = asyncio.run(run_batch(
+        keywords, writer,
+        sites=tuple(args.site or SITES),
+        resume=not args.no_resume,
+        concurrency=args.concurrency,
+        site_concurrency=args.site_concurrency,
+        details_top=args.top if args.details else 0,
+        timeout=args.timeout,
+        all_pages=args.all_pages,
+    ))
+    print(f"完成 {done} 个，失败 {failed} 个，跳过已完成的 {skipped} 个", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
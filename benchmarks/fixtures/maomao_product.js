@@ -0,0 +1 @@
+{"id": 7000000099, "title": "Shin Ramyun Nudelsuppe 120g", "handle": "shin-ramyun-nudelsuppe-120g", "description": "<p>Die <strong>beliebte</strong> Instant-Nudelsuppe aus Korea &amp; mit scharfer Brühe.</p>\n<p>   </p>\n<p>Perfekt für einen schnellen Snack.<br>Einfach zubereiten.</p>\n<p><strong>Aufbewahrungs- und Verwendungshinweise</strong></p>\n<p>Kühl und trocken lagern. Nach dem Öffnen rasch verbrauchen.</p>\n<p>Nettogewicht: 120 Gramm</p>\n<!-- kommentar Kühl und trocken lagern -->", "published_at": "2024-03-01T10:00:00+01:00", "created_at": "2024-03-01T10:00:00+01:00", "vendor": "Nongshim", "type": "Nudeln", "tags": ["Korea", "Nudeln"], "price": 149, "price_min": 149, "price_max": 149, "available": true, "price_varies": false, "compare_at_price": null, "compare_at_price_min": 0, "compare_at_price_max": 0, "compare_at_price_varies": false, "variants": [{"id": 41000000099, "title": "Default Title", "option1": "Default Title", "option2": null, "option3": null, "sku": "MM00099", "requires_shipping": true, "taxable": true, "featured_image": null, "available": true, "name": "Shin Ramyun Nudelsuppe 120g", "public_title": null, "options": ["Default Title"], "price": 149, "weight": 120, "compare_at_price": null, "inventory_management": "shopify", "barcode": "8801043014830"}], "images": ["//mao-mao.de/cdn/shop/files/main_1200x.jpg"], "featured_image": "//mao-mao.de/cdn/shop/files/main_1200x.jpg", "options": ["Title"], "url": "/products/shin-ramyun-nudelsuppe-120g"}
\ No newline at end of file
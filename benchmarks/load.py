@@ -0,0 +1,338 @@
+# ✅ 负载测试：模拟多个并发页面会话
+#
+# 在进程内模拟 N 个用户会话，每个会话按思考时间分布循环执行页面上的操作：搜索两个网站 → 预取当前页图片和详情
+# → 打开几个商品详情 → 偶尔加载 AsianFoodLovers 的全部结果页。使用与页面相同的 scraper 函数、共享的详情预取器、
+# 请求合并、响应缓存、解析缓存和图片缓存，请求全部发往本地替身服务器（server.py），图片地址改写到替身服务器。
+# 可以按多个并发数分阶段运行（每个阶段在独立的子进程中从冷缓存开始），找出超时和错误开始增多的并发数：
+#     python benchmarks/load.py --users 10,50,100 --duration 60 --latency 0.1 --output load.json
+#
+# 每个阶段报告：
+# - 吞吐量：每秒完成的操作数（总计和按操作）
+# - 尾延迟：每种操作的 p50/p95/p99，以及超时和错误数
+# - 上游请求放大：替身服务器收到的请求数 / 用户操作数（请求合并、缓存和预取的综合效果）
+# - 每个会话的内存：会话状态（搜索结果和详情，相当于 st.session_state）的平均大小，
+#   以及进程 RSS 峰值增长 / 用户数（解析进程不计入）
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+from run import _git_commit, latency_summary, start_server
+
+PER_PAGE = 5                # 与页面每页显示的商品数相同
+
+
+class LoadStats:
+    def __init__(self):
+        self.samples = defaultdict(list)    # 操作 -> 成功操作的耗时（秒）
+        self.errors = Counter()             # (操作, 错误类型) -> 次数
+        self.actions = 0
+
+    async def timed(self, operation, coro, timeout):
+        """执行一次用户操作并记录耗时；超时和错误只计数，返回 None"""
+        self.actions += 1
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(coro, timeout)
+        except asyncio.TimeoutError:
+            self.errors[(operation, "timeout")] += 1
+            return None
+        except Exception as e:
+            self.errors[(operation, type(e).__name__)] += 1
+            return None
+        self.samples[operation].append(time.perf_counter() - start)
+        return result
+
+
+def think_time(rng, mean, distribution):
+    if mean <= 0:
+        return 0.0
+    if distribution == "exp":
+        return rng.expovariate(1 / mean)
+    if distribution == "uniform":
+        return rng.uniform(0, 2 * mean)
+    return mean
+
+
+def zipf_weights(n, s):
+    """热门关键词被搜索得更多：第 i 个关键词的权重为 1 / i^s"""
+    return [1 / (i + 1) ** s for i in range(n)]
+
+
+def rss_bytes():
+    """当前进程的常驻内存（bytes）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # 非 Linux 时退回峰值 RSS（macOS 单位为 bytes，其他为 KB）
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def upstream_requests(base_url):
+    with urlopen(f"{base_url}/_stats", timeout=10) as response:
+        return json.load(response)
+
+
+async def user_session(user_id, args, keywords, weights, stats, prefetcher, stop_at, base_url):
+    """一个用户会话：重复 搜索 → 看图 → 打开详情，直到测试结束；返回会话状态的大小（bytes）"""
+    import images
+    from scraper import async_search, async_search_more
+    from sites import ADAPTERS, SITES
+
+    rng = random.Random(args.seed * 100003 + user_id)
+    state = {"results": {}, "details": {}}
+
+    async def think():
+        await asyncio.sleep(think_time(rng, args.think, args.think_dist))
+
+    def local_image(url):
+        # 录制页面中的图片地址指向真实网站，改写到替身服务器
+        return f"{base_url}{urlsplit(url).path}" if url else None
+
+    await asyncio.sleep(rng.uniform(0, args.ramp_up))
+    while time.monotonic() < stop_at:
+        keyword = rng.choices(keywords, weights)[0]
+        found = await asyncio.gather(*(
+            stats.timed(f"search.{site}", async_search(site, keyword), args.timeout) for site in SITES
+        ))
+        state["results"] = dict(zip(SITES, (results or [] for results in found)))
+
+        # 页面显示结果后：后台预取当前页和下一页的详情，等待当前页图片
+        for site, results in state["results"].items():
+            prefetcher.prefetch(site, [product["url"] for product in results[:2 * PER_PAGE]])
+        image_urls = [
+            local_image(product.get("image_url"))
+            for results in state["results"].values() for product in results[:PER_PAGE]
+        ]
+        if args.images and any(image_urls):
+            await stats.timed("images", images.prefetch(image_urls), args.timeout)
+
+        if rng.random() < args.all_pages:
+            for site in SITES:
+                if ADAPTERS[site].max_pages > 1 and state["results"][site]:
+                    more = await stats.timed(
+                        f"search_all.{site}", async_search_more(site, keyword, state["results"][site]), args.timeout
+                    )
+                    state["results"][site] = more or state["results"][site]
+
+        for _ in range(rng.randint(0, args.details)):
+            if time.monotonic() >= stop_at:
+                break
+            await think()
+            sites = [site for site in SITES if state["results"][site]]
+            if not sites:
+                break
+            site = rng.choice(sites)
+            product = rng.choice(state["results"][site][:PER_PAGE])
+            details = await stats.timed(f"detail.{site}", prefetcher.get(site, product["url"]), args.timeout)
+            if details:
+                state["details"][product["url"]] = details
+        await think()
+    return len(pickle.dumps(state))
+
+
+async def run_users(args, base_url):
+    import http_client
+    from parsers import parse_mao_mao_results
+    from prefetch import DetailPrefetcher
+    from scraper import async_get_detail
+    from server import load_fixture
+    from sites import host_policies
+
+    # 只覆盖客户端的限流，并发预算、对冲等其余策略与生产环境的站点策略相同
+    rate, burst = (args.rate, 2 * args.rate) if args.rate else (1e6, 1e6)
+    for host, policy in host_policies().items():
+        http_client.HOST_POLICIES[host] = {**policy, "rate": rate, "burst": burst}
+
+    if args.keywords:
+        from batch import read_keywords
+        keywords = read_keywords(args.keywords)
+    else:
+        # 用录制的商品名组成关键词：完整名称和前两个词
+        names = [product["name"] for product in parse_mao_mao_results(load_fixture("maomao_search"), "")]
+        keywords = list(dict.fromkeys(names + [" ".join(name.split()[:2]) for name in names]))
+    weights = zipf_weights(len(keywords), args.zipf)
+
+    # 与页面相同：所有会话共用一个详情预取器
+    prefetcher = DetailPrefetcher(async_get_detail)
+    stats = LoadStats()
+
+    peak_rss = rss_bytes()
+    start_rss = peak_rss
+    stop_at = time.monotonic() + args.ramp_up + args.duration
+
+    async def sample_memory():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, rss_bytes())
+            await asyncio.sleep(0.5)
+
+    sampler = asyncio.ensure_future(sample_memory())
+    before = upstream_requests(base_url)
+    started = time.perf_counter()
+    try:
+        state_sizes = await asyncio.gather(*(
+            user_session(user_id, args, keywords, weights, stats, prefetcher, stop_at, base_url)
+            for user_id in range(args.users)
+        ))
+    finally:
+        sampler.cancel()
+    elapsed = time.perf_counter() - started
+    after = upstream_requests(base_url)
+    by_route = {route: count - before.get(route, 0) for route, count in after.items() if count > before.get(route, 0)}
+    upstream = sum(by_route.values())
+    completed = sum(len(samples) for samples in stats.samples.values())
+
+    return {
+        "users": args.users,
+        "elapsed": round(elapsed, 2),
+        "actions": stats.actions,
+        "throughput": {
+            "total": round(completed / elapsed, 2),
+            **{operation: round(len(samples) / elapsed, 2) for operation, samples in sorted(stats.samples.items())},
+        },
+        "latency": {
+            operation: latency_summary(samples) for operation, samples in sorted(stats.samples.items()) if samples
+        },
+        "errors": {f"{operation}:{kind}": count for (operation, kind), count in sorted(stats.errors.items())},
+        "upstream": {
+            "requests": upstream,
+            "per_action": round(upstream / stats.actions, 3) if stats.actions else None,
+            "by_route": by_route,
+        },
+        "memory": {
+            "rss_start": start_rss,
+            "rss_peak": peak_rss,
+            "rss_per_user": round((peak_rss - start_rss) / args.users),
+            "session_state_bytes": round(sum(state_sizes) / len(state_sizes)) if state_sizes else 0,
+        },
+    }
+
+
+def loopback_alias(base_url):
+    """同一个替身服务器换一个主机名：两个网站的主机不同，各自的并发预算和熔断器互不影响"""
+    parts = urlsplit(base_url)
+    alias = {"127.0.0.1": "localhost", "localhost": "127.0.0.1"}.get(parts.hostname)
+    if alias is None:
+        return base_url
+    return parts._replace(netloc=f"{alias}:{parts.port}" if parts.port else alias).geturl()
+
+
+def run_stage(args, base_url):
+    """在当前进程中运行一个阶段（独立的缓存目录）"""
+    workdir = tempfile.mkdtemp(prefix="scraper-load-")
+    os.environ["SCRAPER_CACHE_PATH"] = os.path.join(workdir, "responses.sqlite3")
+    os.environ["SCRAPER_CATALOG_PATH"] = os.path.join(workdir, "catalog.sqlite3")
+    os.environ["SCRAPER_IMAGE_CACHE_DIR"] = os.path.join(workdir, "images")
+    # 站点地址在导入 endpoints 时读取，必须在导入项目模块之前设置
+    os.environ["SCRAPER_MAOMAO_BASE_URL"] = base_url
+    os.environ["SCRAPER_AFL_API_BASE_URL"] = f"{loopback_alias(base_url)}/occ/v2"
+
+    import http_client
+    try:
+        return asyncio.run(run_users(args, base_url))
+    finally:
+        http_client.close()
+
+
+def print_stage(stage):
+    print(f"\n👥 {stage['users']} 个用户，{stage['elapsed']} 秒，{stage['actions']} 次操作，"
+          f"{stage['throughput']['total']} 次/秒", file=sys.stderr)
+    print(f"{'操作':<24}{'次/秒':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}", file=sys.stderr)
+    for operation, summary in stage["latency"].items():
+        print(f"{operation:<24}{stage['throughput'][operation]:>10}{summary['p50']:>10}"
+              f"{summary['p95']:>10}{summary['p99']:>10}", file=sys.stderr)
+    if stage["errors"]:
+        print("错误: " + ", ".join(f"{name} {count}" for name, count in stage["errors"].items()), file=sys.stderr)
+    upstream, memory = stage["upstream"], stage["memory"]
+    print(f"上游请求 {upstream['requests']} 次（每次操作 {upstream['per_action']}），"
+          f"每个会话状态 {memory['session_state_bytes'] / 1024:.1f} KB，"
+          f"RSS 增长 / 用户 {memory['rss_per_user'] / 1024 / 1024:.2f} MB", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="模拟多个并发会话的负载测试")
+    parser.add_argument("--users", default="10", help="并发用户数，逗号分隔时依次运行多个阶段（如 10,50,100）")
+    parser.add_argument("--duration", type=float, default=30, help="每个阶段的持续时间（秒，不含启动时间）")
+    parser.add_argument("--ramp-up", type=float, default=5, help="用户在这段时间内陆续开始（秒）")
+    parser.add_argument("--think", type=float, default=2.0, help="两次操作之间的平均思考时间（秒）")
+    parser.add_argument("--think-dist", choices=["exp", "uniform", "fixed"], default="exp", help="思考时间分布")
+    parser.add_argument("--details", type=int, default=3, help="每次搜索后最多打开的详情数")
+    parser.add_argument("--all-pages", type=float, default=0.2, help="分页的网站（如 AsianFoodLovers）加载全部结果页的概率")
+    parser.add_argument("--no-images", dest="images", action="store_false", help="不下载图片")
+    parser.add_argument("--keywords", help="关键词文件（格式同 batch.py），默认使用录制页面中的商品名")
+    parser.add_argument("--zipf", type=float, default=1.1, help="关键词热度分布的 Zipf 指数，0 表示均匀")
+    parser.add_argument("--timeout", type=float, default=10, help="单次操作的超时（秒），与页面的搜索截止时间相同")
+    parser.add_argument("--rate", type=float, default=0, help="客户端对每个网站的限流（每秒请求数，覆盖站点策略的 rate），0 表示不限流")
+    parser.add_argument("--latency", type=float, default=0.1, help="替身服务器的平均响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.05, help="替身服务器的延迟波动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="替身服务器返回 503 的比例")
+    parser.add_argument("--base-url", help="使用已经在运行的替身服务器，不再自动启动")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    args = parser.parse_args()
+    stages = [int(users) for users in args.users.split(",")]
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server, base_url = start_server(args.latency, args.jitter, args.error_rate)
+
+    try:
+        if len(stages) == 1:
+            args.users = stages[0]
+            results = [run_stage(args, base_url)]
+            print_stage(results[0])
+        else:
+            # 每个阶段在独立的子进程中运行：缓存从冷开始，RSS 互不影响
+            results = []
+            for users in stages:
+                argv = [arg for i, arg in enumerate(sys.argv) if not _is_output_arg(sys.argv, i)]
+                command = [sys.executable, os.path.abspath(__file__), *argv[1:], "--users", str(users),
+                           "--base-url", base_url]
+                output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+                results.append(json.loads(output)["stages"][0])
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "config": {
+                key: value for key, value in vars(args).items() if key not in ("users", "output", "base_url")
+            },
+        },
+        "stages": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    else:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+def _is_output_arg(argv, i):
+    # 子进程把结果输出到 stdout，由父进程汇总写入文件
+    return argv[i] == "--output" or argv[i].startswith("--output=") or (i > 0 and argv[i - 1] == "--output")
+
+
+if __name__ == "__main__":
+    main()
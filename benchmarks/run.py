@@ -0,0 +1,344 @@
+# ✅ 离线基准测试
+#
+# 不访问网络：解析基准直接读取 fixtures/，端到端基准启动本地替身服务器（server.py）并把
+# 站点地址指向它。结果写成 JSON，可以和其他提交的结果对比：
+#     python benchmarks/run.py --output bench.json
+#     python benchmarks/run.py --compare bench.json      # 退化超过 --threshold 时退出码为 1
+#
+# 指标：
+# - parse.*       解析吞吐量（pages/s），每个可用的 HTML 解析后端各一项
+# - similarity.*  相似度打分吞吐量（ops/s）
+# - autocomplete.* 自动补全每次按键的查询吞吐量（ops/s），前缀匹配和拼写相近的补充匹配各一项
+# - e2e.*         搜索 / 详情的端到端延迟（ms，p50/p95/p99）：请求 → 响应缓存未命中 → 解析
+# - fetch.cached  响应缓存命中时 fetch_response 的延迟（ms）
+# - payload.*     各种响应的大小（bytes）：MaoMao 完整页面与 Shopify JSON 接口的对比
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from server import load_fixture  # noqa: E402
+
+# 吞吐量越高越好，延迟越低越好
+HIGHER_IS_BETTER = {"pages/s", "ops/s"}
+
+PAYLOAD_FIXTURES = ("maomao_search", "maomao_suggest", "maomao_detail", "maomao_product", "afl_search", "afl_detail")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(latency, jitter, error_rate):
+    """在子进程中启动替身服务器（避免与被测代码争用 GIL），返回 (进程, 基础地址)"""
+    port = _free_port()
+    process = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "server.py"), "--port", str(port),
+        "--latency", str(latency), "--jitter", str(jitter), "--error-rate", str(error_rate), "--seed", "0",
+    ])
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("替身服务器启动失败")
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def throughput(func, min_time, unit="pages/s"):
+    """重复调用 func 至少 min_time 秒，返回每秒次数"""
+    func()  # 预热
+    count = 0
+    start = time.perf_counter()
+    while True:
+        func()
+        count += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return {"unit": unit, "value": round(count / elapsed, 2), "n": count}
+
+
+def latency_summary(samples):
+    samples_ms = [s * 1000 for s in samples]
+    q = statistics.quantiles(samples_ms, n=100, method="inclusive")
+    return {
+        "unit": "ms",
+        "value": round(q[49], 3),
+        "p50": round(q[49], 3),
+        "p95": round(q[94], 3),
+        "p99": round(q[98], 3),
+        "mean": round(statistics.fmean(samples_ms), 3),
+        "n": len(samples_ms),
+    }
+
+
+def bench_parse(min_time):
+    from parsers import (
+        available_backends, parse_mao_mao_results, parse_mao_mao_detail, parse_mao_mao_suggest,
+        parse_mao_mao_product, parse_asian_food_results, parse_asian_food_detail,
+    )
+
+    search_html = load_fixture("maomao_search")
+    detail_html = load_fixture("maomao_detail")
+    suggest_json = load_fixture("maomao_suggest")
+    product_json = load_fixture("maomao_product")
+    afl_search = load_fixture("afl_search")
+    afl_detail = load_fixture("afl_detail")
+
+    results = {}
+    for backend in available_backends():
+        results[f"parse.maomao_search.{backend}"] = throughput(
+            lambda: parse_mao_mao_results(search_html, "tofu natur", backend=backend), min_time
+        )
+        results[f"parse.maomao_detail.{backend}"] = throughput(
+            lambda: parse_mao_mao_detail(detail_html, backend=backend), min_time
+        )
+        # JSON 模式的详情：只有商品 JSON
+        results[f"parse.maomao_product_json.{backend}"] = throughput(
+            lambda: parse_mao_mao_product(product_json, backend=backend), min_time
+        )
+    results["parse.maomao_suggest"] = throughput(lambda: parse_mao_mao_suggest(suggest_json, "tofu natur"), min_time)
+    results["parse.asianfood_search"] = throughput(lambda: parse_asian_food_results(afl_search, "tofu natur"), min_time)
+    results["parse.asianfood_detail"] = throughput(lambda: parse_asian_food_detail(afl_detail), min_time)
+    return results
+
+
+def bench_similarity(min_time, index_size):
+    from parsers import parse_mao_mao_results
+    from autocomplete import AutocompleteIndex
+    from similar import TokenIndex, rank_by_similarity, tokenize
+
+    names = [item["name"] for item in parse_mao_mao_results(load_fixture("maomao_search"), "")]
+
+    def rank():
+        rank_by_similarity("tofu natur 500g", [{"name": name} for name in names])
+
+    def rank_cold():
+        tokenize.cache_clear()
+        rank()
+
+    # 用录制的商品名拼出一个接近真实规模的本地商品库
+    catalog_names = [f"{names[i % len(names)]} {i}" for i in range(index_size)]
+    index = TokenIndex(catalog_names)
+    queries = ["tofu natur", "kimchi 500g", "reis jasmin 1000g", "curry paste", "nori"]
+    counter = iter(range(10 ** 12))
+
+    def top_k():
+        index.top_k(queries[next(counter) % len(queries)], 100)
+
+    # 模拟逐字输入：每个关键词的所有前缀
+    suggest_index = AutocompleteIndex(catalog_names)
+    keystrokes = [query[:i] for query in queries for i in range(1, len(query) + 1)]
+    typos = ["kimchy", "nudelsupe", "jasmine reis", "curri"]
+
+    def suggest():
+        suggest_index.suggest(keystrokes[next(counter) % len(keystrokes)])
+
+    def suggest_typo():
+        suggest_index.suggest(typos[next(counter) % len(typos)])
+
+    return {
+        f"similarity.rank_{len(names)}": throughput(rank, min_time, "ops/s"),
+        f"similarity.rank_{len(names)}_cold": throughput(rank_cold, min_time, "ops/s"),
+        f"similarity.index_top_k_{index_size}": throughput(top_k, min_time, "ops/s"),
+        f"autocomplete.prefix_{index_size}": throughput(suggest, min_time, "ops/s"),
+        f"autocomplete.typo_{index_size}": throughput(suggest_typo, min_time, "ops/s"),
+    }
+
+
+async def _measure(coro_factory, iterations):
+    samples = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        await coro_factory(i)
+        samples.append(time.perf_counter() - start)
+    return latency_summary(samples)
+
+
+def bench_e2e(iterations):
+    import endpoints
+    import http_client
+    from parsers import (
+        parse_mao_mao_results, parse_mao_mao_detail, parse_mao_mao_suggest, parse_mao_mao_product,
+        parse_asian_food_results, parse_asian_food_detail
+    )
+
+    # 替身服务器不需要限流；重试、熔断等策略保持默认
+    http_client.HOST_POLICIES["127.0.0.1"] = {"rate": 1e6, "burst": 1e6}
+    run_id = int(time.time() * 1000)
+
+    # 每次迭代使用不同的参数 / 商品，保证响应缓存未命中
+    async def maomao_search(i):
+        response = await http_client.fetch_response(
+            endpoints.MAOMAO_SEARCH_URL, params={'q': f'tofu {run_id} {i}', 'options[prefix]': 'last'}
+        )
+        parse_mao_mao_results(response.body, "tofu natur")
+
+    async def maomao_detail(i):
+        response = await http_client.fetch_response(f"{endpoints.MAOMAO_BASE_URL}/products/p-{run_id}-{i}")
+        parse_mao_mao_detail(response.body)
+
+    async def maomao_search_json(i):
+        response = await http_client.fetch_response(
+            endpoints.MAOMAO_SUGGEST_URL, params={'q': f'tofu {run_id} {i}', 'resources[type]': 'product'}
+        )
+        parse_mao_mao_suggest(response.body, "tofu natur")
+
+    async def maomao_detail_json(i):
+        response = await http_client.fetch_response(f"{endpoints.MAOMAO_BASE_URL}/products/pj-{run_id}-{i}.js")
+        parse_mao_mao_product(response.body)
+
+    async def asianfood_search(i):
+        response = await http_client.fetch_response(
+            endpoints.AFL_BASE_SEARCH_URL, params={'query': f'tofu {run_id} {i}', 'currentPage': 0}
+        )
+        parse_asian_food_results(response.body, "tofu natur")
+
+    async def asianfood_detail(i):
+        response = await http_client.fetch_response(
+            f"{endpoints.AFL_BASE_DETAIL_URL}{run_id}{i}", params={'lang': 'de_DE', 'curr': 'EUR'}
+        )
+        parse_asian_food_detail(response.body)
+
+    async def cached(i):
+        await http_client.fetch_response(endpoints.MAOMAO_SEARCH_URL, params={'q': f'cached {run_id}'})
+
+    async def run_all():
+        await cached(0)
+        return {
+            "e2e.maomao_search": await _measure(maomao_search, iterations),
+            "e2e.maomao_detail": await _measure(maomao_detail, iterations),
+            "e2e.maomao_search_json": await _measure(maomao_search_json, iterations),
+            "e2e.maomao_detail_json": await _measure(maomao_detail_json, iterations),
+            "e2e.asianfood_search": await _measure(asianfood_search, iterations),
+            "e2e.asianfood_detail": await _measure(asianfood_detail, iterations),
+            "fetch.cached": await _measure(cached, iterations),
+        }
+
+    try:
+        return asyncio.run(run_all())
+    finally:
+        http_client.close()
+
+
+def compare(current, baseline, threshold):
+    """打印与基线的对比，返回退化超过 threshold 的指标名"""
+    regressions = []
+    print(f"{'指标':<40}{'基线':>12}{'当前':>12}{'变化':>10}")
+    for name, result in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if base is None or not base.get("value"):
+            print(f"{name:<40}{'-':>12}{result['value']:>12}")
+            continue
+        change = result["value"] / base["value"] - 1
+        worse = -change if result["unit"] in HIGHER_IS_BETTER else change
+        mark = " ❌" if worse > threshold else ""
+        if mark:
+            regressions.append(name)
+        print(f"{name:<40}{base['value']:>12}{result['value']:>12}{change:>+10.1%}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准测试")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的 JSON 结果对比")
+    parser.add_argument("--threshold", type=float, default=0.2, help="对比时视为退化的相对变化（默认 0.2）")
+    parser.add_argument("--only", choices=["parse", "similarity", "e2e"], action="append", help="只运行指定的基准")
+    parser.add_argument("--min-time", type=float, default=1.0, help="每个吞吐量基准的最短运行时间（秒）")
+    parser.add_argument("--iterations", type=int, default=200, help="每个延迟基准的请求次数")
+    parser.add_argument("--index-size", type=int, default=20000, help="相似度索引基准的商品数")
+    parser.add_argument("--latency", type=float, default=0.02, help="替身服务器的平均响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.01, help="替身服务器的延迟波动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="替身服务器返回 503 的比例")
+    args = parser.parse_args()
+    suites = args.only or ["parse", "similarity", "e2e"]
+
+    # 缓存写到临时目录，不影响（也不受影响于）本地的 .cache
+    workdir = tempfile.mkdtemp(prefix="scraper-bench-")
+    os.environ["SCRAPER_CACHE_PATH"] = os.path.join(workdir, "responses.sqlite3")
+    os.environ["SCRAPER_CATALOG_PATH"] = os.path.join(workdir, "catalog.sqlite3")
+    os.environ["SCRAPER_IMAGE_CACHE_DIR"] = os.path.join(workdir, "images")
+
+    server = None
+    if "e2e" in suites:
+        # 站点地址在导入 endpoints 时读取，必须在导入项目模块之前设置
+        server, base_url = start_server(args.latency, args.jitter, args.error_rate)
+        os.environ["SCRAPER_MAOMAO_BASE_URL"] = base_url
+        os.environ["SCRAPER_AFL_API_BASE_URL"] = f"{base_url}/occ/v2"
+
+    from parsers import PARSER_BACKEND, available_backends
+
+    results = {
+        f"payload.{name}": {"unit": "bytes", "value": len(load_fixture(name).encode("utf-8"))}
+        for name in PAYLOAD_FIXTURES
+    }
+    try:
+        if "parse" in suites:
+            results.update(bench_parse(args.min_time))
+        if "similarity" in suites:
+            results.update(bench_similarity(args.min_time, args.index_size))
+        if "e2e" in suites:
+            results.update(bench_e2e(args.iterations))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "parser_backend": PARSER_BACKEND,
+            "backends": available_backends(),
+            "config": {
+                "min_time": args.min_time, "iterations": args.iterations, "index_size": args.index_size,
+                "latency": args.latency, "jitter": args.jitter, "error_rate": args.error_rate,
+            },
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"⚠️ {len(regressions)} 项指标退化超过 {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+    elif not args.output:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
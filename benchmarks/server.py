@@ -0,0 +1,93 @@
+# ✅ 本地替身商店服务器
+#
+# 回放 fixtures/ 中录制的 MaoMao 页面和 AsianFoodLovers OCC 接口响应，可配置延迟和错误率，
+# 还提供商品图片（所有图片地址返回同一张录制的图片）和按路由统计的请求数（GET /_stats），
+# 用于离线基准测试和负载测试，也可以让应用在没有网络时指向它：
+#     python benchmarks/server.py --port 8765 --latency 0.05 --error-rate 0.02
+#     SCRAPER_MAOMAO_BASE_URL=http://127.0.0.1:8765 \
+#     SCRAPER_AFL_API_BASE_URL=http://127.0.0.1:8765/occ/v2 streamlit run streamlit_app.py
+import argparse
+import asyncio
+import os
+import random
+from collections import Counter
+
+from aiohttp import web
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURES = {
+    "maomao_search": ("maomao_search.html", "text/html"),
+    "maomao_detail": ("maomao_detail.html", "text/html"),
+    "maomao_suggest": ("maomao_suggest.json", "application/json"),
+    "maomao_product": ("maomao_product.js", "application/json"),
+    "afl_search": ("afl_search.json", "application/json"),
+    "afl_detail": ("afl_detail.json", "application/json"),
+}
+IMAGE_FIXTURE = "product.jpg"
+
+
+def load_fixture(name):
+    filename, _ = FIXTURES[name]
+    with open(os.path.join(FIXTURES_DIR, filename), encoding="utf-8") as f:
+        return f.read()
+
+
+def make_app(latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+    """latency: 平均响应延迟（秒）；jitter: 延迟的随机波动（秒）；error_rate: 返回 503 的比例"""
+    rng = random.Random(seed)
+    bodies = {name: load_fixture(name).encode("utf-8") for name in FIXTURES}
+    with open(os.path.join(FIXTURES_DIR, IMAGE_FIXTURE), "rb") as f:
+        image = f.read()
+    requests = Counter()    # 路由名 -> 收到的请求数
+
+    def replay(name, make_response):
+        async def handler(request):
+            requests[name] += 1
+            delay = max(0.0, latency + rng.uniform(-jitter, jitter))
+            if delay:
+                await asyncio.sleep(delay)
+            if error_rate and rng.random() < error_rate:
+                return web.Response(status=503, text="Service Unavailable")
+            return make_response()
+        return handler
+
+    def fixture(name):
+        return replay(
+            name, lambda: web.Response(body=bodies[name], content_type=FIXTURES[name][1], charset="utf-8")
+        )
+
+    async def stats(request):
+        return web.json_response(dict(requests))
+
+    app = web.Application()
+    app.router.add_get("/search", fixture("maomao_search"))
+    app.router.add_get("/search/suggest.json", fixture("maomao_suggest"))
+    # .js 路由必须在商品页之前注册
+    app.router.add_get("/products/{handle}.js", fixture("maomao_product"))
+    app.router.add_get("/products/{handle}", fixture("maomao_detail"))
+    # 搜索路由必须在 {code} 之前注册
+    app.router.add_get("/occ/v2/{site}/products/search", fixture("afl_search"))
+    app.router.add_get("/occ/v2/{site}/products/{code}", fixture("afl_detail"))
+    # MaoMao CDN 和 AsianFoodLovers 的图片路径
+    image_handler = replay("image", lambda: web.Response(body=image, content_type="image/jpeg"))
+    app.router.add_get("/cdn/{path:.*}", image_handler)
+    app.router.add_get("/medias/{path:.*}", image_handler)
+    app.router.add_get("/_stats", stats)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="回放录制页面的本地替身商店服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="平均响应延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟的随机波动（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的比例（0-1）")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    app = make_app(args.latency, args.jitter, args.error_rate, args.seed)
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+# ✅ 本地商品库镜像
+#
+# 把各网站的全量商品列表抓取到本地 SQLite，并按商品编码 + 价格等指纹增量同步。列表接口和每页的提取规则
+# 在站点适配器中声明（sites.py 中的 "catalog"）：
+# - MaoMao 使用 Shopify 的 /products.json 分页列表（总页数未知，抓到空页为止）；
+# - AsianFoodLovers 使用 OCC 的 products/search 分页列表；
+# 搜索和详情优先从本地索引读取（毫秒级，不访问上游），本地没有结果时才实时请求网站。
+#
+# 命令行同步（可放进 cron）：
+#     python catalog.py sync [--details] [--site maomao|asianfood]
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import sites
+from http_client import fetch_response, get_loop
+from parse_pool import run_in_thread
+from resilience import FetchError
+from similar import TokenIndex
+
+CATALOG_PATH = os.environ.get("SCRAPER_CATALOG_PATH", os.path.join(".cache", "catalog.sqlite3"))
+SITES = sites.SITES
+SYNC_CONCURRENCY = 4        # 同步时同时请求的页面 / 详情数
+LOCAL_SEARCH_LIMIT = 100    # 本地搜索返回的最大结果数
+MAX_REMOVED_FRACTION = 0.5  # 一次同步最多删除已有商品的比例，超过时视为抓取异常，不应用
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    site TEXT NOT NULL,
+    code TEXT NOT NULL,
+    name TEXT NOT NULL,
+    price TEXT NOT NULL,
+    url TEXT NOT NULL,
+    image_url TEXT,
+    fingerprint TEXT NOT NULL,
+    detail TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (site, code)
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    site TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    last_sync REAL NOT NULL
+);
+"""
+
+
+def product_code(site, url):
+    return sites.get(site).product_code(url)
+
+
+class CatalogStore:
+    def __init__(self, path=CATALOG_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def version(self, site):
+        row = self._conn().execute("SELECT version FROM sync_state WHERE site = ?", (site,)).fetchone()
+        return row[0] if row else 0
+
+    def stats(self):
+        """返回 {site: (商品数, 最近同步时间)}"""
+        conn = self._conn()
+        counts = dict(conn.execute("SELECT site, COUNT(*) FROM products GROUP BY site"))
+        synced = dict(conn.execute("SELECT site, last_sync FROM sync_state"))
+        return {site: (counts.get(site, 0), synced.get(site)) for site in SITES}
+
+    def products(self, site):
+        return self._conn().execute(
+            "SELECT code, name, price, url, image_url FROM products WHERE site = ? ORDER BY rowid",
+            (site,)
+        ).fetchall()
+
+    def apply_crawl(self, site, products):
+        """用一次完整抓取的结果增量更新商品表，返回 (新增, 变化, 删除) 的编码列表；
+        抓取结果为空或会删除过多已有商品时抛出 ValueError，不修改商品表"""
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            existing = dict(conn.execute("SELECT code, fingerprint FROM products WHERE site = ?", (site,)))
+            removed = [code for code in existing if code not in products]
+            # 网站临时返回空列表或残缺列表时，不能把本地商品当成已下架全部删除
+            if not products:
+                raise ValueError("抓取结果为空")
+            if existing and len(removed) > MAX_REMOVED_FRACTION * len(existing):
+                raise ValueError(f"将删除 {len(removed)} / {len(existing)} 个已有商品，超过 {MAX_REMOVED_FRACTION:.0%}")
+            added, changed = [], []
+            for code, product in products.items():
+                old = existing.get(code)
+                if old == product["fingerprint"]:
+                    continue
+                (added if old is None else changed).append(code)
+                # 商品变化后详情作废，等待重新抓取
+                conn.execute(
+                    "INSERT OR REPLACE INTO products "
+                    "(site, code, name, price, url, image_url, fingerprint, detail, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?)",
+                    (site, code, product["name"], product["price"], product["url"],
+                     product["image_url"], product["fingerprint"], now)
+                )
+            conn.executemany("DELETE FROM products WHERE site = ? AND code = ?", [(site, code) for code in removed])
+            bump = 1 if (added or changed or removed) else 0
+            conn.execute(
+                "INSERT INTO sync_state (site, version, last_sync) VALUES (?, ?, ?) "
+                "ON CONFLICT(site) DO UPDATE SET version = version + ?, last_sync = ?",
+                (site, bump, now, bump, now)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return added, changed, removed
+
+    def codes_without_detail(self, site):
+        return [row[0] for row in self._conn().execute(
+            "SELECT code FROM products WHERE site = ? AND detail IS NULL", (site,)
+        )]
+
+    def get_detail(self, site, code):
+        row = self._conn().execute(
+            "SELECT detail FROM products WHERE site = ? AND code = ?", (site, code)
+        ).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def put_detail(self, site, code, detail):
+        # 只为本地商品库中已有的商品保存详情
+        self._conn().execute(
+            "UPDATE products SET detail = ? WHERE site = ? AND code = ?",
+            (json.dumps(detail, ensure_ascii=False), site, code)
+        )
+
+
+class _SiteIndex:
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = rows
+        self.index = TokenIndex(row[1] for row in rows)
+
+
+_store = None
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_store():
+    """返回进程内共享的 CatalogStore 实例"""
+    global _store
+    with _lock:
+        if _store is None:
+            _store = CatalogStore()
+        return _store
+
+
+def _get_index(site):
+    store = get_store()
+    version = store.version(site)
+    index = _indexes.get(site)
+    if index is None or index.version != version:
+        with _lock:
+            index = _indexes.get(site)
+            if index is None or index.version != version:
+                index = _indexes[site] = _SiteIndex(version, store.products(site))
+    return index
+
+
+def search(site, productname, limit=LOCAL_SEARCH_LIMIT):
+    """在本地索引中搜索，返回与实时搜索相同格式的结果；本地没有匹配时返回空列表"""
+    index = _get_index(site)
+    results = []
+    for idx, score in index.index.top_k(productname, limit):
+        if score <= 0:
+            break
+        code, name, price, url, image_url = index.rows[idx]
+        results.append({"name": name, "url": url, "price": price, "image_url": image_url, "similarity": score})
+    return results
+
+
+def get_detail(site, url):
+    """读取本地保存的商品详情，url 为搜索结果中的 url 字段"""
+    return get_store().get_detail(site, product_code(site, url))
+
+
+def remember_detail(site, url, detail):
+    if detail:
+        get_store().put_detail(site, product_code(site, url), detail)
+
+
+async def _fetch_catalog_page(adapter, page):
+    url, params = adapter.catalog_request(page)
+    response = await fetch_response(url, params=params)
+    return await run_in_thread(adapter.extract, "catalog", response.body)
+
+
+async def _crawl(adapter):
+    first = adapter.catalog_first_page
+    products, total_pages = await _fetch_catalog_page(adapter, first)
+    if total_pages is not None:
+        semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
+
+        async def fetch_page(page):
+            async with semaphore:
+                return await _fetch_catalog_page(adapter, page)
+
+        for page_products, _ in await asyncio.gather(*(fetch_page(page) for page in range(first + 1, total_pages))):
+            products.update(page_products)
+        return products
+
+    # 总页数未知：每次并发请求若干页，直到出现空页
+    page = first + 1
+    while products:
+        batch = await asyncio.gather(*(
+            _fetch_catalog_page(adapter, p) for p in range(page, page + SYNC_CONCURRENCY)
+        ))
+        for page_products, _ in batch:
+            if not page_products:
+                return products
+            products.update(page_products)
+        page += SYNC_CONCURRENCY
+    return products
+
+
+async def _fetch_detail(site, code):
+    adapter = sites.get(site)
+    try:
+        responses = await asyncio.gather(*(
+            fetch_response(url, params=params) for url, params in adapter.detail_requests(adapter.product_url(code))
+        ))
+        content = responses[0].body if len(responses) == 1 else tuple(response.body for response in responses)
+        return await run_in_thread(adapter.extract, adapter.detail_kinds[0], content)
+    except FetchError as e:
+        print(f"同步 {site} 详情 {code} 时发生错误: {e}")
+        return {}
+
+
+async def sync_site(site, with_details=False):
+    """同步一个网站，返回统计信息；抓取不完整时不修改本地商品库"""
+    started = time.perf_counter()
+    try:
+        products = await _crawl(sites.get(site))
+    except Exception as e:
+        # 任何一页失败都放弃本次同步，避免把没抓到的商品当成已下架删除
+        print(f"同步 {site} 失败：商品列表抓取不完整（{e}）")
+        return {"site": site, "ok": False}
+
+    store = get_store()
+    try:
+        added, changed, removed = store.apply_crawl(site, products)
+    except ValueError as e:
+        print(f"同步 {site} 失败：抓取结果未通过检查，保留本地商品库（{e}）")
+        return {"site": site, "ok": False}
+
+    details = 0
+    if with_details:
+        semaphore = asyncio.Semaphore(SYNC_CONCURRENCY)
+
+        async def refresh(code):
+            async with semaphore:
+                detail = await _fetch_detail(site, code)
+            if detail:
+                store.put_detail(site, code, detail)
+                return 1
+            return 0
+
+        details = sum(await asyncio.gather(*(refresh(code) for code in store.codes_without_detail(site))))
+
+    return {
+        "site": site,
+        "ok": True,
+        "products": len(products),
+        "added": len(added),
+        "changed": len(changed),
+        "removed": len(removed),
+        "details": details,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+async def sync_catalog(site_names=SITES, with_details=False):
+    return await asyncio.gather(*(sync_site(site, with_details) for site in site_names))
+
+
+_background_sync = None
+
+
+def sync_in_background(with_details=False):
+    """在连接池事件循环中后台同步；已有同步在进行时不重复启动"""
+    global _background_sync
+    with _lock:
+        if _background_sync is not None and not _background_sync.done():
+            return False
+        _background_sync = asyncio.run_coroutine_threadsafe(sync_catalog(with_details=with_details), get_loop())
+        return True
+
+
+def is_syncing():
+    return _background_sync is not None and not _background_sync.done()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步本地商品库")
+    parser.add_argument("command", choices=["sync"])
+    parser.add_argument("--site", choices=SITES, action="append", help="只同步指定网站（可重复）")
+    parser.add_argument("--details", action="store_true", help="同时抓取新增 / 变化商品的详情")
+    args = parser.parse_args()
+
+    for stats in asyncio.run(sync_catalog(args.site or SITES, with_details=args.details)):
+        print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+# ✅ 各站点的接口地址（各网站的接口模板、提取规则和请求策略见 sites.py）
+# 基础地址可以用环境变量覆盖，例如基准测试时指向本地的替身服务器（benchmarks/server.py）
+import os
+
+MAOMAO_BASE_URL = os.environ.get('SCRAPER_MAOMAO_BASE_URL', 'https://mao-mao.de')
+MAOMAO_SEARCH_URL = f'{MAOMAO_BASE_URL}/search'
+MAOMAO_PRODUCTS_URL = f'{MAOMAO_BASE_URL}/products.json'   # Shopify 全量商品列表
+MAOMAO_SUGGEST_URL = f'{MAOMAO_BASE_URL}/search/suggest.json'   # Shopify 搜索建议（JSON）
+
+AFL_API_BASE_URL = os.environ.get(
+    'SCRAPER_AFL_API_BASE_URL',
+    'https://api.c2k2y3nvy0-heuschena1-p1-public.model-t.cc.commerce.ondemand.com/occ/v2'
+)
+AFL_BASE_SEARCH_URL = f'{AFL_API_BASE_URL}/B2C-AFL-DE/products/search'
+AFL_BASE_DETAIL_URL = f'{AFL_API_BASE_URL}/B2C-AFL-COM/products/'
+
@@ -0,0 +1,229 @@
+# ✅ 批量导出商品资料表
+#
+# 把当前搜索结果或关键词列表中的商品连同详情导出为 CSV / JSONL / XLSX，每个商品一行，
+# 营养表的每一项、配料、过敏信息、产地等详情字段各占一列：
+# - 缺少的详情并发获取（同时在途的商品数有上限，各网站的并发预算和限流照常生效）；
+# - 商品、详情、输出之间是有界队列：哪一行的详情先到就先写出，每行写完立即 flush，
+#   内存不随行数增长，输出文件在所有详情到齐之前就可以开始读取；
+# - XLSX 使用 openpyxl 的只写模式（行直接写入临时文件），没有安装 openpyxl 时不提供。
+#
+#     python export.py keywords.txt -o sheet.xlsx [--site maomao] [--top 10] [--concurrency 8]
+#     cat keywords.txt | python export.py - -o - --format jsonl | ...
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+
+import sites
+from batch import BATCH_CONCURRENCY, SEARCH_TIMEOUT, iter_batch, read_keywords
+from parsers import NUTRITION_KEYS
+from scraper import async_get_detail
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+except ImportError:
+    Workbook = None
+
+FORMATS = ("csv", "jsonl", "xlsx") if Workbook is not None else ("csv", "jsonl")
+EXPORT_DIR = os.environ.get("SCRAPER_EXPORT_DIR", os.path.join(".cache", "exports"))   # 页面导出文件的目录
+EXPORT_CONCURRENCY = 8      # 同时获取详情的商品数
+DETAIL_TIMEOUT = 30         # 单个商品详情的超时（秒）
+
+# 各网站详情面板中的文本字段（按注册顺序去重），营养表按 NUTRITION_KEYS 展开为多列
+DETAIL_COLUMNS = list(dict.fromkeys(
+    field for adapter in sites.adapters() for field, _, _ in adapter.detail_fields if field != "nutrition"
+))
+EXPORT_FIELDS = ["keyword", "site", "name", "price", "url", "image_url"] + DETAIL_COLUMNS + NUTRITION_KEYS + ["error"]
+
+_DONE = object()
+
+
+def make_row(keyword, site, product, details, error=None):
+    row = {
+        "keyword": keyword,
+        "site": site,
+        "name": details.get("name") or product.get("name"),
+        "price": details.get("price") or product.get("price"),
+        "url": product.get("url"),
+        "image_url": details.get("image_url") or product.get("image_url"),
+    }
+    for field in DETAIL_COLUMNS:
+        row[field] = details.get(field) or ""
+    nutrition = details.get("nutrition") or {}
+    for key in NUTRITION_KEYS:
+        row[key] = nutrition.get(key) or ""
+    row["error"] = error or ""
+    return row
+
+
+async def results_items(keyword, results):
+    """当前搜索结果 {site: [商品]} -> (关键词, 网站, 商品)"""
+    for site, products in results.items():
+        for product in products:
+            yield keyword, site, product
+
+
+async def keyword_items(keywords, site_names=sites.SITES, top=None, timeout=SEARCH_TIMEOUT,
+                        chunk=BATCH_CONCURRENCY):
+    """逐批搜索关键词 -> (关键词, 网站, 商品)；一批消费完才开始下一批，已搜索但未导出的结果不会堆积"""
+    for start in range(0, len(keywords), chunk):
+        async for record in iter_batch(keywords[start:start + chunk], site_names, concurrency=chunk, timeout=timeout):
+            for site, outcome in record["sites"].items():
+                if outcome["status"] != "ok":
+                    print(f"搜索 {site}「{record['keyword']}」失败，跳过: {outcome['error']}", file=sys.stderr)
+                    continue
+                for product in outcome["results"][:top]:
+                    yield record["keyword"], site, product
+
+
+async def iter_rows(items, fetch_detail=async_get_detail, concurrency=EXPORT_CONCURRENCY, timeout=DETAIL_TIMEOUT):
+    """为每个商品获取详情，按完成顺序产出导出行；items 为 (关键词, 网站, 商品) 的异步可迭代对象"""
+    pending = asyncio.Queue(concurrency)
+    rows = asyncio.Queue(concurrency)
+    feed_error = None
+
+    async def feed():
+        nonlocal feed_error
+        try:
+            async for item in items:
+                await pending.put(item)
+        except Exception as e:
+            feed_error = e
+        for _ in range(concurrency):
+            await pending.put(_DONE)
+
+    # 单个商品失败时写出带 error 的行，不中断导出
+    async def worker():
+        while (item := await pending.get()) is not _DONE:
+            keyword, site, product = item
+            try:
+                details = await asyncio.wait_for(fetch_detail(site, product["url"]), timeout)
+                error = None if details else "详情获取失败"
+            except Exception as e:
+                details, error = {}, str(e) or type(e).__name__
+            await rows.put(make_row(keyword, site, product, details or {}, error))
+        await rows.put(_DONE)
+
+    tasks = [asyncio.ensure_future(feed())] + [asyncio.ensure_future(worker()) for _ in range(concurrency)]
+    try:
+        finished = 0
+        while finished < concurrency:
+            row = await rows.get()
+            if row is _DONE:
+                finished += 1
+            else:
+                yield row
+    finally:
+        for task in tasks:
+            task.cancel()
+    if feed_error is not None:
+        raise feed_error
+
+
+class CsvExportWriter:
+    def __init__(self, path):
+        self.path = path
+
+    def open(self):
+        # 带 BOM，Excel 直接打开时中文和变音符号不会乱码；标准输出不加
+        self._file = sys.stdout if self.path == "-" else open(self.path, "w", encoding="utf-8-sig", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=EXPORT_FIELDS)
+        self._writer.writeheader()
+
+    def write(self, row):
+        self._writer.writerow(row)
+        self._file.flush()
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class JsonlExportWriter:
+    def __init__(self, path):
+        self.path = path
+
+    def open(self):
+        self._file = sys.stdout if self.path == "-" else open(self.path, "w", encoding="utf-8")
+
+    def write(self, row):
+        self._file.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class XlsxExportWriter:
+    """只写模式：每行直接写入临时文件，close 时才组装成 .xlsx（之前文件不可读）"""
+
+    def __init__(self, path):
+        if path == "-":
+            raise ValueError("XLSX 不能写到标准输出")
+        self.path = path
+
+    def open(self):
+        self._workbook = Workbook(write_only=True)
+        self._sheet = self._workbook.create_sheet("商品")
+        self._sheet.append(EXPORT_FIELDS)
+
+    def write(self, row):
+        # 控制字符不能写入 XLSX
+        self._sheet.append([
+            ILLEGAL_CHARACTERS_RE.sub("", value) if isinstance(value, str) else value
+            for value in (row[field] for field in EXPORT_FIELDS)
+        ])
+
+    def close(self):
+        self._workbook.save(self.path)
+
+
+WRITERS = {"csv": CsvExportWriter, "jsonl": JsonlExportWriter, "xlsx": XlsxExportWriter}
+
+
+def make_writer(path, output_format=None):
+    output_format = output_format or next((fmt for fmt in FORMATS if path.endswith(f".{fmt}")), "csv")
+    if output_format not in FORMATS:
+        raise ValueError(f"不支持的导出格式: {output_format}（XLSX 需要安装 openpyxl）")
+    return WRITERS[output_format](path)
+
+
+async def export(items, writer, fetch_detail=async_get_detail, concurrency=EXPORT_CONCURRENCY, progress=None):
+    """边获取详情边写出，返回写出的行数；progress 为字典时实时更新 rows / errors"""
+    count = 0
+    writer.open()
+    try:
+        async for row in iter_rows(items, fetch_detail, concurrency):
+            writer.write(row)
+            count += 1
+            if progress is not None:
+                progress["rows"] = count
+                progress["errors"] = progress.get("errors", 0) + bool(row["error"])
+    finally:
+        writer.close()
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量导出商品资料表")
+    parser.add_argument("keywords", help="关键词文件（每行一个，或 .csv 第一列），- 表示标准输入")
+    parser.add_argument("-o", "--output", required=True, help="输出文件（.csv / .jsonl / .xlsx），- 表示标准输出")
+    parser.add_argument("--format", choices=FORMATS, help="输出格式，默认按扩展名判断")
+    parser.add_argument("--site", choices=sites.SITES, action="append", help="只搜索指定网站（可重复）")
+    parser.add_argument("--top", type=int, help="每个网站每个关键词导出的结果数，默认全部")
+    parser.add_argument("--concurrency", type=int, default=EXPORT_CONCURRENCY, help="同时获取详情的商品数")
+    parser.add_argument("--timeout", type=float, default=SEARCH_TIMEOUT, help="单个网站单个关键词的搜索超时（秒）")
+    args = parser.parse_args()
+
+    writer = make_writer(args.output, args.format)
+    items = keyword_items(read_keywords(args.keywords), tuple(args.site or sites.SITES), args.top, args.timeout)
+    count = asyncio.run(export(items, writer, concurrency=args.concurrency))
+    print(f"已导出 {count} 个商品", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,397 @@
+# ✅ 进程级共享 HTTP 连接池
+#
+# 所有站点请求共用一个长期存在的 aiohttp.ClientSession，它运行在独立的后台事件循环线程中，
+# 因此 Streamlit 每次 rerun 以及不同用户会话都能复用已经建立好的 keep-alive 连接、DNS 缓存和 TLS 会话，
+# 而不是每次搜索都重新握手。页面提交的后台任务（jobs.py）也运行在这个事件循环上。
+# 每个请求都按主机策略执行限流、重试、熔断和可选的对冲请求，失败时抛出类型化的 FetchError。
+# 开启指标时，DNS、建立连接（含 TLS）、首字节和下载耗时按站点记录到 metrics。
+# 相同 URL + 参数的并发请求会合并（single-flight）：多个会话同时搜索同一个商品时只发出一个上游请求。
+# 所有等待者都取消后（例如用户开始了新的搜索），合并的上游请求也会被取消。
+import asyncio
+import atexit
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+from aiohttp import ClientTimeout
+
+import metrics
+from resilience import (
+    CircuitBreaker, FetchError, PermanentFetchError, TokenBucket, TransientFetchError
+)
+from response_cache import get_cache, make_key
+from sites import host_policies, site_for_host
+
+# 连接池参数
+POOL_LIMIT = 100            # 全局最大连接数
+POOL_LIMIT_PER_HOST = 10    # 每个主机的最大连接数
+DNS_CACHE_TTL = 300         # DNS 缓存时间（秒）
+KEEPALIVE_TIMEOUT = 60      # 空闲 keep-alive 连接保留时间（秒）
+REQUEST_TIMEOUT = 10        # 单个请求的总超时（秒）
+
+# 每个主机的请求策略（见 resilience.py），未配置的主机使用 DEFAULT_POLICY；各网站的策略在适配器中声明（sites.py）
+DEFAULT_POLICY = {
+    "rate": 10,                 # 令牌桶：每秒请求数
+    "burst": 20,                # 令牌桶：突发请求数
+    "concurrency": POOL_LIMIT_PER_HOST,     # 同时进行的请求数（对冲请求算一个）
+    "retries": 2,               # 临时错误的最大重试次数
+    "failure_threshold": 5,     # 连续失败多少次后熔断
+    "reset_timeout": 30,        # 熔断持续时间（秒）
+    "hedge_after": None,        # 超过该秒数未响应时发出对冲请求，None 表示不对冲
+}
+HOST_POLICIES = host_policies()
+BACKOFF_BASE = 0.5          # 重试退避的基础时间（秒）
+BACKOFF_CAP = 8             # 重试退避的上限（秒）
+
+# 只有安装了 brotli 解码库时才声明支持 br，否则 aiohttp 无法解压
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = 'gzip, deflate, br'
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+        ACCEPT_ENCODING = 'gzip, deflate, br'
+    except ImportError:
+        ACCEPT_ENCODING = 'gzip, deflate'
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0',
+    'Accept-Encoding': ACCEPT_ENCODING,
+}
+
+_lock = threading.Lock()
+_loop = None
+_thread = None
+_session = None
+_hosts = {}
+_inflight = {}      # 合并键 -> 正在进行的请求任务，只在连接池事件循环中访问
+_waiters = {}       # 正在进行的请求任务 -> 等待它的协程数
+
+
+def get_loop():
+    """启动（或返回已存在的）连接池后台事件循环"""
+    global _loop, _thread
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            _loop = asyncio.new_event_loop()
+            _thread = threading.Thread(target=_loop.run_forever, name="http-pool", daemon=True)
+            _thread.start()
+        return _loop
+
+
+async def _on_request_start(session, ctx, params):
+    ctx.site = site_for_host(params.url.host)
+    ctx.start = time.perf_counter()
+
+
+async def _on_dns_resolvehost_start(session, ctx, params):
+    ctx.dns_start = time.perf_counter()
+
+
+async def _on_dns_resolvehost_end(session, ctx, params):
+    metrics.observe("dns", time.perf_counter() - ctx.dns_start, site_for_host(params.host))
+
+
+async def _on_connection_create_start(session, ctx, params):
+    ctx.connect_start = time.perf_counter()
+
+
+async def _on_connection_create_end(session, ctx, params):
+    metrics.observe("connect", time.perf_counter() - ctx.connect_start, ctx.site)
+
+
+async def _on_request_end(session, ctx, params):
+    # 收到响应头时触发，即首字节时间（包含排队、连接和服务器处理）
+    metrics.observe("ttfb", time.perf_counter() - ctx.start, ctx.site)
+
+
+def _trace_configs():
+    if not metrics.METRICS_ENABLED:
+        return []
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(_on_request_start)
+    trace_config.on_dns_resolvehost_start.append(_on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(_on_dns_resolvehost_end)
+    trace_config.on_connection_create_start.append(_on_connection_create_start)
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_request_end.append(_on_request_end)
+    return [trace_config]
+
+
+async def get_session():
+    """返回共享的 ClientSession，只能在连接池事件循环中调用"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=POOL_LIMIT,
+            limit_per_host=POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=DNS_CACHE_TTL,
+            keepalive_timeout=KEEPALIVE_TIMEOUT,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            headers=DEFAULT_HEADERS,
+            timeout=ClientTimeout(total=REQUEST_TIMEOUT),
+            trace_configs=_trace_configs(),
+        )
+    return _session
+
+
+def run_in_pool(coro):
+    """把协程交给连接池事件循环执行，返回可以在任意事件循环中 await 的 future"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_loop())
+    return asyncio.wrap_future(future)
+
+
+def _policy(host):
+    return {**DEFAULT_POLICY, **HOST_POLICIES.get(host, {})}
+
+
+def _host_state(host):
+    """返回主机的 (令牌桶, 熔断器, 并发信号量)，只在连接池事件循环中调用"""
+    state = _hosts.get(host)
+    if state is None:
+        policy = _policy(host)
+        state = _hosts[host] = (
+            TokenBucket(policy["rate"], policy["burst"]),
+            CircuitBreaker(host, policy["failure_threshold"], policy["reset_timeout"]),
+            asyncio.Semaphore(policy["concurrency"]),
+        )
+    return state
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+async def _attempt(url, params, headers):
+    """发出一次请求，返回 (status, headers, body)；304 时 body 为 None"""
+    session = await get_session()
+    try:
+        async with session.get(url, params=params, headers=headers) as response:
+            if response.status == 304:
+                return response.status, response.headers, None
+            if response.status == 429 or response.status >= 500:
+                raise TransientFetchError(
+                    f"HTTP {response.status}: {url}", url=url, status=response.status,
+                    retry_after=_retry_after(response)
+                )
+            if response.status >= 400:
+                raise PermanentFetchError(f"HTTP {response.status}: {url}", url=url, status=response.status)
+            with metrics.timer("download", site_for_host(response.url.host)):
+                try:
+                    body = await response.text()
+                except (UnicodeDecodeError, LookupError) as e:
+                    # 响应体无法按声明的编码解码（或编码未知），重试也不会变
+                    raise PermanentFetchError(
+                        f"{type(e).__name__}: {e} ({url})", url=url, status=response.status
+                    ) from e
+            return response.status, response.headers, body
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        raise TransientFetchError(f"{type(e).__name__}: {e} ({url})", url=url) from e
+
+
+async def _hedged_attempt(url, params, headers, hedge_after, bucket):
+    """对冲请求：第一个请求 hedge_after 秒内未完成时再发一个，取先成功的结果；
+    对冲请求同样消耗主机的令牌，令牌桶暂时没有令牌时不对冲，不会超过限流速率"""
+    if not hedge_after:
+        return await _attempt(url, params, headers)
+
+    tasks = [asyncio.ensure_future(_attempt(url, params, headers))]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if not done:
+            if bucket.try_acquire():
+                tasks.append(asyncio.ensure_future(_attempt(url, params, headers)))
+            else:
+                metrics.inc("hedge_skipped", site_for_host(urlsplit(url).hostname or ""))
+        error = None
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                return await next_done
+            except Exception as e:
+                # 一个请求出错时等待另一个，都失败时抛出最后一个错误
+                error = e
+        raise error
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+async def request(url, params=None, headers=None):
+    """按主机策略发出请求：限流、并发预算、熔断、临时错误带抖动重试、可选对冲"""
+    host = urlsplit(url).hostname or ""
+    site = site_for_host(host)
+    policy = _policy(host)
+    bucket, breaker, slots = _host_state(host)
+
+    for attempt in range(policy["retries"] + 1):
+        try:
+            probe = breaker.before_request()
+        except FetchError as e:
+            metrics.inc("fetch_error", site, type(e).__name__)
+            raise
+        try:
+            with metrics.timer("rate_limit_wait", site):
+                await bucket.acquire()
+            with metrics.timer("concurrency_wait", site):
+                await slots.acquire()
+            try:
+                result = await _hedged_attempt(url, params, headers, policy["hedge_after"], bucket)
+            finally:
+                slots.release()
+        except asyncio.CancelledError:
+            # 请求被放弃（所有等待者都已取消），不计入熔断统计；只有持有探测的请求才释放探测
+            if probe:
+                breaker.release_probe()
+            raise
+        except PermanentFetchError as e:
+            # 主机正常响应了，只是请求本身有问题
+            breaker.record_success()
+            metrics.inc("fetch_error", site, type(e).__name__)
+            raise
+        except TransientFetchError as e:
+            breaker.record_failure()
+            if attempt == policy["retries"] or breaker.is_open:
+                metrics.inc("fetch_error", site, type(e).__name__)
+                raise
+            metrics.inc("retry", site, str(e.status or "network"))
+            # 指数退避 + 完全抖动，429 时优先遵守 Retry-After（同样不超过退避上限，避免一个请求被挂起很久）
+            if e.retry_after:
+                delay = min(e.retry_after, BACKOFF_CAP)
+            else:
+                delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            await asyncio.sleep(delay)
+        except Exception as e:
+            # 意外的错误：按失败计入熔断（探测请求因此重新熔断，不会一直占着探测），不重试
+            breaker.record_failure()
+            metrics.inc("fetch_error", site, type(e).__name__)
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+
+async def _get_response(url, params=None, headers=None, revalidate=False):
+    site = site_for_host(urlsplit(url).hostname or "")
+    cache = get_cache()
+    key = make_key(url, params)
+    entry = cache.get(key)
+    if entry is not None and entry.expires_at > time.time() and not revalidate:
+        metrics.inc("response_cache", site, "hit")
+        return entry
+
+    # 过期条目带着校验信息发送条件请求
+    request_headers = dict(headers or {})
+    if entry is not None:
+        if entry.etag:
+            request_headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            request_headers['If-Modified-Since'] = entry.last_modified
+
+    try:
+        status, response_headers, body = await request(url, params=params, headers=request_headers)
+    except TransientFetchError as e:
+        # 网站暂时不可用时使用过期的缓存（stale-if-error）；强制重新验证时调用方需要知道请求失败
+        if entry is not None and not revalidate:
+            print(f"请求错误，使用过期缓存: {e}")
+            metrics.inc("response_cache", site, "stale")
+            return entry
+        raise
+
+    if status == 304 and entry is not None:
+        metrics.inc("response_cache", site, "revalidated")
+        return cache.revalidated(entry, url)
+    metrics.inc("response_cache", site, "miss")
+    if body is None:
+        raise PermanentFetchError(f"HTTP {status}: {url}", url=url, status=status)
+    return cache.put(
+        key, url, body,
+        etag=response_headers.get('ETag'),
+        last_modified=response_headers.get('Last-Modified'),
+    )
+
+
+def _forget_inflight(key, task):
+    if _inflight.get(key) is task:
+        del _inflight[key]
+    _waiters.pop(task, None)
+    # 所有等待者都已取消时也取出异常，避免 "exception was never retrieved"
+    if not task.cancelled():
+        task.exception()
+
+
+async def _coalesced(url, params=None, headers=None, revalidate=False):
+    """相同请求只发出一次，所有等待者得到同一个结果（或同一个异常）"""
+    key = (make_key(url, params), tuple(sorted((headers or {}).items())), revalidate)
+    task = _inflight.get(key)
+    if task is None:
+        task = _inflight[key] = asyncio.ensure_future(_get_response(url, params=params, headers=headers, revalidate=revalidate))
+        task.add_done_callback(lambda done: _forget_inflight(key, done))
+    else:
+        metrics.inc("coalesced", site_for_host(urlsplit(url).hostname or ""))
+    # shield：某个会话取消等待（例如开始了新的搜索）不会中断其他会话共享的请求；
+    # 最后一个等待者也取消时请求已经没有人要，取消它以释放上游连接
+    _waiters[task] = _waiters.get(task, 0) + 1
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        if not task.done() and _waiters.get(task) == 1:
+            task.cancel()
+            metrics.inc("fetch_abandoned", site_for_host(urlsplit(url).hostname or ""))
+        raise
+    finally:
+        if task in _waiters:
+            _waiters[task] -= 1
+
+
+async def fetch_response(url, params=None, headers=None, revalidate=False):
+    """经过请求合并、响应缓存和请求策略的请求，返回 CachedResponse；失败时抛出 FetchError 子类
+
+    revalidate=True 时即使缓存未过期也向上游确认（有 ETag / Last-Modified 时为条件请求），用于价格跟踪
+    """
+    with metrics.timer("fetch", site_for_host(urlsplit(url).hostname or "")):
+        return await run_in_pool(_coalesced(url, params=params, headers=headers, revalidate=revalidate))
+
+
+# Async fetch function with timeout
+async def fetch(url, params=None, headers=None):
+    response = await fetch_response(url, params=params, headers=headers)
+    return response.body
+
+
+async def _shutdown():
+    global _session
+    # 取消仍在运行的后台任务（预取、后台搜索等），再关闭连接
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+def close():
+    """关闭共享连接池并停止后台事件循环（进程退出时自动调用）"""
+    global _loop, _thread
+    with _lock:
+        loop, thread = _loop, _thread
+        _loop, _thread = None, None
+    if loop is None or loop.is_closed():
+        return
+    try:
+        asyncio.run_coroutine_threadsafe(_shutdown(), loop).result(timeout=5)
+    except Exception as e:
+        print(f"关闭连接池时发生错误: {e}")
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+    loop.close()
+
+
+atexit.register(close)
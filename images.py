@@ -0,0 +1,187 @@
+# ✅ 图片子系统：并发预取 + 缩略图 + 本地缓存
+#
+# - 下载在共享连接池的事件循环中并发进行，并用信号量限制并发数；
+# - 同一个 URL 同时只会下载一次（in-flight 去重）；
+# - 原图和 150px / 300px 缩略图保存在有大小上限的本地目录中，按最近访问时间淘汰；
+# - 原图字节只有在用户真正点击下载时才读取。
+import asyncio
+import hashlib
+import io
+import os
+import threading
+
+from http_client import get_session, run_in_pool, get_loop
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGE_CACHE_DIR = os.environ.get("SCRAPER_IMAGE_CACHE_DIR", os.path.join(".cache", "images"))
+MAX_IMAGE_CACHE_BYTES = 500 * 1024 * 1024   # 图片缓存总大小上限
+MAX_CONCURRENT_DOWNLOADS = 8                 # 同时下载的图片数上限
+THUMBNAIL_SIZES = (150, 300)                 # 搜索列表和详情中使用的宽度
+DOWNLOAD_TIMEOUT = 30
+
+
+class ImageStore:
+    def __init__(self, directory=IMAGE_CACHE_DIR, max_bytes=MAX_IMAGE_CACHE_BYTES,
+                 concurrency=MAX_CONCURRENT_DOWNLOADS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.concurrency = concurrency
+        # 以下状态只在连接池事件循环中访问，不需要加锁
+        self._semaphore = None
+        self._inflight = {}
+        self._size_lock = threading.Lock()
+        self._total_bytes = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url, width=None):
+        name = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        suffix = f"_{width}.jpg" if width else ".img"
+        return os.path.join(self.directory, name[:2], name + suffix)
+
+    def is_cached(self, url):
+        return os.path.exists(self._path(url))
+
+    def thumbnail_path(self, url, width):
+        """返回已缓存的缩略图路径，尚未下载时返回 None"""
+        path = self._path(url, width)
+        if not os.path.exists(path):
+            # 没有 Pillow 或无法生成缩略图时直接使用原图
+            path = self._path(url)
+            if not os.path.exists(path):
+                return None
+        self._touch(path)
+        return path
+
+    def load_bytes(self, url):
+        """读取原图字节，未缓存时同步下载（供 st.download_button 的延迟回调使用）"""
+        path = self._path(url)
+        if not os.path.exists(path):
+            future = asyncio.run_coroutine_threadsafe(self.ensure(url), get_loop())
+            future.result(timeout=DOWNLOAD_TIMEOUT)
+        self._touch(path)
+        with open(path, "rb") as f:
+            return f.read()
+
+    async def ensure(self, url):
+        """确保图片及其缩略图已缓存，必须在连接池事件循环中调用"""
+        if self.is_cached(url):
+            return True
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._download(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def _download(self, url):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            session = await get_session()
+            async with session.get(url) as response:
+                response.raise_for_status()
+                data = await response.read()
+        await asyncio.to_thread(self._save, url, data)
+        return True
+
+    def _save(self, url, data):
+        written = self._write(self._path(url), data)
+        if Image is not None:
+            try:
+                with Image.open(io.BytesIO(data)) as img:
+                    img = img.convert("RGB")
+                    for width in THUMBNAIL_SIZES:
+                        thumb = img.copy()
+                        thumb.thumbnail((width, width * 4))
+                        buffer = io.BytesIO()
+                        thumb.save(buffer, format="JPEG", quality=85, optimize=True)
+                        written += self._write(self._path(url, width), buffer.getvalue())
+            except Exception as e:
+                print(f"生成缩略图时发生错误: {e}")
+        self._account(written)
+
+    def _write(self, path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return len(data)
+
+    def _touch(self, path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def _account(self, written):
+        with self._size_lock:
+            if self._total_bytes is None:
+                self._total_bytes = sum(size for _, _, size in self._files())
+            else:
+                self._total_bytes += written
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # 按修改时间（读取时会 touch）从旧到新删除，直到低于上限的 90%
+        target = int(self.max_bytes * 0.9)
+        for path, _, size in sorted(self._files(), key=lambda f: f[1]):
+            if self._total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+                self._total_bytes -= size
+            except OSError:
+                pass
+
+    async def prefetch(self, urls):
+        """并发下载一批图片，单张失败不影响其他图片"""
+        results = await asyncio.gather(*(self.ensure(url) for url in set(urls) if url), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"下载图片时发生错误: {result}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """返回进程内共享的 ImageStore 实例"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ImageStore()
+        return _store
+
+
+def prefetch_in_background(urls):
+    """在连接池事件循环中后台预取图片，不阻塞当前页面渲染"""
+    urls = [url for url in urls if url and not get_store().is_cached(url)]
+    if urls:
+        asyncio.run_coroutine_threadsafe(get_store().prefetch(urls), get_loop())
+
+
+async def prefetch(urls):
+    """预取图片并等待完成"""
+    await run_in_pool(get_store().prefetch(urls))
+
+
+def image_source(url, width):
+    """st.image 使用的图片来源：优先本地缩略图，尚未缓存时退回原始 URL"""
+    return get_store().thumbnail_path(url, width) or url
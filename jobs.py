@@ -0,0 +1,166 @@
+# ✅ 后台任务：页面提交、轮询，过时的任务自动取消
+#
+# 所有异步工作都运行在 http_client 的常驻后台事件循环上，连接池、进行中的请求和预取在 Streamlit 的
+# 多次 rerun 之间保留。页面线程不再自己创建事件循环：submit 把协程交给后台循环并立即返回任务 id，
+# 之后的 rerun（或定时刷新的 fragment）用 get / pop 查询状态和结果。
+#
+# 任务按 (owner, group) 归组，owner 通常是会话 id：同一个会话在同一组中提交新任务时，
+# 上一个任务被取消（例如用户开始了新的搜索），已放弃的搜索不再占用上游连接。
+# 完成后一直没有被取走的任务在 JOB_TTL 秒后清理。
+import asyncio
+import itertools
+import threading
+import time
+
+import metrics
+from http_client import get_loop
+
+JOB_TTL = 600       # 已完成但没有被取走的任务保留的时间（秒）
+
+
+class Job:
+    def __init__(self, job_id, owner, group, future, stopped):
+        self.id = job_id
+        self.owner = owner
+        self.group = group
+        self.future = future        # concurrent.futures.Future
+        self.stopped = stopped      # 协程真正退出（包括取消后的清理）时设置的 threading.Event
+        self.created = time.time()
+        self.finished = None
+
+    @property
+    def status(self):
+        """running / done / error / cancelled"""
+        if not self.future.done():
+            return "running"
+        if self.future.cancelled():
+            return "cancelled"
+        return "error" if self.future.exception() is not None else "done"
+
+    def result(self):
+        return self.future.result()
+
+
+class JobRunner:
+    def __init__(self, ttl=JOB_TTL):
+        self.ttl = ttl
+        self._jobs = {}             # 任务 id -> Job
+        self._groups = {}           # (owner, group) -> 该组最新的任务 id
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, coro, owner=None, group=None):
+        """在后台事件循环中运行协程，立即返回任务 id；同一 (owner, group) 的上一个任务被取消"""
+        return self._submit(coro, owner, group).id
+
+    def _submit(self, coro, owner, group):
+        # future.cancel() 立即返回，协程的 finally 清理稍后才在事件循环上执行，stopped 标记它真正结束
+        stopped = threading.Event()
+
+        async def run():
+            try:
+                return await coro
+            finally:
+                stopped.set()
+
+        future = asyncio.run_coroutine_threadsafe(run(), get_loop())
+        with self._lock:
+            self._reap()
+            job = Job(next(self._ids), owner, group, future, stopped)
+            self._jobs[job.id] = job
+            if group is not None:
+                previous = self._jobs.get(self._groups.get((owner, group)))
+                self._groups[(owner, group)] = job.id
+                if previous is not None:
+                    self._supersede(previous)
+        future.add_done_callback(lambda _: self._finish(job))
+        metrics.inc("job", group_label(group), "submitted")
+        return job
+
+    def _supersede(self, job):
+        # 调用方已持有锁；已经完成的旧任务结果没人会再取，直接丢弃
+        del self._jobs[job.id]
+        if job.future.cancel():
+            metrics.inc("job", group_label(job.group), "superseded")
+
+    def _finish(self, job):
+        job.finished = time.time()
+
+    def _reap(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and now - job.finished > self.ttl:
+                del self._jobs[job_id]
+
+    def get(self, job_id):
+        """返回任务（不移除），不存在（已取走、已被取代或已清理）时返回 None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def pop(self, job_id):
+        """取走任务并从运行时中移除，不存在时返回 None"""
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is not None and job.group is not None and self._groups.get((job.owner, job.group)) == job_id:
+                del self._groups[(job.owner, job.group)]
+            return job
+
+    def cancel(self, job_id):
+        job = self.pop(job_id)
+        if job is not None and job.future.cancel():
+            metrics.inc("job", group_label(job.group), "cancelled")
+
+    def cancel_group(self, owner, group, wait=None):
+        """取消 (owner, group) 中最新的任务；wait 为秒数时等待协程真正退出，返回是否已经退出"""
+        with self._lock:
+            job = self._jobs.get(self._groups.get((owner, group)))
+        if job is None:
+            return True
+        self.cancel(job.id)
+        if wait is not None and job.future.cancelled():
+            return job.stopped.wait(wait)
+        return job.future.done()
+
+    def cancel_owner(self, owner):
+        """取消一个会话的所有任务（例如会话结束时）"""
+        with self._lock:
+            job_ids = [job.id for job in self._jobs.values() if job.owner == owner]
+        for job_id in job_ids:
+            self.cancel(job_id)
+
+    def run(self, coro, owner=None, group=None, timeout=None):
+        """提交任务并在当前线程等待结果（用于必须立即显示结果的操作，如点击查看详情）"""
+        job = self._submit(coro, owner, group)
+        try:
+            return job.future.result(timeout)
+        finally:
+            # 超时或页面线程被中断时同时取消后台任务
+            self.cancel(job.id)
+
+    def stats(self):
+        """{状态: 任务数}，用于诊断面板"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {}
+        for job in jobs:
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+
+def group_label(group):
+    if group is None:
+        return "default"
+    return group if isinstance(group, str) else ":".join(str(part) for part in group)
+
+
+_runner = None
+_lock = threading.Lock()
+
+
+def get_runner():
+    """返回进程内共享的任务运行时，所有会话共用"""
+    global _runner
+    with _lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
@@ -0,0 +1,207 @@
+# ✅ 跨站商品匹配：MinHash 签名 + LSH 分桶
+#
+# 两个网站的商品两两计算 Jaccard 相似度是 O(n·m)。这里给每个商品名的词集合（与 similar.py 相同的分词）
+# 计算 MinHash 签名，按 LSH band 分桶：只有至少一个 band 完全相同的商品才成为候选对，
+# 候选对再用精确的 Jaccard 相似度打分。建索引和查候选都接近线性，可以随时增量加入新看到的商品。
+#
+# 默认 128 个哈希分成 32 个 band（每个 4 行）：Jaccard 0.6 的商品对约 98% 会成为候选，0.2 的约 5%。
+import re
+import threading
+import zlib
+from random import Random
+
+import catalog
+from similar import _jaccard, tokenize
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NUM_PERM = 128          # MinHash 哈希函数个数
+LSH_BANDS = 32          # band 数，每个 band 有 NUM_PERM / LSH_BANDS 行
+MATCH_THRESHOLD = 0.5   # 精确 Jaccard 相似度达到该值才算同一商品
+MINHASH_SEED = 1
+
+_PRIME = 4294967291     # 小于 2^32 的最大素数；a、b < 2^31 时 a * x + b 在 uint64 中不会溢出
+
+
+def _token_hash(token):
+    # 不能用内置 hash()：每个进程的字符串哈希种子不同
+    return zlib.crc32(token.encode("utf-8"))
+
+
+class MinHasher:
+    def __init__(self, num_perm=NUM_PERM, seed=MINHASH_SEED):
+        rng = Random(seed)
+        self.num_perm = num_perm
+        self._a = [rng.randrange(1, 2 ** 31) for _ in range(num_perm)]
+        self._b = [rng.randrange(0, 2 ** 31) for _ in range(num_perm)]
+        if np is not None:
+            self._a_array = np.asarray(self._a, dtype=np.uint64)[:, None]
+            self._b_array = np.asarray(self._b, dtype=np.uint64)[:, None]
+
+    def signature(self, tokens):
+        """词集合的 MinHash 签名（长度为 num_perm 的整数元组）；空集合返回 None"""
+        if not tokens:
+            return None
+        hashes = [_token_hash(token) for token in tokens]
+        if np is not None:
+            values = (self._a_array * np.asarray(hashes, dtype=np.uint64) + self._b_array) % _PRIME
+            return tuple(values.min(axis=1).tolist())
+        return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in zip(self._a, self._b))
+
+
+class LSHIndex:
+    """把签名按 band 分桶；签名有任意一个 band 相同的条目互为候选"""
+
+    def __init__(self, num_perm=NUM_PERM, bands=LSH_BANDS):
+        if num_perm % bands:
+            raise ValueError("num_perm 必须是 bands 的整数倍")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = {}
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def _band_keys(self, signature):
+        return [signature[i * self.rows:(i + 1) * self.rows] for i in range(self.bands)]
+
+    def add(self, key, signature):
+        self.remove(key)
+        self._signatures[key] = signature
+        for buckets, band in zip(self._buckets, self._band_keys(signature)):
+            buckets.setdefault(band, set()).add(key)
+
+    def remove(self, key):
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for buckets, band in zip(self._buckets, self._band_keys(signature)):
+            bucket = buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del buckets[band]
+
+    def candidates(self, signature):
+        found = set()
+        for buckets, band in zip(self._buckets, self._band_keys(signature)):
+            found.update(buckets.get(band, ()))
+        return found
+
+
+class ProductMatcher:
+    """按网站维护 LSH 索引，为一个网站的商品在其他网站中找同一商品"""
+
+    def __init__(self, sites=catalog.SITES, threshold=MATCH_THRESHOLD, num_perm=NUM_PERM, bands=LSH_BANDS):
+        self.sites = sites
+        self.threshold = threshold
+        self._hasher = MinHasher(num_perm)
+        self._indexes = {site: LSHIndex(num_perm, bands) for site in sites}
+        self._products = {site: {} for site in sites}   # site -> {url: 商品字典}
+        self._lock = threading.Lock()
+        self.revision = 0                               # 每次内容变化加一，用于缓存匹配结果
+
+    def __len__(self):
+        return sum(len(products) for products in self._products.values())
+
+    def add(self, site, product):
+        """加入或更新一个商品（需要 name 和 url），名称没变时只更新价格等字段"""
+        url = product.get("url")
+        if not url:
+            return
+        entry = {key: product.get(key) for key in ("name", "price", "url", "image_url")}
+        with self._lock:
+            old = self._products[site].get(url)
+            if old == entry:
+                return
+            self._products[site][url] = entry
+            if old is None or old["name"] != entry["name"]:
+                signature = self._hasher.signature(tokenize(entry["name"] or ""))
+                if signature is None:
+                    self._indexes[site].remove(url)
+                else:
+                    self._indexes[site].add(url, signature)
+            self.revision += 1
+
+    def add_many(self, site, products):
+        for product in products:
+            self.add(site, product)
+
+    def remove(self, site, url):
+        with self._lock:
+            if self._products[site].pop(url, None) is not None:
+                self._indexes[site].remove(url)
+                self.revision += 1
+
+    def urls(self, site):
+        with self._lock:
+            return set(self._products[site])
+
+    def match(self, site, product, other_site, limit=1):
+        """在 other_site 中查找与 product 相同的商品，返回 [(商品字典, 相似度)]，按相似度降序"""
+        tokens = tokenize(product.get("name") or "")
+        signature = self._hasher.signature(tokens)
+        if signature is None:
+            return []
+        with self._lock:
+            others = self._products[other_site]
+            scored = []
+            for url in self._indexes[other_site].candidates(signature):
+                score = _jaccard(tokens, tokenize(others[url]["name"]))
+                if score >= self.threshold:
+                    scored.append((others[url], score))
+        scored.sort(key=lambda pair: (-pair[1], pair[0]["url"]))
+        return scored[:limit]
+
+    def pairs(self, site, other_site):
+        """site 中每个商品在 other_site 中的最佳匹配：[(商品, 匹配商品, 相似度)]，按相似度降序"""
+        with self._lock:
+            products = list(self._products[site].values())
+        pairs = []
+        for product in products:
+            best = self.match(site, product, other_site)
+            if best:
+                pairs.append((product, best[0][0], best[0][1]))
+        pairs.sort(key=lambda pair: -pair[2])
+        return pairs
+
+
+def parse_price(text):
+    """从 '€1,99'、'1.5 €' 这样的价格文本中取出数值，无法识别时返回 None"""
+    if text is None:
+        return None
+    found = re.search(r"\d+(?:[.,]\d+)?", str(text))
+    return float(found.group().replace(",", ".")) if found else None
+
+
+_matcher = None
+_catalog_versions = {}     # site -> 已同步的商品库版本
+_catalog_urls = {}         # site -> 上次从商品库载入的商品 url
+_lock = threading.Lock()
+
+
+def get_matcher():
+    """返回进程内共享的匹配器，并把本地商品库的变化增量同步进去"""
+    global _matcher
+    with _lock:
+        if _matcher is None:
+            _matcher = ProductMatcher()
+        store = catalog.get_store()
+        for site in _matcher.sites:
+            version = store.version(site)
+            if _catalog_versions.get(site) == version:
+                continue
+            seen = set()
+            for code, name, price, url, image_url in store.products(site):
+                _matcher.add(site, {"name": name, "price": price, "url": url, "image_url": image_url})
+                seen.add(url)
+            # 上次从商品库载入、这次已经下架的商品
+            for url in _catalog_urls.get(site, set()) - seen:
+                _matcher.remove(site, url)
+            _catalog_versions[site] = version
+            _catalog_urls[site] = seen
+        return _matcher
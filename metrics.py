@@ -0,0 +1,227 @@
+# ✅ 热路径性能指标：按站点和阶段统计耗时直方图与计数器
+#
+# 搜索变慢时用来判断时间花在哪里：DNS / 连接（含 TLS）/ 首字节 / 下载、各 parse_* 函数、
+# 相似度打分、st.cache_data 命中与未命中、页面各部分的渲染。
+# - 应用侧边栏的“性能诊断”面板显示各阶段的次数和 p50 / p95，并可以下载 Prometheus 文本；
+# - 设置 SCRAPER_METRICS_PORT 时另外在该端口提供 /metrics 供 Prometheus 抓取；
+# - SCRAPER_METRICS=0 关闭统计：timed 装饰器原样返回函数，timer 返回共享的空上下文，几乎没有开销。
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from inspect import iscoroutinefunction
+
+METRICS_ENABLED = os.environ.get("SCRAPER_METRICS", "1") != "0"
+METRICS_PORT = int(os.environ.get("SCRAPER_METRICS_PORT", "0"))    # 0 表示不启动 /metrics 服务
+
+# 直方图桶上限（秒），与 Prometheus 的累计桶语义相同，最后还有一个 +Inf 桶
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+STAGE_METRIC = "scraper_stage_seconds"
+EVENT_METRIC = "scraper_events_total"
+
+_NULL_TIMER = nullcontext()
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q):
+        """按桶线性插值估算分位数（与 Prometheus histogram_quantile 相同），没有数据时返回 None"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, n in enumerate(self.counts):
+            if cumulative + n >= rank and n:
+                if i == len(BUCKETS):
+                    return BUCKETS[-1]
+                lower = BUCKETS[i - 1] if i else 0.0
+                return lower + (BUCKETS[i] - lower) * (rank - cumulative) / n
+            cumulative += n
+        return BUCKETS[-1]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}   # (stage, site) -> Histogram
+        self._counters = {}     # (event, site, detail) -> int
+
+    def observe(self, stage, seconds, site=""):
+        with self._lock:
+            histogram = self._histograms.get((stage, site))
+            if histogram is None:
+                histogram = self._histograms[(stage, site)] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, event, site="", detail="", amount=1):
+        key = (event, site, detail)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def stages(self):
+        """[(stage, site, 次数, 平均, p50, p95, p99)]，时间单位为秒"""
+        with self._lock:
+            items = sorted(self._histograms.items())
+            return [
+                (stage, site, h.count, h.sum / h.count, h.quantile(0.5), h.quantile(0.95), h.quantile(0.99))
+                for (stage, site), h in items
+            ]
+
+    def events(self):
+        with self._lock:
+            return sorted((event, site, detail, n) for (event, site, detail), n in self._counters.items())
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render_prometheus(self):
+        lines = [
+            f"# HELP {STAGE_METRIC} Time spent per site and stage.",
+            f"# TYPE {STAGE_METRIC} histogram",
+        ]
+        with self._lock:
+            for (stage, site), h in sorted(self._histograms.items()):
+                labels = f'stage="{_escape(stage)}",site="{_escape(site)}"'
+                cumulative = 0
+                for bound, n in zip(BUCKETS + ("+Inf",), h.counts):
+                    cumulative += n
+                    lines.append(f'{STAGE_METRIC}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{STAGE_METRIC}_sum{{{labels}}} {h.sum}")
+                lines.append(f"{STAGE_METRIC}_count{{{labels}}} {h.count}")
+            lines.append(f"# HELP {EVENT_METRIC} Counted events (cache hits, retries, errors) per site.")
+            lines.append(f"# TYPE {EVENT_METRIC} counter")
+            for (event, site, detail), n in sorted(self._counters.items()):
+                lines.append(
+                    f'{EVENT_METRIC}{{event="{_escape(event)}",site="{_escape(site)}",detail="{_escape(detail)}"}} {n}'
+                )
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_registry = Registry()
+
+
+def get_registry():
+    return _registry
+
+
+class _Timer:
+    __slots__ = ("stage", "site", "_start")
+
+    def __init__(self, stage, site):
+        self.stage = stage
+        self.site = site
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        _registry.observe(self.stage, time.perf_counter() - self._start, self.site)
+        return False
+
+
+def timer(stage, site=""):
+    """with metrics.timer("render", site="maomao"): ..."""
+    if not METRICS_ENABLED:
+        return _NULL_TIMER
+    return _Timer(stage, site)
+
+
+def observe(stage, seconds, site=""):
+    if METRICS_ENABLED:
+        _registry.observe(stage, seconds, site)
+
+
+def inc(event, site="", detail="", amount=1):
+    if METRICS_ENABLED:
+        _registry.inc(event, site, detail, amount)
+
+
+def timed(stage, site=""):
+    """统计函数（同步或异步）的耗时；关闭统计时原样返回函数。
+    包装后的函数带有 metric_labels = (stage, site)，在其他进程中执行时调用方据此在本进程记录耗时"""
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    _registry.observe(stage, time.perf_counter() - start, site)
+            async_wrapper.metric_labels = (stage, site)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _registry.observe(stage, time.perf_counter() - start, site)
+        wrapper.metric_labels = (stage, site)
+        return wrapper
+    return decorator
+
+
+def render_prometheus():
+    return _registry.render_prometheus()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve(port=METRICS_PORT, host="0.0.0.0"):
+    """在后台线程中提供 /metrics（每个进程只启动一次），port 为 0 时不启动"""
+    global _server
+    if not port or not METRICS_ENABLED:
+        return None
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError as e:
+                print(f"启动指标服务失败: {e}")
+                return None
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+        return _server
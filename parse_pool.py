@@ -0,0 +1,108 @@
+# ✅ 解析工作池：解析不在事件循环中进行
+#
+# 搜索、预取和同步都运行在连接池事件循环上，如果在循环里同步解析一个大的 HTML 页面，
+# 所有正在进行的请求都会停下来。这里提供两级工作池：
+# - 线程池：st.cache_data 查找、小 JSON 解析等轻量工作，不阻塞事件循环；
+# - 进程池：CPU 密集的 HTML 解析，可以用满所有核心（不受 GIL 限制）。
+# 工作数通过环境变量配置，设为 0 时在调用处直接解析；进程池无法启动或崩溃时自动退回直接解析。
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+PARSE_PROCESSES = int(os.environ.get("SCRAPER_PARSE_PROCESSES", os.cpu_count() or 1))
+PARSE_THREADS = int(os.environ.get("SCRAPER_PARSE_THREADS", min(32, (os.cpu_count() or 1) + 4)))
+MIN_PROCESS_BYTES = 32 * 1024   # 小于该大小的页面直接在当前线程解析（进程间传输比解析本身更慢）
+
+_lock = threading.Lock()
+_threads = None
+_processes = None
+_processes_broken = False
+
+
+def _thread_pool():
+    global _threads
+    with _lock:
+        if _threads is None:
+            _threads = ThreadPoolExecutor(max_workers=PARSE_THREADS, thread_name_prefix="parse")
+        return _threads
+
+
+def _process_pool():
+    """返回进程池；未配置或无法启动时返回 None"""
+    global _processes, _processes_broken
+    with _lock:
+        if _processes is None and PARSE_PROCESSES > 0 and not _processes_broken:
+            try:
+                # spawn：Streamlit 进程里有很多线程，fork 出的子进程可能继承被占用的锁
+                _processes = ProcessPoolExecutor(
+                    max_workers=PARSE_PROCESSES, mp_context=multiprocessing.get_context("spawn")
+                )
+            except (OSError, ValueError, NotImplementedError) as e:
+                print(f"无法启动解析进程池，改为直接解析: {e}")
+                _processes_broken = True
+        return _processes
+
+
+def _mark_broken(error):
+    global _processes, _processes_broken
+    print(f"解析进程池不可用，改为直接解析: {error}")
+    with _lock:
+        _processes_broken = True
+        pool, _processes = _processes, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _timed_call(func, html, *args):
+    """在工作进程中执行，连同解析耗时一起返回（工作进程中记录的指标不会回到主进程）"""
+    start = time.perf_counter()
+    result = func(html, *args)
+    return result, time.perf_counter() - start
+
+
+def parse_html(func, html, *args):
+    """在进程池中执行 func(html, *args) 并等待结果（在工作线程中调用）；不适用或失败时直接解析"""
+    pool = _process_pool() if len(html) >= MIN_PROCESS_BYTES else None
+    if pool is not None:
+        # 解析函数上 metrics.timed 的 (阶段, 站点)，在主进程中按同样的标签记录工作进程返回的耗时
+        stage, site = getattr(func, "metric_labels", (None, ""))
+        try:
+            with metrics.timer("parse_process", site):
+                result, seconds = pool.submit(_timed_call, func, html, *args).result()
+        except (BrokenProcessPool, RuntimeError) as e:
+            # RuntimeError：进程池已关闭（进程退出时）
+            _mark_broken(e)
+        else:
+            if stage is not None:
+                metrics.observe(stage, seconds, site)
+            return result
+        metrics.inc("parse_fallback")
+    return func(html, *args)
+
+
+async def run_in_thread(func, *args):
+    """在解析线程池中执行 func(*args)，不阻塞调用它的事件循环；线程数为 0 时直接执行"""
+    if PARSE_THREADS <= 0:
+        return func(*args)
+    return await asyncio.get_running_loop().run_in_executor(_thread_pool(), func, *args)
+
+
+def shutdown():
+    global _threads, _processes
+    with _lock:
+        threads, processes = _threads, _processes
+        _threads, _processes = None, None
+    if processes is not None:
+        processes.shutdown(wait=False, cancel_futures=True)
+    if threads is not None:
+        threads.shutdown(wait=False, cancel_futures=True)
+
+
+atexit.register(shutdown)
@@ -0,0 +1,584 @@
+# ✅ 可插拔的 HTML 解析后端
+#
+# MaoMao 的搜索页和详情页都是完整的 Shopify 主题页面，而我们只关心其中几个子树：
+# div.grid-product、#dropdownContent1D、span.metafield-multi_line_text_field 等。
+# 这里把“如何解析 HTML”抽象成后端，提取逻辑只写一遍：
+# - soup:       BeautifulSoup + html.parser，用 SoupStrainer 只建立相关子树
+# - lxml:       lxml.html（C 实现），XPath 查询
+# - selectolax: selectolax（C 实现），CSS 查询，通常最快
+# 所有后端输出完全相同的字典，通过环境变量 SCRAPER_PARSER_BACKEND 选择，默认 auto（选可用的最快后端）。
+# MaoMao 还可以使用 Shopify 店面的 JSON 接口（搜索建议、products/<handle>.js），响应更小，但搜索建议
+# 最多 10 个结果，商品 JSON 中没有配料和营养信息（只在商品页中渲染），因此默认仍解析完整页面。
+# AsianFoodLovers 的 OCC 接口直接返回 JSON，其解析函数也放在本模块末尾。
+import json
+import os
+
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.element import CData, NavigableString, Tag
+
+import metrics
+from endpoints import MAOMAO_BASE_URL
+from similar import rank_by_similarity
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+PARSER_BACKEND = os.environ.get("SCRAPER_PARSER_BACKEND", "auto")
+
+# 不参与文本提取的标签（与 BeautifulSoup get_text() 的行为一致）
+_SKIP_TEXT_TAGS = ("script", "style", "template")
+# BeautifulSoup 会把只含 ASCII 空白的文本节点折叠成 "\n" 或 " "，其他后端按同样规则处理
+_ASCII_SPACES = "\x20\x0a\x09\x0c\x0d"
+
+# MaoMao 搜索结果与详情页需要的子树：(标签, 属性, 值)，class 按单词匹配
+_SEARCH_SUBTREES = (
+    ("div", "class", "grid-product"),
+)
+_DETAIL_SUBTREES = (
+    ("h1", "class", "product-single__title"),
+    ("span", "class", "product__price"),
+    ("div", "id", "dropdownContent1D"),
+    ("span", "class", "metafield-multi_line_text_field"),
+    ("div", "class", "product__main-photos"),
+)
+
+STORAGE_HEADING = 'Aufbewahrungs- und Verwendungshinweise'
+STORAGE_KEYWORDS = ['Kühl und trocken lagern', 'Nach dem Öffnen']
+DESCRIPTION_EXCLUDE_KEYWORDS = [
+    'aufbewahrungs', 'verwendungshinweise', 'nettogewicht',
+    'kühl und trocken', 'gramm', 'g das produktdesign'
+]
+NUTRITION_KEYS = [
+    "Brennwert",
+    "Fett",
+    "- davon gesättigte Fettsäuren",
+    "Kohlenhydrate",
+    "- davon Zucker",
+    "Eiweiß",
+    "Salz"
+]
+
+
+def _matches_subtree(rules, name, attrs):
+    for tag, attr, value in rules:
+        if name != tag:
+            continue
+        actual = attrs.get(attr)
+        if attr == "class":
+            classes = actual.split() if isinstance(actual, str) else (actual or [])
+            if value in classes:
+                return True
+        elif actual == value:
+            return True
+    return False
+
+
+class _SubtreeStrainer(SoupStrainer):
+    """只允许建立指定子树的 SoupStrainer（需要 beautifulsoup4 >= 4.13）"""
+
+    def __init__(self, rules):
+        super().__init__(name=sorted({tag for tag, _, _ in rules}))
+        self.rules = rules
+
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return _matches_subtree(self.rules, name, attrs or {})
+
+
+class SoupBackend:
+    name = "soup"
+
+    def parse(self, html, subtrees):
+        return BeautifulSoup(html, 'html.parser', parse_only=_SubtreeStrainer(subtrees))
+
+    def select(self, node, css):
+        return node.select(css)
+
+    def attr(self, node, name):
+        return node.get(name)
+
+    def iter_nodes(self, node):
+        for child in node.descendants:
+            if isinstance(child, Tag):
+                yield child.name, child
+            elif type(child) in (NavigableString, CData) and child.parent.name not in _SKIP_TEXT_TAGS:
+                yield None, str(child)
+
+
+def _css_to_xpath(css):
+    # 只支持本模块用到的简单选择器：tag、tag.class、tag#id 以及后代组合
+    steps = []
+    for part in css.split():
+        if "#" in part:
+            tag, ident = part.split("#", 1)
+            steps.append(f"{tag or '*'}[@id='{ident}']")
+        elif "." in part:
+            tag, cls = part.split(".", 1)
+            steps.append(f"{tag or '*'}[contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')]")
+        else:
+            steps.append(part)
+    return ".//" + "//".join(steps)
+
+
+class LxmlBackend:
+    name = "lxml"
+
+    def __init__(self):
+        self._xpaths = {}
+
+    def parse(self, html, subtrees):
+        if not html.strip():
+            html = "<html></html>"
+        return lxml.html.document_fromstring(html)
+
+    def select(self, node, css):
+        xpath = self._xpaths.get(css)
+        if xpath is None:
+            xpath = self._xpaths[css] = lxml.etree.XPath(_css_to_xpath(css))
+        return xpath(node)
+
+    def attr(self, node, name):
+        return node.get(name)
+
+    def iter_nodes(self, node):
+        if node.text and node.tag not in _SKIP_TEXT_TAGS:
+            yield None, node.text
+        for child in node:
+            if isinstance(child.tag, str):
+                yield child.tag, child
+                yield from self.iter_nodes(child)
+            if child.tail:
+                yield None, child.tail
+
+
+class SelectolaxBackend:
+    name = "selectolax"
+
+    def parse(self, html, subtrees):
+        return LexborHTMLParser(html)
+
+    def select(self, node, css):
+        # lexbor 的 css() 可能匹配节点本身，这里只保留后代
+        if isinstance(node, LexborHTMLParser):
+            return node.css(css)
+        return [found for found in node.css(css) if found.mem_id != node.mem_id]
+
+    def attr(self, node, name):
+        attributes = node.attributes
+        value = attributes.get(name)
+        # 没有值的属性在 selectolax 中是 None，其他后端是空字符串
+        if value is None and name in attributes:
+            value = ""
+        return value
+
+    def iter_nodes(self, node):
+        root = node.root if isinstance(node, LexborHTMLParser) else node
+        if root is None:
+            return
+        for child in root.traverse(include_text=True):
+            if child.mem_id == root.mem_id:
+                continue
+            if child.tag == "-text":
+                parent = child.parent
+                if parent is None or parent.tag not in _SKIP_TEXT_TAGS:
+                    yield None, child.text(deep=False)
+            elif not child.tag.startswith(("-", "!")):
+                yield child.tag, child
+
+
+_BACKENDS = {
+    "soup": SoupBackend,
+    "lxml": LxmlBackend,
+    "selectolax": SelectolaxBackend,
+}
+_instances = {}
+
+
+def available_backends():
+    names = ["soup"]
+    if lxml is not None:
+        names.append("lxml")
+    if LexborHTMLParser is not None:
+        names.append("selectolax")
+    return names
+
+
+def get_backend(name=None):
+    """按名称返回解析后端，auto 时选择可用的最快后端，不可用时退回 soup"""
+    name = name or PARSER_BACKEND
+    available = available_backends()
+    if name == "auto":
+        name = available[-1]
+    elif name not in available:
+        print(f"解析后端 {name} 不可用，使用 soup")
+        name = "soup"
+    if name not in _instances:
+        _instances[name] = _BACKENDS[name]()
+    return _instances[name]
+
+
+# 与 BeautifulSoup 的 get_text() / get_text(strip=True) / get_text(separator=...) 保持一致
+def _strings(backend, node):
+    for tag, value in backend.iter_nodes(node):
+        if tag is None:
+            if not value.strip(_ASCII_SPACES):
+                value = "\n" if "\n" in value else " "
+            yield value
+
+
+def _text(backend, node, strip=False, separator=""):
+    strings = _strings(backend, node)
+    if strip:
+        strings = (s.strip() for s in strings)
+        strings = (s for s in strings if s)
+    return separator.join(strings)
+
+
+def _select_one(backend, node, css):
+    found = backend.select(node, css)
+    return found[0] if found else None
+
+
+def _absolute_image_url(src):
+    if src.startswith("//"):
+        return f"https:{src}"
+    elif src.startswith("/"):
+        return f"https://mao-mao.de{src}"
+    return src
+
+
+# Parse MaoMao search results
+@metrics.timed("parse_search", site="maomao")
+def parse_mao_mao_results(html, productname, backend=None):
+    backend = get_backend(backend)
+    root = backend.parse(html, _SEARCH_SUBTREES)
+    results = []
+
+    for div in backend.select(root, 'div.grid-product'):
+        link_tag = _select_one(backend, div, 'a.grid-item__link')
+        name_tag = _select_one(backend, div, 'div.grid-product__title')
+        price_tag = _select_one(backend, div, 'span.grid-product__price--current span.visually-hidden')
+        img_tag = _select_one(backend, div, 'img')
+
+        if name_tag is not None and link_tag is not None:
+            name = _text(backend, name_tag).strip()
+            url = MAOMAO_BASE_URL + backend.attr(link_tag, 'href')
+            price = _text(backend, price_tag).strip() if price_tag is not None else "N/A"
+            image_src = backend.attr(img_tag, 'data-src') or backend.attr(img_tag, 'src')
+            if image_src:
+                image_src = f"https:{image_src}" if image_src.startswith("//") else f"https://mao-mao.de{image_src}"
+
+            results.append({
+                "name": name,
+                "url": url,
+                "price": price,
+                "image_url": image_src
+            })
+
+    return rank_by_similarity(productname, results)
+
+
+def _scan_description(backend, section):
+    """一次遍历 #dropdownContent1D：收集描述段落并定位存储说明"""
+    paragraphs = []
+    rte_content = _select_one(backend, section, 'div.at-rte')
+    if rte_content is not None:
+        # 获取所有段落，但排除存储说明和净重信息
+        for p in backend.select(rte_content, 'p'):
+            text = _text(backend, p, strip=True)
+            if text and not any(keyword in text.lower() for keyword in DESCRIPTION_EXCLUDE_KEYWORDS):
+                paragraphs.append(text)
+
+    # 存储说明标题之后的第一个段落；找不到时退回到包含存储关键词的文本
+    storage_info = ""
+    heading_seen = False
+    keyword_hits = {}
+    for tag, value in backend.iter_nodes(section):
+        if tag is None:
+            if not heading_seen and STORAGE_HEADING in value:
+                heading_seen = True
+            for keyword in STORAGE_KEYWORDS:
+                if keyword not in keyword_hits and keyword in value:
+                    keyword_hits[keyword] = value.strip()
+        elif tag == 'p' and heading_seen:
+            storage_info = _text(backend, value, strip=True)
+            break
+
+    if not storage_info:
+        for keyword in STORAGE_KEYWORDS:
+            if keyword in keyword_hits:
+                storage_info = keyword_hits[keyword]
+                break
+
+    return '\n'.join(paragraphs), storage_info
+
+
+def _scan_metafields(backend, root):
+    """第一个 metafield 是配料表，第二个是营养信息，返回 (配料, 营养信息字典)"""
+    ingredients = ""
+    ingredients_sections = backend.select(root, 'span.metafield-multi_line_text_field')
+    if ingredients_sections:
+        ingredients = _text(backend, ingredients_sections[0], strip=True)
+
+    nutrition_info = {key: "" for key in NUTRITION_KEYS}
+    if len(ingredients_sections) > 1:
+        nutrition_text = _text(backend, ingredients_sections[1], separator='\n').strip()
+        for line in nutrition_text.split('\n'):
+            if ':' in line:
+                key, value = line.split(':', 1)
+                key = key.strip()
+                if key in nutrition_info:
+                    nutrition_info[key] = value.strip().replace(',', '.')
+    return ingredients, nutrition_info
+
+
+def format_maomao_price(value):
+    """Shopify 的价格数值（'1.49'）格式化为与页面相同的 '€1,49'"""
+    return f"€{str(value).replace('.', ',')}" if value else "N/A"
+
+
+# Parse MaoMao detail
+@metrics.timed("parse_detail", site="maomao")
+def parse_mao_mao_detail(html, backend=None):
+    try:
+        backend = get_backend(backend)
+        root = backend.parse(html, _DETAIL_SUBTREES)
+
+        # 基本信息
+        product_name_tag = _select_one(backend, root, 'h1.product-single__title')
+        price_tag = _select_one(backend, root, 'span.product__price span.visually-hidden')
+
+        # 描述与存储信息只在 #dropdownContent1D 子树中查找
+        description = ""
+        storage_info = ""
+        preparation_info = ""
+        description_section = _select_one(backend, root, 'div#dropdownContent1D')
+        if description_section is not None:
+            description, storage_info = _scan_description(backend, description_section)
+
+        # 配料与营养信息
+        ingredients, nutrition_info = _scan_metafields(backend, root)
+
+        # 获取主图片
+        image_src = None
+        image_element = _select_one(backend, root, 'div.product__main-photos img')
+        if image_element is not None:
+            image_src = backend.attr(image_element, 'data-src') or backend.attr(image_element, 'src')
+            if image_src:
+                image_src = _absolute_image_url(image_src)
+
+        return {
+            "name": _text(backend, product_name_tag).strip() if product_name_tag is not None else "未知产品",
+            "price": _text(backend, price_tag).strip() if price_tag is not None else "N/A",
+            "description": description,
+            "storage_info": storage_info,
+            "preparation_info": preparation_info,
+            "ingredients": ingredients,
+            "nutrition": nutrition_info,
+            "image_url": image_src
+        }
+
+    except Exception as e:
+        print(f"提取商品详情时发生错误: {e}")
+        return {}
+
+
+# MaoMao 搜索建议接口（/search/suggest.json）的结果，格式与 parse_mao_mao_results 相同
+@metrics.timed("parse_search", site="maomao")
+def parse_mao_mao_suggest(json_text, productname):
+    try:
+        data = json.loads(json_text)
+        results = []
+
+        for product in data.get("resources", {}).get("results", {}).get("products", []):
+            handle = product.get("handle")
+            if not handle:
+                continue
+            image_src = product.get("image") or (product.get("featured_image") or {}).get("url")
+            results.append({
+                "name": (product.get("title") or "").strip(),
+                "url": f"{MAOMAO_BASE_URL}/products/{handle}",
+                "price": format_maomao_price(product.get("price")),
+                "image_url": _absolute_image_url(image_src) if image_src else None
+            })
+
+        return rank_by_similarity(productname, results)
+    except Exception as e:
+        print(f"解析 MaoMao 搜索建议时发生错误: {e}")
+        return []
+
+
+# MaoMao 商品 JSON（/products/<handle>.js，价格单位为分），格式与 parse_mao_mao_detail 相同；
+# 配料和营养信息是只在商品页中渲染的 metafield，JSON 中没有，这两项为空
+@metrics.timed("parse_detail", site="maomao")
+def parse_mao_mao_product(json_text, backend=None):
+    try:
+        data = json.loads(json_text)
+
+        # 商品描述就是页面 #dropdownContent1D 中 div.at-rte 的内容，按页面结构包装后用同样的规则提取
+        description = ""
+        storage_info = ""
+        if data.get("description"):
+            backend = get_backend(backend)
+            root = backend.parse(
+                f'<div id="dropdownContent1D"><div class="at-rte">{data["description"]}</div></div>', _DETAIL_SUBTREES
+            )
+            description, storage_info = _scan_description(backend, _select_one(backend, root, 'div#dropdownContent1D'))
+
+        price = data.get("price")
+        image_src = data.get("featured_image")
+
+        return {
+            "name": (data.get("title") or "").strip() or "未知产品",
+            "price": format_maomao_price(f"{price / 100:.2f}") if isinstance(price, (int, float)) else "N/A",
+            "description": description,
+            "storage_info": storage_info,
+            "preparation_info": "",
+            "ingredients": "",
+            "nutrition": {key: "" for key in NUTRITION_KEYS},
+            "image_url": _absolute_image_url(image_src) if image_src else None
+        }
+    except Exception as e:
+        print(f"解析 MaoMao 商品 JSON 时发生错误: {e}")
+        return {}
+
+
+# 价格跟踪只需要价格（分）和是否有货：MaoMao 商品 JSON（/products/<handle>.js）
+@metrics.timed("parse_offer", site="maomao")
+def parse_mao_mao_offer(json_text):
+    try:
+        data = json.loads(json_text)
+        price = data.get("price")
+        available = data.get("available")
+        return {
+            "name": (data.get("title") or "").strip(),
+            "price_cents": int(price) if isinstance(price, (int, float)) else None,
+            "available": available if isinstance(available, bool) else None,
+        }
+    except Exception as e:
+        print(f"解析 MaoMao 价格时发生错误: {e}")
+        return {}
+
+
+# 商品库同步：Shopify /products.json 的一页，返回 ({handle: 商品}, None)；总页数未知，抓到空页为止
+@metrics.timed("parse_catalog", site="maomao")
+def parse_mao_mao_catalog(json_text):
+    products = {}
+    for item in json.loads(json_text).get("products", []):
+        handle = item.get("handle")
+        if not handle:
+            continue
+        variants = item.get("variants") or [{}]
+        price = variants[0].get("price")
+        images = item.get("images") or [{}]
+        products[handle] = {
+            "name": (item.get("title") or "").strip(),
+            "price": format_maomao_price(price),
+            "url": f"{MAOMAO_BASE_URL}/products/{handle}",
+            "image_url": images[0].get("src"),
+            "fingerprint": f"{item.get('updated_at')}|{price}|{item.get('title')}",
+        }
+    return products, None
+
+
+# Parse AsianFoodLovers search results
+@metrics.timed("parse_search", site="asianfood")
+def parse_asian_food_results(json_text, productname):
+    try:
+        data = json.loads(json_text)
+        results = []
+
+        for product in data.get("products", []):
+            code = product.get('code')
+            name = product.get('commercialName', '')
+            price = f"{product.get('price', {}).get('value', 'N/A')} €"
+
+            results.append({
+                "name": name,
+                "url": code,
+                "price": price
+            })
+
+        return rank_by_similarity(productname, results)
+    except Exception as e:
+        print(f"解析 AsianFoodLovers 结果时发生错误: {e}")
+        return []
+
+
+# AsianFoodLovers 搜索结果的总页数
+@metrics.timed("parse_pages", site="asianfood")
+def parse_asian_food_total_pages(json_text):
+    try:
+        return int(json.loads(json_text).get("pagination", {}).get("totalPages", 1))
+    except Exception as e:
+        print(f"解析 AsianFoodLovers 分页信息时发生错误: {e}")
+        return 1
+
+
+# AsianFoodLovers 详情接口中的价格和库存状态（没有库存信息时按 purchasable 判断）
+@metrics.timed("parse_offer", site="asianfood")
+def parse_asian_food_offer(json_text):
+    try:
+        data = json.loads(json_text)
+        value = (data.get("price") or {}).get("value")
+        stock = (data.get("stock") or {}).get("stockLevelStatus")
+        available = stock != "outOfStock" if stock else data.get("purchasable")
+        return {
+            "name": data.get("commercialName", ""),
+            "price_cents": round(value * 100) if isinstance(value, (int, float)) else None,
+            "available": available if isinstance(available, bool) else None,
+        }
+    except Exception as e:
+        print(f"解析 AsianFoodLovers 价格时发生错误: {e}")
+        return {}
+
+
+# Parse AsianFoodLovers detail
+@metrics.timed("parse_detail", site="asianfood")
+def parse_asian_food_detail(json_text):
+    try:
+        data = json.loads(json_text)
+        image_url = None
+        if 'images' in data and len(data['images']) > 0:
+            image_url = data['images'][0].get('url')
+
+        return {
+            "name": data.get('commercialName', ''),
+            "price": f"{data.get('price', {}).get('value', '')} €",
+            "description": data.get('description', ''),
+            "ingredients": data.get('ingredients', ''),
+            "image_url": image_url,
+            "url": data.get('code', ''),
+            "allergyInformation": '; '.join([a['description'] for a in data.get('allergyInformation', [])]),
+            "origin": '; '.join([c['name'] for c in data.get('countriesOfOrigin', [])])
+        }
+    except Exception as e:
+        print(f"解析 AsianFoodLovers 详情时发生错误: {e}")
+        return {}
+
+
+# 商品库同步：OCC products/search 的一页，返回 ({code: 商品}, 总页数)
+@metrics.timed("parse_catalog", site="asianfood")
+def parse_asian_food_catalog(json_text):
+    data = json.loads(json_text)
+    products = {}
+    for item in data.get("products", []):
+        code = item.get("code")
+        if not code:
+            continue
+        name = item.get("commercialName", "")
+        price = f"{item.get('price', {}).get('value', 'N/A')} €"
+        products[code] = {
+            "name": name,
+            "price": price,
+            "url": code,
+            "image_url": None,
+            "fingerprint": f"{name}|{price}",
+        }
+    return products, int(data.get("pagination", {}).get("totalPages", 1))
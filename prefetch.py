@@ -0,0 +1,112 @@
+# ✅ 商品详情的预测性预取
+#
+# 搜索结果一显示，就在后台抓取并解析当前页（以及下一页）商品的详情，用户点击“查看详情”时
+# 通常已经有结果。任务放在优先级队列中由固定数量的 worker 处理（限制并发），
+# 用户真正点击的商品会被提升到最高优先级；结果保存在进程内共享的 LRU 缓存中，所有会话共用。
+import asyncio
+import itertools
+from collections import OrderedDict
+
+import metrics
+from http_client import get_loop, run_in_pool
+
+# 优先级：数字越小越先处理
+PRIORITY_CLICKED = 0
+PRIORITY_VISIBLE = 1
+PRIORITY_NEXT_PAGE = 2
+
+PREFETCH_WORKERS = 4        # 同时抓取的详情数
+MAX_CACHED_DETAILS = 1000   # 共享缓存中保存的详情数
+
+
+class DetailPrefetcher:
+    def __init__(self, fetcher, workers=PREFETCH_WORKERS, max_cached=MAX_CACHED_DETAILS):
+        # fetcher: async def (site, url) -> dict
+        self.fetcher = fetcher
+        self.workers = workers
+        self.max_cached = max_cached
+        # 以下状态只在连接池事件循环中访问
+        self._queue = None
+        self._counter = itertools.count()
+        self._pending = {}      # key -> 当前排队的最高优先级
+        self._futures = {}      # key -> 排队或抓取中的任务完成时 resolve 的 Future
+        self._results = OrderedDict()
+
+    def _start(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            for _ in range(self.workers):
+                asyncio.ensure_future(self._worker())
+
+    def cached(self, site, url):
+        """直接读取共享缓存（可在任意线程调用），没有时返回 None"""
+        return self._results.get((site, url))
+
+    def _schedule(self, site, url, priority):
+        key = (site, url)
+        if key in self._results:
+            return
+        if key not in self._futures:
+            self._futures[key] = asyncio.get_running_loop().create_future()
+        elif key not in self._pending:
+            return  # 正在抓取
+        # 已经在队列中且优先级不低时不重复入队；否则以更高优先级再入队一次（旧条目被 worker 跳过）
+        if key in self._pending and self._pending[key] <= priority:
+            return
+        self._pending[key] = priority
+        self._queue.put_nowait((priority, next(self._counter), key))
+
+    async def _worker(self):
+        while True:
+            priority, _, key = await self._queue.get()
+            try:
+                if self._pending.get(key) != priority:
+                    continue
+                del self._pending[key]
+                await self._run(key)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, key):
+        try:
+            site, url = key
+            details = await self.fetcher(site, url)
+        except Exception as e:
+            print(f"预取详情时发生错误: {e}")
+            details = {}
+        # 空结果（请求失败）不缓存，下次点击时重新抓取
+        if details:
+            self._results[key] = details
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_cached:
+                self._results.popitem(last=False)
+        self._futures.pop(key).set_result(details)
+
+    async def _prefetch(self, site, urls, priority):
+        self._start()
+        for url in urls:
+            if url:
+                self._schedule(site, url, priority)
+
+    async def _get(self, site, url):
+        self._start()
+        key = (site, url)
+        if key in self._results:
+            self._results.move_to_end(key)
+            return self._results[key]
+        # 用户点击的商品提升到最高优先级，排在所有预取任务之前
+        self._schedule(site, url, PRIORITY_CLICKED)
+        return await asyncio.shield(self._futures[key])
+
+    def prefetch(self, site, urls, priority=PRIORITY_VISIBLE):
+        """从页面线程提交预取任务，立即返回"""
+        asyncio.run_coroutine_threadsafe(self._prefetch(site, list(urls), priority), get_loop())
+
+    async def get(self, site, url):
+        """获取详情：已预取则直接返回，正在抓取则等待，否则以最高优先级排队抓取"""
+        cached = self.cached(site, url)
+        if cached is not None:
+            metrics.inc("prefetch", site, "hit")
+            return cached
+        metrics.inc("prefetch", site, "miss")
+        return await run_in_pool(self._get(site, url))
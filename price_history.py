@@ -0,0 +1,297 @@
+# ✅ 价格与库存历史
+#
+# 定期重新检查关注列表中商品（MaoMao 商品链接、AsianFoodLovers 商品编码）的价格和是否有货：
+# - 请求站点适配器声明的价格接口（MaoMao 为 /products/<handle>.js，AsianFoodLovers 为 OCC 详情接口），
+#   不使用响应缓存的有效期，而是向上游确认（有 ETag / Last-Modified 时为条件请求，304 不传输响应体）；
+# - 响应摘要与上次检查相同时直接跳过，不解析；
+# - 价格或库存变化时才追加一条观测记录（只存变化点），未变化时只更新检查时间。观测表以
+#   (site, code, ts) 为主键、WITHOUT ROWID 存储，按商品和时间范围查询是一次索引范围扫描。
+# 页面进程内每 TRACK_INTERVAL 秒检查一次到期的商品（设为 0 关闭），也可以用命令行运行（可放进 cron）：
+#     python price_history.py watch maomao https://mao-mao.de/products/<handle>
+#     python price_history.py watch asianfood 100003
+#     python price_history.py check [--every 3600]
+#     python price_history.py history maomao <handle> [--days 30]
+import argparse
+import asyncio
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+import metrics
+import sites
+from catalog import product_code
+from http_client import fetch_response, get_loop
+from parse_pool import run_in_thread
+from resilience import FetchError
+
+HISTORY_PATH = os.environ.get("SCRAPER_HISTORY_PATH", os.path.join(".cache", "price_history.sqlite3"))
+TRACK_INTERVAL = int(os.environ.get("SCRAPER_TRACK_INTERVAL", 6 * 3600))   # 每个商品的检查间隔（秒）
+SCHEDULER_TICK = 60         # 页面进程内查找到期商品的间隔（秒）
+CHECK_CONCURRENCY = 4       # 同时检查的商品数
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS watchlist (
+    site TEXT NOT NULL,
+    code TEXT NOT NULL,
+    url TEXT NOT NULL,
+    name TEXT,
+    content_hash TEXT,
+    last_checked INTEGER,
+    added_at INTEGER NOT NULL,
+    PRIMARY KEY (site, code)
+);
+CREATE TABLE IF NOT EXISTS observations (
+    site TEXT NOT NULL,
+    code TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    price_cents INTEGER,
+    available INTEGER,
+    PRIMARY KEY (site, code, ts)
+) WITHOUT ROWID;
+"""
+
+
+class PriceHistoryStore:
+    def __init__(self, path=HISTORY_PATH):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def watch(self, site, code, url, name=None):
+        self._conn().execute(
+            "INSERT OR IGNORE INTO watchlist (site, code, url, name, added_at) VALUES (?, ?, ?, ?, ?)",
+            (site, code, url, name, int(time.time()))
+        )
+
+    def unwatch(self, site, code):
+        """取消关注，已有的历史记录保留"""
+        self._conn().execute("DELETE FROM watchlist WHERE site = ? AND code = ?", (site, code))
+
+    def is_watched(self, site, code):
+        return self._conn().execute(
+            "SELECT 1 FROM watchlist WHERE site = ? AND code = ?", (site, code)
+        ).fetchone() is not None
+
+    def watchlist(self):
+        """[(site, code, url, name, last_checked)]"""
+        return self._conn().execute(
+            "SELECT site, code, url, name, last_checked FROM watchlist ORDER BY site, added_at"
+        ).fetchall()
+
+    def due(self, max_age):
+        """超过 max_age 秒没有检查的商品：[(site, code, content_hash)]"""
+        return self._conn().execute(
+            "SELECT site, code, content_hash FROM watchlist WHERE last_checked IS NULL OR last_checked <= ?",
+            (int(time.time() - max_age),)
+        ).fetchall()
+
+    def last_checked(self, site, code):
+        row = self._conn().execute(
+            "SELECT last_checked FROM watchlist WHERE site = ? AND code = ?", (site, code)
+        ).fetchone()
+        return row[0] if row else None
+
+    def mark_checked(self, site, code, content_hash, ts, name=None):
+        self._conn().execute(
+            "UPDATE watchlist SET content_hash = ?, last_checked = ?, name = COALESCE(?, name) "
+            "WHERE site = ? AND code = ?",
+            (content_hash, ts, name or None, site, code)
+        )
+
+    def record(self, site, code, ts, price_cents, available):
+        """与最近一条观测不同时追加，返回是否追加"""
+        available = None if available is None else int(available)
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            latest = conn.execute(
+                "SELECT price_cents, available FROM observations WHERE site = ? AND code = ? ORDER BY ts DESC LIMIT 1",
+                (site, code)
+            ).fetchone()
+            changed = latest != (price_cents, available)
+            if changed:
+                conn.execute(
+                    "INSERT OR REPLACE INTO observations (site, code, ts, price_cents, available) VALUES (?, ?, ?, ?, ?)",
+                    (site, code, ts, price_cents, available)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return changed
+
+    def history(self, site, code, start=None, end=None):
+        """时间范围内的变化点 [(ts, price_cents, available)]；包含范围开始时有效的那一条（时间记为 start）"""
+        conn = self._conn()
+        start = int(start) if start is not None else None
+        end = int(end) if end is not None else 2 ** 62
+        points = []
+        if start is not None:
+            before = conn.execute(
+                "SELECT ts, price_cents, available FROM observations "
+                "WHERE site = ? AND code = ? AND ts < ? ORDER BY ts DESC LIMIT 1",
+                (site, code, start)
+            ).fetchone()
+            if before is not None:
+                points.append((start, before[1], before[2]))
+        points += conn.execute(
+            "SELECT ts, price_cents, available FROM observations "
+            "WHERE site = ? AND code = ? AND ts >= ? AND ts <= ? ORDER BY ts",
+            (site, code, start or 0, end)
+        ).fetchall()
+        return [(ts, price, None if available is None else bool(available)) for ts, price, available in points]
+
+
+_store = None
+_lock = threading.Lock()
+
+
+def get_store():
+    """返回进程内共享的 PriceHistoryStore 实例"""
+    global _store
+    with _lock:
+        if _store is None:
+            _store = PriceHistoryStore()
+        return _store
+
+
+def watch(site, url, name=None):
+    """加入关注列表，返回商品编码；url 为搜索结果中的 url 字段（AsianFoodLovers 为商品编码）"""
+    code = product_code(site, url)
+    get_store().watch(site, code, url, name)
+    return code
+
+
+async def check(site, code, content_hash=None):
+    """检查一个商品，返回 unchanged（响应未变，未解析）/ same（价格和库存未变）/ changed"""
+    adapter = sites.get(site)
+    url, params = adapter.offer_request(code)
+    response = await fetch_response(url, params=params, revalidate=True)
+    store = get_store()
+    now = int(time.time())
+    if content_hash is not None and response.digest == content_hash:
+        store.mark_checked(site, code, response.digest, now)
+        status = "unchanged"
+    else:
+        offer = await run_in_thread(adapter.extract, "offer", response.body)
+        if not offer:
+            raise ValueError(f"无法解析 {site} 商品 {code} 的价格")
+        changed = store.record(site, code, now, offer["price_cents"], offer["available"])
+        store.mark_checked(site, code, response.digest, now, offer["name"])
+        status = "changed" if changed else "same"
+    metrics.inc("price_check", site, status)
+    return status
+
+
+async def check_due(max_age=TRACK_INTERVAL, concurrency=CHECK_CONCURRENCY):
+    """检查所有到期的商品，返回 {状态: 商品数}"""
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = Counter()
+
+    async def check_one(site, code, content_hash):
+        async with semaphore:
+            try:
+                counts[await check(site, code, content_hash)] += 1
+            except (FetchError, ValueError) as e:
+                print(f"检查 {site} 商品 {code} 的价格时发生错误: {e}")
+                metrics.inc("price_check", site, "error")
+                counts["error"] += 1
+
+    await asyncio.gather(*(check_one(*row) for row in get_store().due(max_age)))
+    return dict(counts)
+
+
+async def _scheduler(interval):
+    while True:
+        try:
+            await check_due(interval)
+        except Exception as e:
+            print(f"价格跟踪时发生错误: {e}")
+        await asyncio.sleep(SCHEDULER_TICK)
+
+
+_scheduler_future = None
+
+
+def start_scheduler(interval=TRACK_INTERVAL):
+    """在连接池事件循环中定时检查到期的商品（每个进程只启动一次，interval 为 0 时不启动）"""
+    global _scheduler_future
+    with _lock:
+        if interval and (_scheduler_future is None or _scheduler_future.done()):
+            _scheduler_future = asyncio.run_coroutine_threadsafe(_scheduler(interval), get_loop())
+
+
+def chart_rows(points, until=None):
+    """把变化点展开成阶梯折线的数据行（价格在两次变化之间保持不变），延伸到 until（最近一次检查）"""
+    rows = []
+    previous = None
+    for ts, price_cents, available in points:
+        if price_cents is None:
+            continue
+        price = price_cents / 100
+        if previous is not None and previous != price:
+            rows.append({"时间": datetime.datetime.fromtimestamp(ts), "价格 €": previous})
+        rows.append({"时间": datetime.datetime.fromtimestamp(ts), "价格 €": price})
+        previous = price
+    if rows and until is not None and datetime.datetime.fromtimestamp(until) > rows[-1]["时间"]:
+        rows.append({"时间": datetime.datetime.fromtimestamp(until), "价格 €": previous})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="价格与库存历史")
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name in ("watch", "unwatch"):
+        command = commands.add_parser(name, help="加入关注列表" if name == "watch" else "移出关注列表")
+        command.add_argument("site", choices=sites.SITES)
+        command.add_argument("url", help="MaoMao 商品链接或 AsianFoodLovers 商品编码")
+    commands.add_parser("list", help="显示关注列表")
+    check_command = commands.add_parser("check", help="检查到期的商品")
+    check_command.add_argument("--max-age", type=int, default=0, help="只检查超过该秒数没有检查的商品（默认全部）")
+    check_command.add_argument("--every", type=int, default=0, help="常驻运行，每隔该秒数检查一次")
+    history_command = commands.add_parser("history", help="显示一个商品的价格变化")
+    history_command.add_argument("site", choices=sites.SITES)
+    history_command.add_argument("url", help="MaoMao 商品链接或 handle，或 AsianFoodLovers 商品编码")
+    history_command.add_argument("--days", type=float, help="只显示最近几天")
+    args = parser.parse_args()
+
+    store = get_store()
+    if args.command == "watch":
+        print(f"已关注 {args.site} {watch(args.site, args.url)}")
+    elif args.command == "unwatch":
+        store.unwatch(args.site, product_code(args.site, args.url))
+    elif args.command == "list":
+        for site, code, url, name, last_checked in store.watchlist():
+            checked = time.strftime("%Y-%m-%d %H:%M", time.localtime(last_checked)) if last_checked else "从未检查"
+            print(f"{site}\t{code}\t{name or ''}\t{checked}")
+    elif args.command == "check":
+        while True:
+            print(asyncio.run(check_due(args.max_age)))
+            if not args.every:
+                break
+            time.sleep(args.every)
+    elif args.command == "history":
+        start = time.time() - args.days * 86400 if args.days else None
+        for ts, price_cents, available in store.history(args.site, product_code(args.site, args.url), start):
+            price = f"€{price_cents / 100:.2f}" if price_cents is not None else "N/A"
+            stock = {True: "有货", False: "缺货", None: ""}[available]
+            print(f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(ts))}\t{price}\t{stock}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# ✅ 请求策略：类型化错误、令牌桶限流、熔断器
+#
+# http_client 按主机为每个请求套用这些策略：
+# - 每个主机一个令牌桶，防止一批用户同时搜索时触发网站的限流；
+# - 429 / 5xx / 超时 / 连接错误属于临时错误，可以带抖动地重试，且绝不能被当成结果缓存；
+# - 主机连续失败达到阈值后熔断一段时间，期间直接失败，冷却后只放行一个探测请求（半开）。
+import asyncio
+import time
+
+
+class FetchError(Exception):
+    """请求失败的基类"""
+
+    def __init__(self, message, url=None, status=None):
+        super().__init__(message)
+        self.url = url
+        self.status = status
+
+
+class TransientFetchError(FetchError):
+    """临时错误（超时、连接失败、429、5xx），可以重试"""
+
+    def __init__(self, message, url=None, status=None, retry_after=None):
+        super().__init__(message, url=url, status=status)
+        self.retry_after = retry_after
+
+
+class PermanentFetchError(FetchError):
+    """永久错误（404 等 4xx），重试没有意义"""
+
+
+class CircuitOpenError(TransientFetchError):
+    """主机处于熔断状态，请求没有发出"""
+
+
+class TokenBucket:
+    """令牌桶：平均每秒 rate 个请求，允许 burst 个突发；只在单个事件循环中使用"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self):
+        """有令牌时立即取出并返回 True，否则返回 False，不等待"""
+        self._refill()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后熔断 reset_timeout 秒，之后半开放行一个探测请求"""
+
+    def __init__(self, host, failure_threshold=5, reset_timeout=30):
+        self.host = host
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None
+
+    def before_request(self):
+        """熔断中时抛出 CircuitOpenError；返回 True 表示这个请求是半开状态下的探测请求"""
+        if self._opened_at is None:
+            return False
+        if self._probing or time.monotonic() - self._opened_at < self.reset_timeout:
+            raise CircuitOpenError(f"{self.host} 暂时不可用（熔断中）")
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def release_probe(self):
+        """探测请求被取消（没有结果）时由持有探测的请求调用，下一个请求重新探测"""
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._probing or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._probing = False
@@ -0,0 +1,140 @@
+# ✅ 持久化 HTTP 响应缓存（SQLite）
+#
+# 以 URL + 参数为键缓存原始响应体，放在 fetch() 前面：
+# - 未过期的条目直接返回，不访问网络；
+# - 过期但带有 ETag / Last-Modified 的条目发送条件请求，304 时只刷新过期时间；
+# - 总大小超过上限时按最近访问时间（LRU）淘汰。
+# 数据库使用 WAL 模式，重启后依然有效，并且可以被多个 Streamlit worker 进程共享。
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from urllib.parse import urlencode, urlsplit
+
+CACHE_PATH = os.environ.get("SCRAPER_CACHE_PATH", os.path.join(".cache", "responses.sqlite3"))
+MAX_CACHE_BYTES = 200 * 1024 * 1024   # 缓存总大小上限
+DEFAULT_TTL = 3600                    # 未单独配置的站点的默认有效期（秒）
+
+# 各站点的有效期（秒），按主机名匹配
+SITE_TTLS = {
+    "mao-mao.de": 3600,
+    "api.c2k2y3nvy0-heuschena1-p1-public.model-t.cc.commerce.ondemand.com": 1800,
+}
+
+CachedResponse = namedtuple("CachedResponse", "key body digest etag last_modified expires_at")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    body TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    size INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+
+
+def make_key(url, params=None):
+    """由 URL 和排序后的参数生成缓存键"""
+    if params:
+        url = f"{url}?{urlencode(sorted((str(k), str(v)) for k, v in params.items()))}"
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def ttl_for(url):
+    return SITE_TTLS.get(urlsplit(url).hostname or "", DEFAULT_TTL)
+
+
+class ResponseCache:
+    def __init__(self, path=CACHE_PATH, max_bytes=MAX_CACHE_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self):
+        # sqlite3 连接不能跨线程使用，每个线程各持有一个
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute(
+            "SELECT key, body, digest, etag, last_modified, expires_at FROM responses WHERE key = ?",
+            (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn().execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        return CachedResponse(*row)
+
+    def put(self, key, url, body, etag=None, last_modified=None, ttl=None):
+        now = time.time()
+        ttl = ttl_for(url) if ttl is None else ttl
+        digest = hashlib.sha1(body.encode("utf-8")).hexdigest()
+        size = len(body.encode("utf-8"))
+        self._conn().execute(
+            "INSERT OR REPLACE INTO responses "
+            "(key, url, body, digest, etag, last_modified, size, fetched_at, expires_at, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, url, body, digest, etag, last_modified, size, now, now + ttl, now)
+        )
+        self._evict()
+        return CachedResponse(key, body, digest, etag, last_modified, now + ttl)
+
+    def revalidated(self, entry, url, ttl=None):
+        """服务器返回 304 后延长条目的有效期"""
+        now = time.time()
+        expires_at = now + (ttl_for(url) if ttl is None else ttl)
+        self._conn().execute(
+            "UPDATE responses SET expires_at = ?, last_access = ? WHERE key = ?",
+            (expires_at, now, entry.key)
+        )
+        return entry._replace(expires_at=expires_at)
+
+    def _evict(self):
+        conn = self._conn()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # 淘汰到上限的 90%，避免每次写入都触发淘汰
+        target = total - int(self.max_bytes * 0.9)
+        freed = 0
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            victims.append((key,))
+            freed += size
+            if freed >= target:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+
+    def clear(self):
+        self._conn().execute("DELETE FROM responses")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """返回进程内共享的 ResponseCache 实例"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
@@ -0,0 +1,183 @@
+# ✅ 站点搜索与详情抓取
+#
+# 页面（streamlit_app.py）和无界面批量模式（batch.py）共用的抓取引擎，按站点适配器（sites.py）中声明的
+# 接口和提取规则工作，不包含任何站点专属的分支：
+# 先查本地商品库，没有时经共享连接池请求网站，解析结果在页面中由 st.cache_data 按响应摘要缓存；
+# 没有 Streamlit 运行时的时候（批量模式、导出等命令行）使用进程内的 LRU 缓存，不导入 streamlit。
+# 缓存查找和解析都在解析工作池中进行（见 parse_pool.py），
+# 不会阻塞连接池事件循环上的其他请求。
+# 页面和批量模式对所有注册的网站同时发起搜索，每个网站有自己的截止时间和并发预算，
+# 总耗时取决于最慢的网站而不是网站数。
+# 所有搜索结果和详情中的商品名都会记入自动补全索引（见 autocomplete.py）。
+import asyncio
+import copy
+import inspect
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+import autocomplete
+import catalog
+import metrics
+import sites
+from http_client import fetch_response
+from parse_pool import run_in_thread
+from resilience import FetchError
+from similar import rank_by_similarity
+
+PARSE_CACHE_TTL = 3600          # 解析结果缓存的有效期（秒）
+LOCAL_CACHE_ENTRIES = 1024      # 没有 Streamlit 运行时的时候，进程内缓存的最大条目数
+
+# 记录缓存函数体是否执行（即缓存未命中），函数体在调用线程中同步执行
+_cache_state = threading.local()
+
+
+def _local_cache(max_entries, ttl):
+    """与 st.cache_data 用法相同的进程内 LRU 缓存：以下划线开头的参数不参与缓存键，返回结果的副本"""
+    def decorator(func):
+        names = list(inspect.signature(func).parameters)
+        entries = OrderedDict()
+        lock = threading.Lock()
+
+        @wraps(func)
+        def wrapper(*args):
+            key = tuple(arg for name, arg in zip(names, args) if not name.startswith("_"))
+            now = time.monotonic()
+            with lock:
+                entry = entries.get(key)
+                if entry is not None and entry[0] > now:
+                    entries.move_to_end(key)
+                    return copy.deepcopy(entry[1])
+            result = func(*args)
+            with lock:
+                entries[key] = (now + ttl, result)
+                entries.move_to_end(key)
+                while len(entries) > max_entries:
+                    entries.popitem(last=False)
+            return copy.deepcopy(result)
+        return wrapper
+    return decorator
+
+
+def _parse_cache():
+    # 页面运行时 streamlit 已经导入；命令行中不导入 streamlit，也就没有 "No runtime found" 警告
+    if "streamlit" in sys.modules:
+        from streamlit import runtime
+        if runtime.exists():
+            import streamlit as st
+            # 搜索在后台线程中运行（没有页面上下文），进度由各选项卡的搜索状态显示，这里不显示 spinner
+            return st.cache_data(show_spinner=False, ttl=PARSE_CACHE_TTL)
+    return _local_cache(LOCAL_CACHE_ENTRIES, PARSE_CACHE_TTL)
+
+
+# Cache the search results
+# 响应体以下划线开头的参数传入，不对其做哈希，缓存键是 (站点, 响应类型, 关键词, 响应摘要)
+@_parse_cache()
+def cache_search_results(_content, site, kind, productname, digest):
+    _cache_state.miss = True
+    return sites.get(site).extract(kind, _content, productname)
+
+
+# Cache the detail results
+# 详情由后台预取器抓取，点击时的 spinner 在页面中显示
+@_parse_cache()
+def cache_detail_results(_content, site, kind, digest):
+    _cache_state.miss = True
+    return sites.get(site).extract(kind, _content)
+
+
+# 调用缓存的解析函数并记录命中 / 未命中；命中时的耗时就是参数哈希和结果复制的开销
+def cached_parse(func, site, *args):
+    if not metrics.METRICS_ENABLED:
+        return func(*args)
+    _cache_state.miss = False
+    start = time.perf_counter()
+    result = func(*args)
+    outcome = "miss" if _cache_state.miss else "hit"
+    metrics.observe(f"cache_data_{outcome}", time.perf_counter() - start, site)
+    metrics.inc("cache_data", site, outcome)
+    return result
+
+
+async def async_search(site, productname):
+    """搜索一个网站的第一页结果；请求失败时抛出 FetchError，不会把空结果写入缓存"""
+    results = await _search(sites.get(site), productname)
+    autocomplete.remember_results(results)
+    return results
+
+
+async def _search(adapter, productname):
+    # 优先使用本地商品库，没有结果时才实时请求网站
+    local_results = catalog.search(adapter.name, productname)
+    if local_results:
+        return local_results
+
+    url, params = adapter.search_request(productname)
+    response = await fetch_response(url, params=params)
+    return await run_in_thread(
+        cached_parse, cache_search_results, adapter.name, response.body, adapter.name, adapter.search_kind,
+        productname, response.digest
+    )
+
+
+# 抓取第一页之后的所有页面（只有分页的网站），与第一页结果合并（按 url 去重）后重新排序
+async def async_search_more(site, productname, first_results):
+    adapter = sites.get(site)
+    # 结果来自本地商品库时已经是完整结果
+    if adapter.max_pages <= 1 or catalog.search(site, productname):
+        return first_results
+
+    # 第一页刚刚请求过，这里命中响应缓存
+    url, params = adapter.search_request(productname)
+    try:
+        first = await fetch_response(url, params=params)
+    except FetchError as e:
+        print(f"加载 {adapter.label} 更多结果时发生错误: {e}")
+        return first_results
+    total_pages = min(await run_in_thread(adapter.extract, "pages", first.body), adapter.max_pages)
+
+    semaphore = asyncio.Semaphore(adapter.page_concurrency)
+
+    # 单页失败时跳过该页，保留其他页面的结果
+    async def fetch_page(page):
+        async with semaphore:
+            url, params = adapter.search_request(productname, page)
+            try:
+                response = await fetch_response(url, params=params)
+            except FetchError as e:
+                print(f"加载 {adapter.label} 第 {page + 1} 页时发生错误: {e}")
+                return []
+        return await run_in_thread(adapter.extract, adapter.search_kind, response.body, productname)
+
+    pages = await asyncio.gather(*(fetch_page(page) for page in range(1, total_pages)))
+
+    autocomplete.remember_results([product for page in pages for product in page])
+    merged = {}
+    for product in first_results + [product for page in pages for product in page]:
+        merged.setdefault(product["url"], product)
+    return rank_by_similarity(productname, list(merged.values()))
+
+
+async def async_get_detail(site, url):
+    """获取商品详情，url 为搜索结果中的 url 字段"""
+    details = catalog.get_detail(site, url)
+    if details:
+        autocomplete.remember_detail(details)
+        return details
+
+    adapter = sites.get(site)
+    responses = await asyncio.gather(*(
+        fetch_response(request_url, params=params) for request_url, params in adapter.detail_requests(url)
+    ))
+    # 多个响应时提取规则收到按顺序组成的元组，缓存键为各响应摘要的组合
+    content = responses[0].body if len(responses) == 1 else tuple(response.body for response in responses)
+    details = await run_in_thread(
+        cached_parse, cache_detail_results, site, content, site, adapter.detail_kinds[0],
+        ":".join(response.digest for response in responses)
+    )
+    catalog.remember_detail(site, url, details)
+    autocomplete.remember_detail(details)
+    return details
+
@@ -1,7 +1,116 @@
+import heapq
+from functools import lru_cache
+
+import metrics
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# ✅ 分词结果缓存：同一个商品名 / 关键词只分词一次
+@lru_cache(maxsize=65536)
+def tokenize(text):
+    return frozenset(text.lower().split())
+
+
+def _jaccard(set1, set2):
+    intersection = len(set1 & set2)
+    union = len(set1) + len(set2) - intersection
+    return intersection / union if union else 0.0
+
+
 # ✅ Jaccard 相似度实现
 def jaccard_similarity(str1, str2):
-    set1 = set(str1.lower().split())
-    set2 = set(str2.lower().split())
-    intersection = set1.intersection(set2)
-    union = set1.union(set2)
-    return len(intersection) / len(union) if union else 0.0
\ No newline at end of file
+    return _jaccard(tokenize(str1), tokenize(str2))
+
+
+# ✅ 批量打分：关键词只分词一次，候选商品名使用缓存的词集合
+def jaccard_scores(query, names):
+    query_tokens = tokenize(query)
+    return [_jaccard(query_tokens, tokenize(name)) for name in names]
+
+
+# ✅ 给结果字典写入 similarity 并按相似度降序返回（相同分数保持原顺序），k 为 None 时返回全部
+@metrics.timed("similarity")
+def rank_by_similarity(query, items, k=None, key="name"):
+    for item, score in zip(items, jaccard_scores(query, [item[key] for item in items])):
+        item["similarity"] = score
+    if k is None or k >= len(items):
+        return sorted(items, key=lambda x: x["similarity"], reverse=True)
+    # 部分选择，只保留前 k 个
+    return heapq.nlargest(k, items, key=lambda x: x["similarity"])
+
+
+# ✅ 面向本地商品库的倒排索引：打分只访问与关键词有公共词的商品
+class TokenIndex:
+    def __init__(self, names=()):
+        self.names = []
+        self._sizes = []
+        self._postings = {}
+        self._arrays = None
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name):
+        """加入一个商品名，返回其下标"""
+        idx = len(self.names)
+        tokens = tokenize(name)
+        self.names.append(name)
+        self._sizes.append(len(tokens))
+        for token in tokens:
+            self._postings.setdefault(token, []).append(idx)
+        self._arrays = None
+        return idx
+
+    def _numpy_arrays(self):
+        if self._arrays is None:
+            postings = {token: np.asarray(ids, dtype=np.int64) for token, ids in self._postings.items()}
+            self._arrays = (np.asarray(self._sizes, dtype=np.float64), postings)
+        return self._arrays
+
+    def scores(self, query):
+        """返回所有商品与关键词的 Jaccard 相似度（下标与 names 对应）"""
+        query_tokens = tokenize(query)
+        if np is not None:
+            sizes, postings = self._numpy_arrays()
+            intersection = np.zeros(len(self.names), dtype=np.float64)
+            for token in query_tokens:
+                ids = postings.get(token)
+                if ids is not None:
+                    intersection[ids] += 1
+            union = sizes + len(query_tokens) - intersection
+            return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+        intersection = {}
+        for token in query_tokens:
+            for idx in self._postings.get(token, ()):
+                intersection[idx] = intersection.get(idx, 0) + 1
+        scores = [0.0] * len(self.names)
+        for idx, count in intersection.items():
+            scores[idx] = count / (self._sizes[idx] + len(query_tokens) - count)
+        return scores
+
+    @metrics.timed("similarity_index")
+    def top_k(self, query, k):
+        """返回 [(下标, 相似度), ...]，按相似度降序，相同分数按下标升序"""
+        scores = self.scores(query)
+        n = len(scores)
+        k = min(k, n)
+        if k <= 0:
+            return []
+        if np is None:
+            best = heapq.nsmallest(k, range(n), key=lambda idx: (-scores[idx], idx))
+            return [(idx, scores[idx]) for idx in best]
+
+        # argpartition 只做部分选择；边界上的同分项按下标补齐，保证结果稳定
+        kth = np.partition(scores, n - k)[n - k]
+        above = np.flatnonzero(scores > kth)
+        ties = np.flatnonzero(scores == kth)[:k - len(above)]
+        chosen = np.concatenate([above, ties])
+        order = chosen[np.lexsort((chosen, -scores[chosen]))]
+        return [(int(idx), float(scores[idx])) for idx in order]
@@ -0,0 +1,227 @@
+# ✅ 站点适配器
+#
+# 每个网站是一个 SiteAdapter，只做声明：
+# - 接口（Endpoint）：URL 和参数模板，{keyword}、{page}、{code}、{url} 在请求时填入；
+# - 提取规则（extractors）：每种响应类型对应的解析函数，需要 HTML 树的规则在解析进程池中执行；
+# - 请求策略：限流、并发预算、对冲（http_client 按主机执行），页面中的搜索截止时间；
+# - 页面上显示哪些详情字段、是否有商品页面链接和图片下载。
+# 抓取引擎（scraper.py）、页面选项卡、批量模式、商品库同步和价格跟踪都遍历这里的注册表，
+# 不再按站点名写分支。新增网站：在 parsers.py 写解析函数，在这里定义适配器并加入 ADAPTERS。
+import os
+from functools import partial
+from urllib.parse import urljoin, urlsplit
+
+from endpoints import (
+    MAOMAO_BASE_URL, MAOMAO_SEARCH_URL, MAOMAO_SUGGEST_URL, MAOMAO_PRODUCTS_URL,
+    AFL_API_BASE_URL, AFL_BASE_SEARCH_URL, AFL_BASE_DETAIL_URL
+)
+from parse_pool import parse_html
+from parsers import (
+    parse_mao_mao_results, parse_mao_mao_detail, parse_mao_mao_suggest, parse_mao_mao_product, parse_mao_mao_offer,
+    parse_mao_mao_catalog, parse_asian_food_results, parse_asian_food_detail, parse_asian_food_total_pages,
+    parse_asian_food_offer, parse_asian_food_catalog
+)
+
+# 详情：html（完整商品页，默认）或 json（商品 JSON，响应小得多，但没有配料和营养信息）
+MAOMAO_DETAIL_MODE = os.environ.get("SCRAPER_MAOMAO_DETAIL_MODE", "html")
+# 搜索：html（完整搜索页，默认）或 json（Shopify 搜索建议，最多 10 个结果，没有分页）
+MAOMAO_SEARCH_MODE = os.environ.get("SCRAPER_MAOMAO_SEARCH_MODE", "html")
+
+
+class Endpoint:
+    def __init__(self, url, params=None):
+        self.url = url
+        self.params = params or {}
+
+    def request(self, **values):
+        """填入模板，返回 (url, params)"""
+        params = {
+            key: value.format(**values) if isinstance(value, str) else value for key, value in self.params.items()
+        }
+        return self.url.format(**values), params or None
+
+
+def html_rule(func):
+    """需要 HTML 树的提取规则：大页面在解析进程池中执行"""
+    return partial(parse_html, func)
+
+
+class SiteAdapter:
+    name = None                 # 站点名：指标标签、缓存和数据库中的键
+    label = None                # 页面上显示的名称
+    key_prefix = None           # 页面组件 key 的前缀
+    base_url = None             # 请求主机由此映射回站点
+    policy = {}                 # 覆盖 http_client.DEFAULT_POLICY 的主机策略（rate / burst / concurrency / ...）
+    deadline = 10               # 页面中单次搜索的截止时间（秒）
+
+    endpoints = {}              # 类型 -> Endpoint
+    extractors = {}             # 类型 -> 解析函数(响应体, *参数)
+    search_kind = "search"
+    detail_kinds = ("detail",)  # 详情需要的响应（多个时并发请求，按顺序组成元组交给第一个类型的提取规则）
+    offer_kind = "offer"        # 价格跟踪请求的接口，提取规则固定为 "offer"
+
+    # 分页搜索：max_pages 大于 1 时第一页先显示，其余页面在后台并发抓取，"pages" 规则给出总页数
+    max_pages = 1
+    page_concurrency = 1
+
+    # 商品库同步："catalog" 规则返回 ({编码: 商品}, 总页数或 None)；总页数未知时抓到空页为止
+    catalog_first_page = 0
+
+    # 详情面板：(字段, 标题, 是否显示可复制的文本块)；字典字段显示为 "键: 值" 列表
+    detail_fields = ()
+    product_pages = True        # 商品的 url 字段是否为商品页面链接（否则是商品编码）
+    image_download = False      # 商品卡片是否显示图片下载按钮
+
+    @property
+    def host(self):
+        return urlsplit(self.base_url).hostname
+
+    def request(self, kind, **values):
+        return self.endpoints[kind].request(**values)
+
+    def extract(self, kind, content, *args):
+        return self.extractors[kind](content, *args)
+
+    def search_request(self, keyword, page=0):
+        return self.request(self.search_kind, keyword=keyword, page=page)
+
+    def detail_requests(self, url):
+        code = self.product_code(url)
+        return [self.request(kind, url=url, code=code) for kind in self.detail_kinds]
+
+    def offer_request(self, code):
+        return self.request(self.offer_kind, url=self.product_url(code), code=code)
+
+    def catalog_request(self, page):
+        return self.request("catalog", page=page)
+
+    def product_code(self, url):
+        """搜索结果中的 url 字段 -> 商品编码（商品库、价格历史中的键）"""
+        return url
+
+    def product_url(self, code):
+        return code
+
+
+class MaoMaoAdapter(SiteAdapter):
+    name = "maomao"
+    label = "MaoMao"
+    key_prefix = "mao"
+    base_url = MAOMAO_BASE_URL
+    policy = {"rate": 4, "burst": 8, "concurrency": 6}
+
+    endpoints = {
+        "search": Endpoint(MAOMAO_SEARCH_URL, {'q': '{keyword}', 'options[prefix]': 'last'}),
+        # Shopify 搜索建议每次最多返回 10 个商品
+        "suggest": Endpoint(MAOMAO_SUGGEST_URL, {
+            'q': '{keyword}',
+            'resources[type]': 'product',
+            'resources[limit]': 10,
+            'resources[options][unavailable_products]': 'last',
+        }),
+        "page": Endpoint("{url}"),
+        "product": Endpoint(f"{MAOMAO_BASE_URL}/products/{{code}}.js"),
+        "catalog": Endpoint(MAOMAO_PRODUCTS_URL, {'limit': 250, 'page': '{page}'}),
+    }
+    extractors = {
+        "search": html_rule(parse_mao_mao_results),
+        "suggest": parse_mao_mao_suggest,
+        "page": html_rule(parse_mao_mao_detail),
+        "product": parse_mao_mao_product,
+        "offer": parse_mao_mao_offer,
+        "catalog": parse_mao_mao_catalog,
+    }
+    # 搜索默认解析完整搜索页：搜索建议接口的结果数有上限，会丢掉大部分结果
+    search_kind = "suggest" if MAOMAO_SEARCH_MODE == "json" else "search"
+    # 详情默认解析完整商品页：配料和营养信息只在页面中，商品 JSON 中没有
+    detail_kinds = ("product",) if MAOMAO_DETAIL_MODE == "json" else ("page",)
+    offer_kind = "product"
+    catalog_first_page = 1
+
+    detail_fields = (
+        ("description", "📝 **商品描述:**", True),
+        ("storage_info", "🏪 **存储说明:**", True),
+        ("preparation_info", "👨‍🍳 **准备说明:**", True),
+        ("nutrition", "📊 **营养信息:**", True),
+        ("ingredients", "🧬 **配料表:**", True),
+    )
+    image_download = True
+
+    def product_code(self, url):
+        """商品链接中的 handle（/products/<handle>）"""
+        if "/products/" not in url:
+            return url
+        return url.split("/products/", 1)[1].split("?", 1)[0].split("#", 1)[0].strip("/")
+
+    def product_url(self, code):
+        return f"{MAOMAO_BASE_URL}/products/{code}"
+
+
+def _parse_asian_food_detail(json_text):
+    # OCC 返回的图片地址是相对于接口主机的路径
+    details = parse_asian_food_detail(json_text)
+    if details.get("image_url"):
+        details["image_url"] = urljoin(AFL_API_BASE_URL, details["image_url"])
+    return details
+
+
+class AsianFoodAdapter(SiteAdapter):
+    name = "asianfood"
+    label = "AsianFoodLovers"
+    key_prefix = "afl"
+    base_url = AFL_API_BASE_URL
+    policy = {"rate": 8, "burst": 16, "concurrency": 8, "hedge_after": 2.0}
+
+    endpoints = {
+        "search": Endpoint(AFL_BASE_SEARCH_URL, {
+            'query': '{keyword}', 'currentPage': '{page}', 'pageSize': 21, 'lang': 'de_DE', 'curr': 'EUR'
+        }),
+        "detail": Endpoint(f"{AFL_BASE_DETAIL_URL}{{code}}", {'lang': 'de_DE', 'curr': 'EUR'}),
+        "catalog": Endpoint(AFL_BASE_SEARCH_URL, {
+            'query': ':relevance', 'currentPage': '{page}', 'pageSize': 100, 'lang': 'de_DE', 'curr': 'EUR'
+        }),
+    }
+    extractors = {
+        "search": parse_asian_food_results,
+        "pages": parse_asian_food_total_pages,
+        "detail": _parse_asian_food_detail,
+        "offer": parse_asian_food_offer,
+        "catalog": parse_asian_food_catalog,
+    }
+    offer_kind = "detail"
+    max_pages = 10
+    page_concurrency = 4
+
+    detail_fields = (
+        ("description", "📝 **商品描述:**", True),
+        ("origin", "🌍 **产地:**", False),
+        ("allergyInformation", "⚠️ **过敏信息:**", False),
+        ("ingredients", "🧬 **配料表:**", True),
+    )
+    product_pages = False
+
+
+# 注册顺序即页面选项卡顺序；比价以第一个网站为基准
+ADAPTERS = {adapter.name: adapter for adapter in (MaoMaoAdapter(), AsianFoodAdapter())}
+SITES = tuple(ADAPTERS)
+
+
+def get(site):
+    return ADAPTERS[site]
+
+
+def adapters():
+    return list(ADAPTERS.values())
+
+
+def site_for_host(host):
+    """把请求的主机名映射为站点名（用于指标标签），未知主机原样返回"""
+    for adapter in ADAPTERS.values():
+        if host == adapter.host:
+            return adapter.name
+    return host
+
+
+def host_policies():
+    """{主机: 请求策略}，http_client 在默认策略上覆盖"""
+    return {adapter.host: adapter.policy for adapter in ADAPTERS.values()}
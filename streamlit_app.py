@@ -1,601 +1,650 @@
 import streamlit as st
-import requests
 import asyncio
-import aiohttp
-from aiohttp import ClientTimeout
-from bs4 import BeautifulSoup
-from similar import jaccard_similarity
-import json
-import pyperclip
-import nest_asyncio
+import autocomplete
+import catalog
+import export
+import metrics
+import images
+import jobs
+import matching
+import price_history
+import sites
+from prefetch import DetailPrefetcher, PRIORITY_NEXT_PAGE
+from scraper import async_get_detail, async_search, async_search_more
+import os
 import time
+import uuid
+
+try:
+    from streamlit_searchbox import st_searchbox
+except ImportError:
+    st_searchbox = None
 
 # Initialize page config
 st.set_page_config(page_title="🌟 多网站爬虫系统 (异步+缓存)", layout="wide")
 
-# Apply nest_asyncio to make async work with Streamlit
-nest_asyncio.apply()
+# 搜索结果显示后预取当前页详情，是否同时预取下一页
+PREFETCH_NEXT_PAGE = True
 
-# Constants
-AFL_BASE_SEARCH_URL = 'https://api.c2k2y3nvy0-heuschena1-p1-public.model-t.cc.commerce.ondemand.com/occ/v2/B2C-AFL-DE/products/search'
-AFL_BASE_DETAIL_URL = 'https://api.c2k2y3nvy0-heuschena1-p1-public.model-t.cc.commerce.ondemand.com/occ/v2/B2C-AFL-COM/products/'
+# 设置了 SCRAPER_METRICS_PORT 时提供 Prometheus /metrics（每个进程只启动一次）
+metrics.serve()
 
+# 在后台定时检查关注商品的价格（每个进程只启动一次，SCRAPER_TRACK_INTERVAL=0 时关闭）
+price_history.start_scheduler()
 
-# Async fetch function with timeout
-async def fetch(session, url, params=None, headers=None):
-    if headers is None:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-    try:
-        timeout = ClientTimeout(total=10)
-        async with session.get(url, params=params, headers=headers, timeout=timeout) as response:
-            response.raise_for_status()
-            return await response.text()
-    except Exception as e:
-        print(f"请求错误: {e}")
-        return ""
-
-
-# Cache the search results
-@st.cache_data(show_spinner="🔍 正在搜索...", ttl=3600)
-def cache_search_results(html_content, site, productname):
-    if site == "maomao":
-        return parse_mao_mao_results(html_content, productname)
-    elif site == "asianfood":
-        return parse_asian_food_results(html_content, productname)
-    return []
-
-
-# Cache the detail results
-@st.cache_data(show_spinner="🔍 正在获取详情...", ttl=3600)
-def cache_detail_results(detail_content, site):
-    if site == "maomao":
-        return parse_mao_mao_detail(detail_content)
-    elif site == "asianfood":
-        return parse_asian_food_detail(detail_content)
-    return {}
-
-
-# Async MaoMao search
-async def async_search_mao_mao(productname):
-    base_url = 'https://mao-mao.de/search'
-    params = {'q': productname, 'options[prefix]': 'last'}
-
-    async with aiohttp.ClientSession() as session:
-        html = await fetch(session, base_url, params=params)
-        return cache_search_results(html, "maomao", productname)
-
-
-# Parse MaoMao search results
-def parse_mao_mao_results(html, productname):
-    soup = BeautifulSoup(html, 'html.parser')
-    products = soup.select('div.grid-product')
-    results = []
-
-    for div in products:
-        link_tag = div.find('a', class_='grid-item__link')
-        name_tag = div.find('div', class_='grid-product__title')
-        price_tag = div.select_one('span.grid-product__price--current span.visually-hidden')
-        img_tag = div.find('img')
-
-        if name_tag and link_tag:
-            name = name_tag.get_text().strip()
-            url = 'https://mao-mao.de' + link_tag.get('href')
-            price = price_tag.get_text().strip() if price_tag else "N/A"
-            image_src = img_tag.get('data-src') or img_tag.get('src')
-            if image_src:
-                image_src = f"https:{image_src}" if image_src.startswith("//") else f"https://mao-mao.de{image_src}"
-
-            results.append({
-                "name": name,
-                "url": url,
-                "price": price,
-                "image_url": image_src,
-                "similarity": jaccard_similarity(productname, name)
-            })
-
-    return sorted(results, key=lambda x: x['similarity'], reverse=True)
-
-
-# Async MaoMao detail
-async def async_get_mao_mao_detail(url):
-    async with aiohttp.ClientSession() as session:
-        html = await fetch(session, url)
-        return cache_detail_results(html, "maomao")
-
-
-# Parse MaoMao detail
-def parse_mao_mao_detail(html):
-    try:
-        soup = BeautifulSoup(html, 'html.parser')
-
-        # 基本信息
-        product_name_tag = soup.find('h1', class_='product-single__title')
-        price_tag = soup.select_one('span.product__price span.visually-hidden')
-
-        # 初始化返回数据
-        description = ""
-        storage_info = ""
-        preparation_info = ""
-
-        # 首先尝试直接获取商品描述
-        description_section = soup.find('div', {'id': 'dropdownContent1D'})
-        if description_section:
-            # 使用 at-rte 类来定位实际的描述文本
-            rte_content = description_section.find('div', class_='at-rte')
-            if rte_content:
-                # 获取所有段落，但排除存储说明和净重信息
-                paragraphs = []
-                for p in rte_content.find_all('p'):
-                    text = p.get_text(strip=True)
-                    if text and not any(keyword in text.lower() for keyword in [
-                        'aufbewahrungs', 'verwendungshinweise', 'nettogewicht',
-                        'kühl und trocken', 'gramm', 'g das produktdesign'
-                    ]):
-                        paragraphs.append(text)
-                description = '\n'.join(paragraphs)
-
-        # 获取存储信息
-        storage_section = soup.find(string=lambda text: text and 'Aufbewahrungs- und Verwendungshinweise' in text)
-        if storage_section:
-            # 获取紧跟在存储说明标题后的段落
-            storage_p = storage_section.find_next('p')
-            if storage_p:
-                storage_info = storage_p.get_text(strip=True)
-
-        # 如果上面的方法没找到存储信息，尝试其他方法
-        if not storage_info:
-            storage_keywords = ['Kühl und trocken lagern', 'Nach dem Öffnen']
-            for keyword in storage_keywords:
-                storage_text = soup.find(string=lambda text: text and keyword in text)
-                if storage_text:
-                    storage_info = storage_text.strip()
-                    break
-
-        # 获取配料信息
-        ingredients = ""
-        ingredients_sections = soup.find_all('span', class_='metafield-multi_line_text_field')
-        if ingredients_sections:
-            ingredients = ingredients_sections[0].get_text(strip=True)
-
-        # 获取营养信息
-        nutrition_info = {
-            "Brennwert": "",
-            "Fett": "",
-            "- davon gesättigte Fettsäuren": "",
-            "Kohlenhydrate": "",
-            "- davon Zucker": "",
-            "Eiweiß": "",
-            "Salz": ""
-        }
-
-        if len(ingredients_sections) > 1:
-            nutrition_text = ingredients_sections[1].get_text(separator='\n').strip()
-            for line in nutrition_text.split('\n'):
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    key = key.strip()
-                    if key in nutrition_info:
-                        nutrition_info[key] = value.strip().replace(',', '.')
-
-        # 获取主图片
-        image_src = None
-        image_element = soup.select_one('div.product__main-photos img')
-        if image_element:
-            image_src = image_element.get('data-src') or image_element.get('src')
-            if image_src:
-                if image_src.startswith("//"):
-                    image_src = f"https:{image_src}"
-                elif image_src.startswith("/"):
-                    image_src = f"https://mao-mao.de{image_src}"
-
-        return {
-            "name": product_name_tag.get_text().strip() if product_name_tag else "未知产品",
-            "price": price_tag.get_text().strip() if price_tag else "N/A",
-            "description": description,
-            "storage_info": storage_info,
-            "preparation_info": preparation_info,
-            "ingredients": ingredients,
-            "nutrition": nutrition_info,
-            "image_url": image_src
-        }
 
-    except Exception as e:
-        print(f"提取商品详情时发生错误: {e}")
-        return {}
-
-
-# Async AsianFoodLovers search
-async def async_search_asian_food(productname):
-    params = {
-        'query': productname,
-        'currentPage': 0,
-        'pageSize': 21,
-        'lang': 'de_DE',
-        'curr': 'EUR'
-    }
+# 进程内共享的详情预取器，所有会话共用
+@st.cache_resource
+def get_prefetcher():
+    return DetailPrefetcher(async_get_detail)
 
-    async with aiohttp.ClientSession() as session:
-        response_text = await fetch(session, AFL_BASE_SEARCH_URL, params=params)
-        return cache_search_results(response_text, "asianfood", productname)
 
+def prefetch_page_details(site, results, start_idx, end_idx):
+    prefetcher = get_prefetcher()
+    prefetcher.prefetch(site, [product["url"] for product in results[start_idx:end_idx]])
+    if PREFETCH_NEXT_PAGE:
+        next_end = end_idx + (end_idx - start_idx)
+        prefetcher.prefetch(site, [product["url"] for product in results[end_idx:next_end]], PRIORITY_NEXT_PAGE)
 
-# Parse AsianFoodLovers search results
-def parse_asian_food_results(json_text, productname):
-    try:
-        data = json.loads(json_text)
-        results = []
-
-        for product in data.get("products", []):
-            code = product.get('code')
-            name = product.get('commercialName', '')
-            price = f"{product.get('price', {}).get('value', 'N/A')} €"
-
-            results.append({
-                "name": name,
-                "url": code,
-                "price": price,
-                "similarity": jaccard_similarity(productname, name)
-            })
-
-        return sorted(results, key=lambda x: x['similarity'], reverse=True)
-    except Exception as e:
-        print(f"解析 AsianFoodLovers 结果时发生错误: {e}")
-        return []
 
+# 新增的显示函数
+# def display_detail_section(title, content, key_prefix):
+#     if content:
+#         col1, col2 = st.columns([4, 1])
+#         with col1:
+#             st.markdown(f"{title}")
+#             st.markdown(content)
+#         with col2:
+#             copy_status = st.empty()
+#             if st.button("📋 复制", key=f"copy_{key_prefix}"):
+#                 pyperclip.copy(content)
+#                 copy_status.success("✅ 已复制!")
+#                 time.sleep(2)
+#                 copy_status.empty()
 
-# Async AsianFoodLovers detail
-async def async_get_asian_food_detail(productid):
-    async with aiohttp.ClientSession() as session:
-        response_text = await fetch(
-            session,
-            f"{AFL_BASE_DETAIL_URL}{productid}",
-            params={'lang': 'de_DE', 'curr': 'EUR'}
-        )
-        return cache_detail_results(response_text, "asianfood")
+
+def display_detail_section(title, content, key_prefix):
+    """显示详情部分的新函数，使用 Streamlit 的复制功能"""
+    if content:
+        st.markdown(f"{title}")
+        st.markdown(content)
+        st.code(content, language=None)  # 使用 st.code 来显示可复制的文本块
+
+
+# 搜索输入：安装了 streamlit-searchbox 时每次按键都从本地补全索引取建议（不请求网站），
+# 否则在输入框下方显示当前输入的补全建议，点击后填入输入框
+SEARCH_LABEL = "🔍 输入要搜索的产品关键词:"
+
+
+def use_suggestion():
+    st.session_state.search_input = st.session_state.search_suggestion
+    st.session_state.search_suggestion = None
+
+
+def search_input():
+    if st_searchbox is not None:
+        return st_searchbox(
+            autocomplete.suggest, label=SEARCH_LABEL, key="search_box", default_use_searchterm=True
+        ) or ""
+    productname = st.text_input(SEARCH_LABEL, key="search_input")
+    if productname:
+        suggestions = [name for name in autocomplete.suggest(productname) if name != productname]
+        if suggestions:
+            st.pills("💡 补全建议:", suggestions, key="search_suggestion", on_change=use_suggestion)
+    return productname
+
+
+# 每个注册的网站（sites.py）的搜索都是独立的后台任务，各自有截止时间，先完成的网站先显示
+async def search_with_deadline(site, coro):
+    with metrics.timer("search", site):
+        return await asyncio.wait_for(coro, sites.get(site).deadline)
 
 
-# Parse AsianFoodLovers detail
-def parse_asian_food_detail(json_text):
+# 任务运行在进程内常驻的后台事件循环上，会话只保存任务 id；同一会话同一组的新任务会取消旧任务
+def job_owner():
+    if "job_owner" not in st.session_state:
+        st.session_state.job_owner = uuid.uuid4().hex
+    return st.session_state.job_owner
+
+
+def submit_job(coro, group):
+    return jobs.get_runner().submit(coro, owner=job_owner(), group=group)
+
+
+def run_job(coro, group):
+    """提交任务并等待结果（页面必须立即显示结果时使用）"""
+    return jobs.get_runner().run(coro, owner=job_owner(), group=group)
+
+
+def start_search(productname):
+    # 每个网站一个任务组：新搜索取消本会话上一次仍在进行的搜索（包括后台加载更多结果）
+    st.session_state.search_keyword = productname
+    st.session_state.search_jobs = {
+        site: submit_job(search_with_deadline(site, async_search(site, productname)), ("search", site))
+        for site in sites.SITES
+    }
+    st.session_state.search_status = {site: "loading" for site in sites.SITES}
+    st.session_state.search_errors = {}
+    st.session_state.results = {site: [] for site in sites.SITES}
+
+
+def collect_job(site, job):
+    """把已完成任务的结果写入 session state，返回状态"""
     try:
-        data = json.loads(json_text)
-        image_url = None
-        if 'images' in data and len(data['images']) > 0:
-            image_url = data['images'][0].get('url')
-
-        return {
-            "name": data.get('commercialName', ''),
-            "price": f"{data.get('price', {}).get('value', '')} €",
-            "description": data.get('description', ''),
-            "ingredients": data.get('ingredients', ''),
-            "image_url": image_url,
-            "url": data.get('code', ''),
-            "allergyInformation": '; '.join([a['description'] for a in data.get('allergyInformation', [])]),
-            "origin": '; '.join([c['name'] for c in data.get('countriesOfOrigin', [])])
-        }
+        st.session_state.results[site] = job.result()
+        return "done"
+    except TimeoutError:
+        return "timeout"
     except Exception as e:
-        print(f"解析 AsianFoodLovers 详情时发生错误: {e}")
-        return {}
+        st.session_state.search_errors[site] = str(e)
+        return "error"
+
+
+# 只有该网站还有任务在进行时才会被调用并定时运行；任务完成后刷新整个页面显示结果
+@st.fragment(run_every=0.5)
+def poll_site_search(site):
+    search_jobs = st.session_state.search_jobs
+    runner = jobs.get_runner()
+    adapter = sites.get(site)
+
+    if site in search_jobs:
+        job = runner.get(search_jobs[site])
+        if job is not None and job.status == "running":
+            st.info(f"⏳ 正在搜索 {adapter.label}...（最长等待 {adapter.deadline} 秒）")
+            return
+        # 任务为 None：已被取代或已过期清理
+        job = runner.pop(search_jobs.pop(site))
+        if job is not None and job.status != "cancelled":
+            st.session_state.search_status[site] = collect_job(site, job)
+            # 分页的网站第一页先显示，其余页面在后台并发抓取
+            if adapter.max_pages > 1 and st.session_state.search_status[site] == "done":
+                search_jobs[f"{site}_more"] = submit_job(
+                    async_search_more(site, st.session_state.search_keyword, st.session_state.results[site]),
+                    ("search", site)
+                )
+        st.rerun()
+
+    if f"{site}_more" in search_jobs:
+        more = runner.get(search_jobs[f"{site}_more"])
+        if more is not None and more.status == "running":
+            st.caption("⏳ 正在后台加载更多结果...")
+            return
+        more = runner.pop(search_jobs.pop(f"{site}_more"))
+        if more is not None and more.status != "cancelled":
+            collect_job(site, more)
+        st.rerun()
+
+
+def has_pending_jobs(site):
+    return any(key == site or key == f"{site}_more" for key in st.session_state.search_jobs)
+
+
+def display_search_status(site):
+    status = st.session_state.search_status.get(site)
+    adapter = sites.get(site)
+    if status == "timeout":
+        st.warning(f"⚠️ {adapter.label} 超过 {adapter.deadline} 秒未响应，结果可能不完整")
+    elif status == "error":
+        st.error(f"❌ {adapter.label} 搜索失败: {st.session_state.search_errors.get(site, '')}")
+
+
+# 结果按片段（fragment）渲染：翻页只重新执行所在的选项卡，查看详情只重新执行该商品卡片，
+# 详情中的复制按钮只重新执行详情面板，每次点击的开销不随页面上显示的商品数增长
+PER_PAGE = 5
+
+
+def change_page(site, step):
+    st.session_state.pages[site] += step
+
+
+@st.fragment
+def display_site_results(site):
+    results = st.session_state.results[site]
+    pages = st.session_state.pages
+    prefix = sites.get(site).key_prefix
+    with metrics.timer("render_results", site):
+        total_pages = (len(results) + PER_PAGE - 1) // PER_PAGE
+        pages[site] = min(max(pages.get(site, 1), 1), total_pages)
+        page = pages[site]
+
+        # 分页导航（回调在片段重新执行前修改页码，页码显示不会落后一次点击）
+        st.markdown("### 📄 页面导航")
+        prev, page_info, next = st.columns([1, 3, 1])
+        with prev:
+            st.button(
+                "⬅️ 上一页", key=f"{prefix}_prev", disabled=page <= 1, on_click=change_page, args=(site, -1)
+            )
+        with page_info:
+            st.write(f"第 {page} 页 / 共 {total_pages} 页")
+        with next:
+            st.button(
+                "下一页 ➡️", key=f"{prefix}_next", disabled=page >= total_pages, on_click=change_page, args=(site, 1)
+            )
 
+        start_idx = (page - 1) * PER_PAGE
+        end_idx = start_idx + PER_PAGE
 
-# Display search results
-def display_search_results(results, site_name, get_detail_func):
-    if not results:
-        st.write(f"没有在 {site_name} 找到相关产品")
-        return
+        # 后台预取当前页图片，下一次渲染即可使用本地缩略图
+        images.prefetch_in_background([product.get("image_url") for product in results[start_idx:end_idx]])
+        prefetch_page_details(site, results, start_idx, end_idx)
 
-    for idx, product in enumerate(results[:5]):
-        with st.container():
-            cols = st.columns([1, 3, 1])
+        # 显示每个产品
+        for idx, product in enumerate(results[start_idx:end_idx]):
+            display_product_card(site, product, f"{prefix}_{idx}_{product['name']}")
 
-            with cols[0]:
-                if product.get("image_url"):
-                    st.image(product["image_url"], width=150)
 
-            with cols[1]:
-                st.subheader(product["name"])
-                st.markdown(f"💶 **价格**: {product['price']}")
+def toggle_details(site, product):
+    if product["name"] not in st.session_state.details_data:
+        with st.spinner("正在获取详情..."):
+            with metrics.timer("detail_wait", site):
+                details = run_job(get_prefetcher().get(site, product["url"]), "detail")
+        # 获取失败时不记录，下次点击重新获取
+        if details:
+            st.session_state.details_data[product["name"]] = details
+            images.prefetch_in_background([details.get("image_url")])
+        else:
+            st.error("❌ 获取详情失败，请稍后重试")
+    st.session_state.details_visibility[product["name"]] = \
+        not st.session_state.details_visibility.get(product["name"], False)
 
-            with cols[2]:
-                detail_key = f"{site_name}_{idx}_detail"
-                if st.button("🔍 查看详情", key=detail_key):
-                    with st.spinner("正在获取详情..."):
-                        details = asyncio.run(get_detail_func(product["url"]))
-                        if details:
-                            display_product_details(details, site_name)
 
+@st.fragment
+def display_product_card(site, product, product_key):
+    image_download = sites.get(site).image_download
+    with metrics.timer("render_card", site), st.container():
+        # 有图片下载按钮的网站多一列
+        cols = st.columns([1, 3, 1, 1] if image_download else [1, 3, 1])
 
-# Display product details
-def display_product_details(details, site_name):
-    with st.expander("📋 产品详情", expanded=True):
-        if details.get('image_url'):
-            st.image(details['image_url'], width=300)
+        # 产品图片
+        with cols[0]:
+            if product.get("image_url"):
+                st.image(images.image_source(product["image_url"], 150), width=150)
 
-        st.markdown(f"💶 **价格**: {details['price']}")
+        # 产品基本信息
+        with cols[1]:
+            st.subheader(product["name"])
+            st.markdown(f"💶 **价格**: {product['price']}")
 
-        if details.get('description'):
-            st.markdown("📝 **商品描述:**")
-            st.markdown(details['description'])
-            if st.button("📋 复制描述"):
-                pyperclip.copy(details['description'])
-                st.success("✅ 已复制到剪贴板!")
-
-        if site_name == "MaoMao":
-            if details.get('storage_info'):
-                st.markdown("🏪 **存储说明:**")
-                st.markdown(details['storage_info'])
+        if image_download:
+            with cols[2]:
+                if product.get("image_url"):
+                    st.download_button(
+                        "📥 下载图片",
+                        # 只有点击下载时才读取图片字节
+                        data=lambda url=product["image_url"]: images.get_store().load_bytes(url),
+                        file_name=f"{product['name']}.jpg",
+                        key=f"download_{product_key}"
+                    )
+
+        # 查看详情按钮
+        with cols[-1]:
+            if st.button("🔍 查看详情", key=f"detail_{product_key}"):
+                toggle_details(site, product)
+
+        # 显示详情信息
+        if st.session_state.details_visibility.get(product["name"], False):
+            display_detail_panel(site, product, product_key)
+
+
+@st.fragment
+def display_detail_panel(site, product, product_key):
+    details = st.session_state.details_data.get(product["name"])
+    if not details:
+        return
+    with st.expander("📋 详细信息", expanded=True):
+        if details.get('image_url'):
+            st.image(images.image_source(details['image_url'], 300), width=300)
+        display_details(sites.get(site), details, product, product_key)
+        display_price_history(site, product, product_key)
+
+
+PRICE_HISTORY_RANGES = {"7 天": 7, "30 天": 30, "90 天": 90, "全部": None}
+
+
+def display_price_history(site, product, product_key):
+    store = price_history.get_store()
+    code = catalog.product_code(site, product["url"])
+    if not store.is_watched(site, code):
+        if not st.button("⭐ 跟踪价格", key=f"watch_{product_key}"):
+            return
+        price_history.watch(site, product["url"], product["name"])
+        with st.spinner("正在记录当前价格..."):
+            try:
+                run_job(price_history.check(site, code), "price_check")
+            except Exception as e:
+                st.warning(f"⚠️ 暂时无法获取价格，稍后自动重试: {e}")
+
+    st.markdown("📈 **价格历史:**")
+    selected = st.segmented_control(
+        "时间范围", list(PRICE_HISTORY_RANGES), default="30 天", key=f"history_range_{product_key}",
+        label_visibility="collapsed"
+    )
+    days = PRICE_HISTORY_RANGES.get(selected)
+    points = store.history(site, code, start=time.time() - days * 86400 if days else None)
+    last_checked = store.last_checked(site, code)
+    rows = price_history.chart_rows(points, last_checked)
+    if rows:
+        st.line_chart(rows, x="时间", y="价格 €", height=200)
+    else:
+        st.caption("这段时间内还没有价格记录")
+    if points and points[-1][2] is not None:
+        st.caption(("✅ 有货" if points[-1][2] else "❌ 缺货") + (
+            f"，最近检查: {time.strftime('%Y-%m-%d %H:%M', time.localtime(last_checked))}" if last_checked else ""
+        ))
+    st.button("取消跟踪", key=f"unwatch_{product_key}", on_click=store.unwatch, args=(site, code))
+
+
+# 详情字段由站点适配器声明（sites.py 中的 detail_fields）
+def display_details(adapter, details, product, product_key):
+    for field, title, copyable in adapter.detail_fields:
+        value = details.get(field)
+        if not value:
+            continue
+        if isinstance(value, dict):
+            st.markdown(title)
+            st.code("\n".join(f"{key}: {item}" for key, item in value.items() if item), language=None)
+        elif copyable:
+            display_detail_section(title, value, f"{field}_{product_key}")
+        else:
+            st.markdown(title)
+            st.markdown(value)
 
-            if details.get('preparation_info'):
-                st.markdown("👨‍🍳 **准备说明:**")
-                st.markdown(details['preparation_info'])
+    if adapter.product_pages:
+        st.markdown(
+            f"""🔗 **产品链接:** <a href="{product['url']}" target="_blank">{product['url']}</a>""",
+            unsafe_allow_html=True
+        )
+    else:
+        st.markdown(f"🔗 **产品编码:** {product['url']}")
 
-            if details.get('nutrition'):
-                st.markdown("📊 **营养信息:**")
-                for key, value in details['nutrition'].items():
-                    if value:
-                        st.markdown(f"- **{key}**: {value}")
 
-        elif site_name == "AsianFoodLovers":
-            if details.get('origin'):
-                st.markdown("🌍 **产地:**")
-                st.markdown(details['origin'])
+# 比价：所有网站的搜索结果都加入进程内共享的匹配器（同时包含本地商品库），按 MinHash/LSH 找同一商品；
+# 以第一个注册的网站为基准，与另一个网站比较
+COMPARE_SCOPES = {"current": "当前搜索结果", "catalog": "全部已知商品（商品库 + 搜索过的商品）"}
+MAX_COMPARE_ROWS = 500
 
-            if details.get('allergyInformation'):
-                st.markdown("⚠️ **过敏信息:**")
-                st.markdown(details['allergyInformation'])
 
-        if details.get('ingredients'):
-            st.markdown("🧬 **配料表:**")
-            st.markdown(details['ingredients'])
+def price_row(base, other, product, match, score):
+    price, other_price = matching.parse_price(product["price"]), matching.parse_price(match["price"])
+    return {
+        f"{base.label} 商品": product["name"],
+        f"{base.label} 价格": product["price"],
+        f"{other.label} 商品": match["name"],
+        f"{other.label} 价格": match["price"],
+        "差价 €": round(price - other_price, 2) if price is not None and other_price is not None else None,
+        "相似度": round(score, 2),
+    }
 
 
-# 新增的显示函数
-# def display_detail_section(title, content, key_prefix):
-#     if content:
-#         col1, col2 = st.columns([4, 1])
-#         with col1:
-#             st.markdown(f"{title}")
-#             st.markdown(content)
-#         with col2:
-#             copy_status = st.empty()
-#             if st.button("📋 复制", key=f"copy_{key_prefix}"):
-#                 pyperclip.copy(content)
-#                 copy_status.success("✅ 已复制!")
-#                 time.sleep(2)
-#                 copy_status.empty()
+# revision 变化（有新商品加入）时重新匹配
+@st.cache_data(show_spinner="正在匹配两家网站的商品...", max_entries=4)
+def catalog_pairs(revision, site, other_site):
+    return matching.get_matcher().pairs(site, other_site)
+
+
+def display_price_comparison():
+    matcher = matching.get_matcher()
+    for site, results in st.session_state.results.items():
+        matcher.add_many(site, results)
+
+    base, *others = sites.adapters()
+    if len(others) > 1:
+        other = st.selectbox("对比网站", others, format_func=lambda adapter: adapter.label, key="compare_site")
+    else:
+        other = others[0]
+    scope = st.radio(
+        "比较范围", list(COMPARE_SCOPES), format_func=COMPARE_SCOPES.get, horizontal=True, key="compare_scope"
+    )
+    if scope == "current":
+        base_results = st.session_state.results.get(base.name)
+        if not base_results:
+            st.info("搜索后在这里比较同一商品在两家网站的价格")
+            return
+        rows = []
+        for product in base_results:
+            best = matcher.match(base.name, product, other.name)
+            if best:
+                rows.append(price_row(base, other, product, *best[0]))
+    else:
+        pairs = catalog_pairs(matcher.revision, base.name, other.name)
+        rows = [price_row(base, other, *pair) for pair in pairs[:MAX_COMPARE_ROWS]]
+
+    if not rows:
+        st.write("没有找到两家网站都有的商品")
+        return
+    cheaper = sum(1 for row in rows if row["差价 €"] is not None and row["差价 €"] < 0)
+    st.caption(
+        f"匹配到 {len(rows)} 个商品，其中 {cheaper} 个在 {base.label} 更便宜（差价 = {base.label} − {other.label}）"
+    )
+    st.dataframe(rows, hide_index=True)
+
+
+# 批量导出：当前搜索结果或关键词列表中的所有商品连同详情，在后台任务中边获取详情边写入文件（见 export.py）；
+# 已预取的详情直接使用。CSV / JSONL 在导出过程中就可以下载已写出的部分，XLSX 写完后才能下载
+EXPORT_SOURCES = {"current": "当前搜索结果", "keywords": "关键词列表"}
+EXPORT_MIME = {
+    "csv": "text/csv",
+    "jsonl": "application/jsonl",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+EXPORT_CANCEL_WAIT = 5      # 开始新的导出时等待上一个导出任务停止写文件的时间（秒）
+
+
+def start_export(source, keywords, output_format):
+    # 上一个导出任务可能还在写文件：先取消并等它真正停止，再删除它的文件
+    previous = st.session_state.get("export")
+    if previous:
+        stopped = jobs.get_runner().cancel_group(job_owner(), "export", wait=EXPORT_CANCEL_WAIT)
+        if stopped and os.path.exists(previous["path"]):
+            os.remove(previous["path"])
+    os.makedirs(export.EXPORT_DIR, exist_ok=True)
+    # 每个任务使用自己的文件，不会与仍在收尾的旧任务写同一个路径
+    path = os.path.join(export.EXPORT_DIR, f"{job_owner()}-{uuid.uuid4().hex}.{output_format}")
+
+    if source == "current":
+        results = {site: list(products) for site, products in st.session_state.results.items()}
+        items = export.results_items(st.session_state.get("search_keyword", ""), results)
+        total = sum(len(products) for products in results.values())
+    else:
+        items = export.keyword_items(keywords)
+        total = None
+
+    prefetcher = get_prefetcher()
+
+    async def fetch_detail(site, url):
+        return prefetcher.cached(site, url) or await async_get_detail(site, url)
+
+    progress = {"rows": 0, "errors": 0}
+    writer = export.make_writer(path, output_format)
+    st.session_state.export = {
+        "job": submit_job(export.export(items, writer, fetch_detail, progress=progress), "export"),
+        "path": path,
+        "format": output_format,
+        "progress": progress,
+        "total": total,
+        "status": "running",
+    }
 
 
-def display_detail_section(title, content, key_prefix):
-    """显示详情部分的新函数，使用 Streamlit 的复制功能"""
-    if content:
-        st.markdown(f"{title}")
-        st.markdown(content)
-        st.code(content, language=None)  # 使用 st.code 来显示可复制的文本块
+def read_export(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def export_download_button(state, label, key):
+    output_format = state["format"]
+    st.download_button(
+        label,
+        data=lambda path=state["path"]: read_export(path),
+        file_name=f"商品资料.{output_format}",
+        mime=EXPORT_MIME[output_format],
+        key=key,
+    )
+
+
+# 只有导出任务进行中才会被调用并定时运行，完成后刷新整个页面显示下载按钮
+@st.fragment(run_every=1)
+def poll_export():
+    state = st.session_state.export
+    runner = jobs.get_runner()
+    job = runner.get(state["job"])
+    if job is not None and job.status == "running":
+        rows, total = state["progress"]["rows"], state["total"]
+        if total:
+            st.progress(min(rows / total, 1.0), text=f"⏳ 正在导出... {rows} / {total}")
+        else:
+            st.info(f"⏳ 正在导出... 已写出 {rows} 个商品")
+        if state["format"] != "xlsx" and rows:
+            export_download_button(state, "📥 下载已导出部分", "export_partial_download")
+        return
+    job = runner.pop(state["job"])
+    if job is None or job.status == "cancelled":
+        state["status"] = "cancelled"
+    elif job.status == "error":
+        state["status"] = "error"
+        state["error"] = str(job.future.exception())
+    else:
+        state["status"] = "done"
+    st.rerun()
+
+
+def display_export():
+    with st.expander("📦 批量导出"):
+        source = st.radio(
+            "导出内容", list(EXPORT_SOURCES), format_func=EXPORT_SOURCES.get, horizontal=True, key="export_source"
+        )
+        keywords = []
+        if source == "keywords":
+            text = st.text_area("关键词（每行一个）", key="export_keywords")
+            keywords = list(dict.fromkeys(line.strip() for line in text.splitlines() if line.strip()))
+        output_format = st.selectbox("格式", export.FORMATS, key="export_format")
+
+        ready = any(st.session_state.results.values()) if source == "current" else bool(keywords)
+        if st.button("📦 开始导出", key="export_button", disabled=not ready):
+            start_export(source, keywords, output_format)
+
+        state = st.session_state.get("export")
+        if state is None:
+            return
+        if state["status"] == "running":
+            poll_export()
+        elif state["status"] == "done":
+            errors = state["progress"]["errors"]
+            st.success(f"✅ 已导出 {state['progress']['rows']} 个商品" + (f"（{errors} 个详情获取失败）" if errors else ""))
+            if os.path.exists(state["path"]):
+                export_download_button(state, "📥 下载", "export_download")
+        elif state["status"] == "error":
+            st.error(f"❌ 导出失败: {state.get('error', '')}")
+
+
+# 侧边栏的性能诊断面板：各站点各阶段的耗时分布和事件计数
+def display_diagnostics():
+    with st.expander("📊 性能诊断"):
+        if not metrics.METRICS_ENABLED:
+            st.caption("指标统计已关闭（SCRAPER_METRICS=0）")
+            return
+
+        registry = metrics.get_registry()
+        stages = registry.stages()
+        if stages:
+            st.dataframe([
+                {
+                    "阶段": stage, "站点": site, "次数": count,
+                    "平均 ms": round(mean * 1000, 1), "p50 ms": round(p50 * 1000, 1),
+                    "p95 ms": round(p95 * 1000, 1), "p99 ms": round(p99 * 1000, 1),
+                }
+                for stage, site, count, mean, p50, p95, p99 in stages
+            ], hide_index=True)
+        else:
+            st.caption("还没有数据")
+
+        job_counts = jobs.get_runner().stats()
+        if job_counts:
+            st.caption("后台任务: " + "，".join(f"{status} {count}" for status, count in sorted(job_counts.items())))
+
+        events = registry.events()
+        if events:
+            st.dataframe([
+                {"事件": event, "站点": site, "类型": detail, "次数": count}
+                for event, site, detail, count in events
+            ], hide_index=True)
+
+        st.download_button(
+            "📥 导出 Prometheus 指标",
+            data=metrics.render_prometheus,
+            file_name="metrics.prom",
+            mime="text/plain",
+            key="metrics_export_button",
+        )
+        if st.button("🧹 清空指标", key="metrics_reset_button"):
+            registry.reset()
 
 
-async def main():
+def main():
     st.title("🌟 多网站爬虫系统 🌟 (异步 + 缓存)")
     
     # 初始化 session state
-    if 'mao_mao_results' not in st.session_state:
-        st.session_state.mao_mao_results = []
-    if 'asian_food_results' not in st.session_state:
-        st.session_state.asian_food_results = []
+    if 'results' not in st.session_state:
+        st.session_state.results = {site: [] for site in sites.SITES}
     if 'details_visibility' not in st.session_state:
         st.session_state.details_visibility = {}
     if 'details_data' not in st.session_state:
         st.session_state.details_data = {}
-    if 'mao_page' not in st.session_state:
-        st.session_state.mao_page = 1
-    if 'asian_page' not in st.session_state:
-        st.session_state.asian_page = 1
+    if 'pages' not in st.session_state:
+        st.session_state.pages = {site: 1 for site in sites.SITES}
+    if 'search_jobs' not in st.session_state:
+        st.session_state.search_jobs = {}
+    if 'search_status' not in st.session_state:
+        st.session_state.search_status = {}
+    if 'search_errors' not in st.session_state:
+        st.session_state.search_errors = {}
+
+    # 本地商品库状态与同步
+    with st.sidebar:
+        st.markdown("### 🗂️ 本地商品库")
+        for site, (count, last_sync) in catalog.get_store().stats().items():
+            synced = time.strftime("%Y-%m-%d %H:%M", time.localtime(last_sync)) if last_sync else "从未同步"
+            st.write(f"{site}: {count} 个商品（{synced}）")
+        if catalog.is_syncing():
+            st.info("⏳ 正在后台同步...")
+        elif st.button("🔄 同步商品库", key="catalog_sync_button"):
+            catalog.sync_in_background()
+            st.info("⏳ 已开始后台同步")
+        display_diagnostics()
 
     # 搜索输入和按钮
-    productname = st.text_input("🔍 输入要搜索的产品关键词:", key="search_input")
+    productname = search_input()
     if st.button("🔎 开始搜索", key="start_search_button") and productname:
-        with st.spinner("正在异步搜索两个网站..."):
-            st.session_state.mao_mao_results, st.session_state.asian_food_results = await asyncio.gather(
-                async_search_mao_mao(productname),
-                async_search_asian_food(productname)
-            )
-            st.session_state.details_visibility = {}
-            st.session_state.details_data = {}
-            st.session_state.mao_page = 1
-            st.session_state.asian_page = 1
-
-    # 使用选项卡显示结果
-    tab1, tab2 = st.tabs(["🛒 MaoMao", "🛒 AsianFoodLovers"])
-
-    # MaoMao 结果显示
-    with tab1:
-        if st.session_state.mao_mao_results:
-            per_page = 5
-            total_pages = (len(st.session_state.mao_mao_results) + per_page - 1) // per_page
-
-            # 分页导航
-            st.markdown("### 📄 页面导航")
-            prev, page_info, next = st.columns([1, 3, 1])
-            with prev:
-                if st.button("⬅️ 上一页", key="mao_prev", disabled=st.session_state.mao_page <= 1):
-                    st.session_state.mao_page -= 1
-            with page_info:
-                st.write(f"第 {st.session_state.mao_page} 页 / 共 {total_pages} 页")
-            with next:
-                if st.button("下一页 ➡️", key="mao_next", disabled=st.session_state.mao_page >= total_pages):
-                    st.session_state.mao_page += 1
-
-            start_idx = (st.session_state.mao_page - 1) * per_page
-            end_idx = start_idx + per_page
-
-            # 显示每个产品
-            for idx, product in enumerate(st.session_state.mao_mao_results[start_idx:end_idx]):
-                product_key = f"mao_{idx}_{product['name']}"
-                
-                with st.container():
-                    cols = st.columns([1, 3, 1, 1])
-                    
-                    with cols[0]:
-                        if product.get("image_url"):
-                            st.image(product["image_url"], width=150)
-                    
-                    with cols[1]:
-                        st.subheader(product["name"])
-                        st.markdown(f"💶 **价格**: {product['price']}")
-                    
-                    with cols[2]:
-                        if product.get("image_url"):
-                            st.download_button(
-                                "📥 下载图片",
-                                data=requests.get(product["image_url"]).content,
-                                file_name=f"{product['name']}.jpg",
-                                key=f"download_{product_key}"
-                            )
-                    
-                    with cols[3]:
-                        if st.button("🔍 查看详情", key=f"detail_{product_key}"):
-                            if product["name"] not in st.session_state.details_data:
-                                with st.spinner("正在获取详情..."):
-                                    st.session_state.details_data[product["name"]] = await async_get_mao_mao_detail(product["url"])
-                            st.session_state.details_visibility[product["name"]] = \
-                                not st.session_state.details_visibility.get(product["name"], False)
-
-                    # 显示详情信息
-                    if st.session_state.details_visibility.get(product["name"], False):
-                        details = st.session_state.details_data[product["name"]]
-                        if details:
-                            with st.expander("📋 详细信息", expanded=True):
-                                if details.get('image_url'):
-                                    st.image(details['image_url'], width=300)
-
-                                if details.get('description'):
-                                    display_detail_section(
-                                        "📝 **商品描述:**",
-                                        details['description'],
-                                        f"desc_{product_key}"
-                                    )
-
-                                if details.get('storage_info'):
-                                    display_detail_section(
-                                        "🏪 **存储说明:**",
-                                        details['storage_info'],
-                                        f"storage_{product_key}"
-                                    )
-
-                                if details.get('preparation_info'):
-                                    display_detail_section(
-                                        "👨‍🍳 **准备说明:**",
-                                        details['preparation_info'],
-                                        f"prep_{product_key}"
-                                    )
-
-                                if details.get('nutrition'):
-                                    st.markdown("📊 **营养信息:**")
-                                    nutrition_text = "\n".join(
-                                        [f"{key}: {value}" for key, value in details['nutrition'].items() if value]
-                                    )
-                                    st.code(nutrition_text, language=None)
-                                
-                                if details.get('ingredients'):
-                                    display_detail_section(
-                                        "🧬 **配料表:**",
-                                        details['ingredients'],
-                                        f"ingredients_{product_key}"
-                                    )
-
-                                st.markdown(
-                                    f"""🔗 **产品链接:** <a href="{product['url']}" target="_blank">{product['url']}</a>""",
-                                    unsafe_allow_html=True
-                                )
-        else:
-            st.info("暂无 MaoMao 搜索结果")
-
-    # AsianFoodLovers 结果显示
-    with tab2:
-        if st.session_state.asian_food_results:
-            per_page = 5
-            total_pages = (len(st.session_state.asian_food_results) + per_page - 1) // per_page
-
-            # 分页导航
-            st.markdown("### 📄 页面导航")
-            prev, page_info, next = st.columns([1, 3, 1])
-            with prev:
-                if st.button("⬅️ 上一页", key="afl_prev", disabled=st.session_state.asian_page <= 1):
-                    st.session_state.asian_page -= 1
-            with page_info:
-                st.write(f"第 {st.session_state.asian_page} 页 / 共 {total_pages} 页")
-            with next:
-                if st.button("下一页 ➡️", key="afl_next", disabled=st.session_state.asian_page >= total_pages):
-                    st.session_state.asian_page += 1
-
-            start_idx = (st.session_state.asian_page - 1) * per_page
-            end_idx = start_idx + per_page
-
-            # 显示每个产品
-            for idx, product in enumerate(st.session_state.asian_food_results[start_idx:end_idx]):
-                product_key = f"afl_{idx}_{product['name']}"
-
-                with st.container():
-                    cols = st.columns([1, 3, 1])
-
-                    # 产品图片
-                    with cols[0]:
-                        if product.get("image_url"):
-                            st.image(product["image_url"], width=150)
-
-                    # 产品基本信息
-                    with cols[1]:
-                        st.subheader(product["name"])
-                        st.markdown(f"💶 **价格**: {product['price']}")
-
-                    # 查看详情按钮
-                    with cols[2]:
-                        if st.button("🔍 查看详情", key=f"detail_{product_key}"):
-                            if product["name"] not in st.session_state.details_data:
-                                with st.spinner("正在获取详情..."):
-                                    st.session_state.details_data[product["name"]] = await async_get_asian_food_detail(
-                                        product["url"])
-                            st.session_state.details_visibility[product["name"]] = \
-                                not st.session_state.details_visibility.get(product["name"], False)
-
-                    # 显示详情信息
-                    if st.session_state.details_visibility.get(product["name"], False):
-                        details = st.session_state.details_data[product["name"]]
-                        if details:
-                            with st.expander("📋 详细信息", expanded=True):
-                                if details.get('image_url'):
-                                    st.image(details['image_url'], width=300)
-
-                                # 描述信息
-                                if details.get('description'):
-                                    st.markdown("📝 **商品描述:**")
-                                    st.markdown(details['description'])
-                                    if st.button("📋 复制描述", key=f"copy_desc_{product_key}"):
-                                        pyperclip.copy(details['description'])
-                                        st.success("✅ 已复制到剪贴板!")
-
-                                # 产地信息
-                                if details.get('origin'):
-                                    st.markdown("🌍 **产地:**")
-                                    st.markdown(details['origin'])
-
-                                # 过敏信息
-                                if details.get('allergyInformation'):
-                                    st.markdown("⚠️ **过敏信息:**")
-                                    st.markdown(details['allergyInformation'])
-
-                                # 配料信息
-                                if details.get('ingredients'):
-                                    st.markdown("🧬 **配料表:**")
-                                    st.markdown(details['ingredients'])
-                                    if st.button("📋 复制配料", key=f"copy_ingredients_{product_key}"):
-                                        pyperclip.copy(details['ingredients'])
-                                        st.success("✅ 已复制到剪贴板!")
-
-                                # 产品编码
-                                st.markdown(f"🔗 **产品编码:** {details['url']}")
-        else:
-            st.info("暂无 AsianFoodLovers 搜索结果")
+        start_search(productname)
+        st.session_state.details_visibility = {}
+        st.session_state.details_data = {}
+        st.session_state.pages = {site: 1 for site in sites.SITES}
+
+    display_export()
+
+    # 使用选项卡显示结果：每个注册的网站一个选项卡，最后是比价
+    *site_tabs, compare_tab = st.tabs([f"🛒 {adapter.label}" for adapter in sites.adapters()] + ["⚖️ 比价"])
+
+    for tab, adapter in zip(site_tabs, sites.adapters()):
+        site = adapter.name
+        with tab, metrics.timer("render", site):
+            if has_pending_jobs(site):
+                poll_site_search(site)
+            display_search_status(site)
+
+            if st.session_state.results.get(site):
+                display_site_results(site)
+            elif not has_pending_jobs(site):
+                st.info(f"暂无 {adapter.label} 搜索结果")
+
+    # 跨站比价
+    with compare_tab, metrics.timer("render", "compare"):
+        display_price_comparison()
 
 
 # 主程序入口
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    with metrics.timer("render", "page"):
+        main()
\ No newline at end of file